@@ -0,0 +1,148 @@
+import base64
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, List, Sequence, Tuple
+
+# (código, unidades, mínimo, máximo) de un hemograma de 3 partes del Icon-3
+ICON3_ANALYTES = (
+    ("RBC", "10^6/µL", 3.5, 6.5),
+    ("HGB", "g/L", 110, 190),
+    ("MCV", "fL", 75, 105),
+    ("HCT", "%", 33, 60),
+    ("MCH", "pg", 25, 34),
+    ("MCHC", "g/L", 300, 370),
+    ("RDWsd", "fL", 36, 55),
+    ("RDWcv", "%", 11, 18),
+    ("PLT", "10^3/µL", 120, 450),
+    ("MPV", "fL", 7, 12),
+    ("PCT", "%", 0.1, 0.4),
+    ("PDWsd", "fL", 9, 16),
+    ("PDWcv", "%", 40, 60),
+    ("WBC", "10^3/µL", 3, 25),
+    ("LYM", "10^3/µL", 1, 14),
+    ("LYMP", "%", 15, 60),
+    ("MID", "10^3/µL", 0.1, 4),
+    ("MIDP", "%", 2, 16),
+    ("GRA", "10^3/µL", 2, 8),
+    ("GRAP", "%", 25, 70),
+)
+ICON3_HISTOGRAMS = ("RBCHistogram", "PLTHistogram", "WBCHistogram")
+
+# (código, nombre, unidades, mínimo, máximo) de pruebas inmunológicas del Finecare
+FINECARE_TESTS = (
+    ("16", "Testosterone", "ng/mL", 0.2, 9.0),
+    ("3", "CRP", "mg/L", 0.5, 200),
+    ("7", "HbA1c", "%", 4.0, 12.0),
+    ("11", "TSH", "µIU/mL", 0.1, 8.0),
+    ("21", "Ferritin", "ng/mL", 10, 400),
+    ("24", "PCT", "ng/mL", 0.02, 10),
+    ("30", "D-Dimer", "mg/L", 0.1, 5.0),
+    ("35", "Vitamin D", "ng/mL", 8, 90),
+)
+
+NAMES = ("JUAN", "MARIA", "JORGE", "ANA", "LUIS", "CARMEN", "PEDRO", "LUCIA")
+SURNAMES = ("PEREZ", "ROJAS", "GOMEZ", "DIAZ", "TORRES", "RAMIREZ", "SUAREZ", "MORA")
+
+# Tamaños (OBX) de los que se elige cada mensaje: varios perfiles y paneles
+ICON3_SIZES = (10, 20, 20, 20, 30)
+FINECARE_SIZES = (1, 1, 2, 4, 8)
+DEFAULT_MIX = (("icon3", 0.5), ("finecare", 0.5))
+
+_BASE_TS = datetime(2025, 8, 21, 10, 0, 0)  # fijo: el corpus no depende del reloj
+
+
+def _ts(index: int) -> str:
+    return (_BASE_TS + timedelta(seconds=index)).strftime("%Y%m%d%H%M%S")
+
+
+def _value(rng: random.Random, lo: float, hi: float) -> str:
+    return f"{rng.uniform(lo, hi):.2f}"
+
+
+def _histogram(rng: random.Random) -> str:
+    """256 bytes con forma de campana (como los del equipo), en base64."""
+    peak, width = rng.randint(60, 190), rng.uniform(15, 45)
+    data = bytes(
+        min(255, int(255 * 2.718 ** (-(((i - peak) / width) ** 2))) + rng.randint(0, 3))
+        for i in range(256)
+    )
+    return base64.b64encode(data).decode("ascii")
+
+
+def icon3_message(rng: random.Random, index: int = 0, n_obx: int = 20) -> str:
+    """ORU^R01 del Icon-3: bloques NTE, `n_obx` analitos y 3 histogramas de 256 bytes."""
+    ts = _ts(index)
+    segs = [
+        f"MSH|^~\\&|Icon-3|NI30H24105|LIS Application|LIS|{ts}||ORU^R01|"
+        f"6389{index:014d}|P|2.5||||||UNICODE UTF-8",
+        "SFT|N|1.3.2596.0|Icon-3|1.3.2596.0|Product Version: 0.9|20240124034738",
+        f"PID|{index}||^^|||||O",
+        f"OBR|||^^^{500 + index % 500}||||{ts}|25||||3 Part Differential Hematology",
+        f"NTE|Comment1||{rng.choice(NAMES)} {rng.choice(SURNAMES)}|1^Name",
+        f"NTE|Comment2||{rng.randint(1, 95)}|2^Age",
+        "NTE|Profile||Human",
+    ]
+    for i in range(n_obx):
+        code, units, lo, hi = ICON3_ANALYTES[i % len(ICON3_ANALYTES)]
+        segs.append(f"OBX|{i + 1}|NM|{i}^{code}||{_value(rng, lo, hi)}|{units}|{lo}-{hi}||||F")
+    for i, name in enumerate(ICON3_HISTOGRAMS):
+        segs.append(f"OBX|{n_obx + i + 1}|ED|{name}^{name}||{_histogram(rng)}||||||F")
+    segs.append(f"NTE|RD||{rng.randint(20, 60)}|RE^RBC Discriminator (fL)")
+    for i in range(3):
+        segs.append(f"NTE|WD{i}||{rng.randint(30, 200)}|{i}^WBC Discriminator #{i} (fL)")
+    segs.append(f"NTE|Comment6||{rng.choice(('', 'A3', 'X4N6'))}|6^WBC flags")
+    return "\r".join(segs) + "\r"
+
+
+def finecare_message(rng: random.Random, index: int = 0, n_obx: int = 1) -> str:
+    """ORU^R01 del Finecare (FS-114): un PID completo y `n_obx` pruebas."""
+    ts = _ts(index)
+    sample = f"FS1142411205376_{index}_{ts}"
+    segs = [
+        "MSH|^~\\&|QIAnalyzer|FS-114^FS1142411205376^FS-114||^^|"
+        f"{ts}||ORU^R01^ORU_R01|{index}|P|2.4||||0|CHN|Unicode||||",
+        f"PID|{index}||^{1_000_000_000 + index}^||{rng.choice(NAMES)} {rng.choice(SURNAMES)}||"
+        f"19{rng.randint(40, 99)}0{rng.randint(1, 9)}1{rng.randint(0, 9)}|{rng.choice('MF')}",
+        f"OBR|{sample}|F{index:08d}|{index % 100}||||{ts}||||||||Suero / plasma",
+    ]
+    for i in range(n_obx):
+        code, name, units, lo, hi = FINECARE_TESTS[(index + i) % len(FINECARE_TESTS)]
+        segs.append(
+            f"OBX|{sample}_{i}|NM|{code}|{name}|{_value(rng, lo, hi)}|{units}|{lo}-{hi}|"
+            f"{name}|||F"
+        )
+    return "\r".join(segs) + "\r"
+
+
+def iter_corpus(
+    count: int, seed: int = 1234, mix: Sequence[Tuple[str, float]] = DEFAULT_MIX
+) -> Iterator[Tuple[str, str]]:
+    """(tipo, texto) deterministas: la misma semilla genera exactamente los mismos mensajes."""
+    rng = random.Random(seed)
+    kinds = [kind for kind, _ in mix]
+    weights = [float(weight) for _, weight in mix]
+    for index in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "icon3":
+            yield kind, icon3_message(rng, index, rng.choice(ICON3_SIZES))
+        elif kind == "finecare":
+            yield kind, finecare_message(rng, index, rng.choice(FINECARE_SIZES))
+        else:
+            raise ValueError(f"Tipo de mensaje desconocido en el corpus: {kind!r}")
+
+
+def build_corpus(
+    count: int, seed: int = 1234, mix: Sequence[Tuple[str, float]] = DEFAULT_MIX
+) -> List[Tuple[str, str]]:
+    return list(iter_corpus(count, seed, mix))
+
+
+def parse_mix(spec: str) -> Tuple[Tuple[str, float], ...]:
+    """'icon3=3,finecare=1' -> (('icon3', 3.0), ('finecare', 1.0))."""
+    out = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        kind, _, weight = part.partition("=")
+        out.append((kind.strip().lower(), float(weight or 1)))
+    if not out:
+        raise ValueError(f"Mezcla vacía: {spec!r}")
+    return tuple(out)
@@ -0,0 +1,407 @@
+"""
+Generador de carga: simula muchos analizadores a la vez contra el listener de resultados.
+
+- TCP (MLLP): una conexión por analizador. En lazo cerrado cada analizador envía el
+  siguiente mensaje al recibir el ACK (hasta `pipeline` en vuelo); en lazo abierto se
+  envía a una tasa fija sin esperar ACK y la latencia se mide desde el instante
+  programado (así un listener saturado no se esconde detrás de la espera del emisor).
+- UDP (Finecare): ráfaga de datagramas desde `analyzers` sockets. UDP no tiene ACK:
+  la pérdida se calcula con el contador `ingest.submitted` del endpoint /stats
+  (ResultsService con `metrics.port`), antes y después de la ráfaga.
+
+Cada mensaje lleva un MSH-10 único (corrida + analizador + secuencia), así la
+supresión de duplicados del servicio no altera la medición entre corridas.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+import urllib.request
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.bench.corpus import DEFAULT_MIX, build_corpus
+from app.bench.suite import percentile
+from app.commons.hl7_message import HL7Message
+from app.helpers.tcp_transport import CR, FS, VT, read_mllp_messages
+
+DEFAULT_POOL = 256  # mensajes plantilla (se reusan con otro MSH-10)
+DEFAULT_ACK_TIMEOUT = 10.0
+DEFAULT_SETTLE_SEC = 1.0  # /stats sin cambios por este tiempo = el listener terminó
+
+
+def with_control_id(text: str, control_id: str) -> str:
+    """Reemplaza MSH-10 (solo se toca el primer segmento)."""
+    end = text.find("\r")
+    end = len(text) if end < 0 else end
+    fields = text[:end].split("|")
+    fields[9] = control_id
+    return "|".join(fields) + text[end:]
+
+
+def _run_tag() -> str:
+    return f"{int(time.time() * 10) % 1_000_000:06d}"
+
+
+def make_control_id(tag: str, analyzer: int, seq: int) -> str:
+    """MSH-10 de la carga: con separadores, así no choca al pasar de 999 analizadores o 10^7."""
+    return f"{tag}-{analyzer:03d}-{seq:07d}"  # 18 caracteres (ST de HL7: 20) en el caso usual
+
+
+class LoadRecorder:
+    """Envíos, ACK por código y latencias (por tipo de mensaje) de una corrida."""
+
+    def __init__(self):
+        self.sent: Counter = Counter()
+        self.codes: Counter = Counter()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.lost = 0  # sin ACK antes del timeout o con la conexión caída
+        self.unmatched = 0  # ACK con un MSA-2 que no se esperaba
+        self.conn_errors = 0
+        self.started = time.perf_counter()
+
+    def ack(self, kind: str, code: str, latency: float):
+        self.codes[code or "?"] += 1
+        self.latencies[kind].append(latency)
+
+    @property
+    def acked(self) -> int:
+        return sum(self.codes.values())
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        def lat(values: List[float]) -> Dict[str, Any]:
+            values = sorted(values)
+            return {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+                "p90_ms": round(percentile(values, 0.90) * 1000, 3),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+                "p999_ms": round(percentile(values, 0.999) * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+            }
+
+        sent = sum(self.sent.values())
+        return {
+            "elapsed_sec": round(elapsed, 3),
+            "sent": sent,
+            "sent_by_kind": dict(self.sent),
+            "acked": self.acked,
+            "ack_codes": dict(self.codes),
+            "lost": self.lost,
+            "loss_pct": round(self.lost / sent * 100, 3) if sent else 0.0,
+            "unmatched_acks": self.unmatched,
+            "connection_errors": self.conn_errors,
+            "send_rate": round(sent / elapsed, 1) if elapsed > 0 else 0.0,
+            "ack_rate": round(self.acked / elapsed, 1) if elapsed > 0 else 0.0,
+            "latency": lat([v for values in self.latencies.values() for v in values]),
+            "latency_by_kind": {kind: lat(v) for kind, v in sorted(self.latencies.items())},
+        }
+
+
+def _split(total: int, parts: int) -> List[int]:
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+async def _tcp_analyzer(
+    index: int,
+    host: str,
+    port: int,
+    templates: Sequence[Tuple[str, str]],
+    rec: LoadRecorder,
+    tag: str,
+    count: Optional[int],
+    deadline: float,
+    interval: float,
+    phase: float,
+    pipeline: int,
+    ack_timeout: float,
+):
+    """Un analizador: una conexión, escritor con su plan de envíos y lector de ACK."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 10)
+    except (OSError, asyncio.TimeoutError):
+        rec.conn_errors += 1
+        return
+    pending: Dict[str, Tuple[float, str]] = {}  # MSH-10 -> (instante programado, tipo)
+    slots = asyncio.Semaphore(pipeline)
+    all_acked = asyncio.Event()
+    done_sending = False
+
+    async def read_acks():
+        try:
+            async for text in read_mllp_messages(reader):
+                now = time.perf_counter()
+                ack = HL7Message(text)
+                entry = pending.pop(ack.get("MSA-2") or "", None)
+                if entry is None:
+                    rec.unmatched += 1
+                    continue
+                rec.ack(entry[1], ack.get("MSA-1"), now - entry[0])
+                if interval <= 0:
+                    slots.release()
+                if done_sending and not pending:
+                    all_acked.set()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            all_acked.set()  # conexión cerrada: no llegarán más ACK
+
+    acks = asyncio.create_task(read_acks())
+    start = time.perf_counter() + phase
+    try:
+        for seq in itertools.count():
+            finished = seq >= count if count is not None else time.perf_counter() >= deadline
+            if finished:
+                break
+            if acks.done():
+                break  # el receptor cerró la conexión
+            if interval > 0:
+                scheduled = start + seq * interval
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                try:
+                    await asyncio.wait_for(slots.acquire(), ack_timeout)
+                except asyncio.TimeoutError:
+                    break  # los ACK dejaron de llegar: lo pendiente cuenta como perdido
+                scheduled = time.perf_counter()
+            kind, text = templates[(index + seq) % len(templates)]
+            control_id = make_control_id(tag, index, seq)
+            pending[control_id] = (scheduled, kind)
+            writer.write(VT + with_control_id(text, control_id).encode("utf-8") + FS + CR)
+            rec.sent[kind] += 1
+            await writer.drain()
+        done_sending = True
+        if pending and not acks.done():
+            try:
+                await asyncio.wait_for(all_acked.wait(), ack_timeout)
+            except asyncio.TimeoutError:
+                pass
+    except (ConnectionError, OSError):
+        rec.conn_errors += 1
+    finally:
+        rec.lost += len(pending)
+        acks.cancel()
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+async def _progress(rec: LoadRecorder, every: float, on_progress: Callable[[str], None]):
+    last_acked, last_t = 0, time.perf_counter()
+    while True:
+        await asyncio.sleep(every)
+        now, acked = time.perf_counter(), rec.acked
+        on_progress(
+            f"{now - rec.started:6.1f}s  enviados {sum(rec.sent.values()):>8}  "
+            f"ACK {acked:>8}  {(acked - last_acked) / (now - last_t):>8.0f} ACK/s  "
+            f"perdidos {rec.lost}  errores conexión {rec.conn_errors}"
+        )
+        last_acked, last_t = acked, now
+
+
+def fetch_submitted(urls: Sequence[str]) -> Optional[int]:
+    """Suma `stats.ingest.submitted` de uno o varios endpoints /stats (None si falla alguno)."""
+    total = 0
+    for url in urls:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as resp:
+                data = json.loads(resp.read().decode("utf-8"))
+            total += int(data["stats"]["ingest"]["submitted"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+    return total
+
+
+async def _server_delta(urls: Sequence[str], before: Optional[int], settle: float):
+    """Mensajes que el listener recibió desde `before`; espera a que el contador se estabilice."""
+    if not urls or before is None:
+        return None
+    last, stable_since = None, time.monotonic()
+    deadline = time.monotonic() + max(settle * 30, 30)
+    while time.monotonic() < deadline:
+        now = await asyncio.to_thread(fetch_submitted, urls)
+        if now is None:
+            return None
+        if now != last:
+            last, stable_since = now, time.monotonic()
+        elif time.monotonic() - stable_since >= settle:
+            break
+        await asyncio.sleep(0.2)
+    return last - before
+
+
+async def run_tcp(
+    host: str,
+    port: int,
+    connections: int = 10,
+    mix: Sequence[Tuple[str, float]] = DEFAULT_MIX,
+    rate: float = 0.0,
+    duration: float = 10.0,
+    count: int = 0,
+    pipeline: int = 1,
+    ack_timeout: float = DEFAULT_ACK_TIMEOUT,
+    seed: int = 1234,
+    pool: int = DEFAULT_POOL,
+    stats_urls: Sequence[str] = (),
+    progress_sec: float = 0.0,
+    on_progress: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    """
+    `rate` > 0: lazo abierto, msgs/s totales repartidos entre las conexiones.
+    `rate` = 0: lazo cerrado, cada conexión con hasta `pipeline` mensajes sin ACK.
+    Termina tras `count` mensajes (si > 0) o `duration` segundos.
+    """
+    connections = max(1, int(connections))
+    templates = build_corpus(pool, seed, mix)
+    interval = connections / rate if rate > 0 else 0.0
+    counts = _split(count, connections) if count else [None] * connections
+    rec = LoadRecorder()
+    before = await asyncio.to_thread(fetch_submitted, stats_urls) if stats_urls else None
+    reporter = None
+    if progress_sec > 0:
+        reporter = asyncio.create_task(_progress(rec, progress_sec, on_progress))
+    tag = _run_tag()
+    deadline = time.perf_counter() + duration
+    start = rec.started = time.perf_counter()
+    try:
+        await asyncio.gather(
+            *(
+                _tcp_analyzer(
+                    i,
+                    host,
+                    port,
+                    templates,
+                    rec,
+                    tag,
+                    counts[i],
+                    deadline,
+                    interval,
+                    # Desfase dentro del intervalo: los analizadores no envían todos a la vez
+                    interval * i / connections,
+                    max(1, int(pipeline)),
+                    ack_timeout,
+                )
+                for i in range(connections)
+            )
+        )
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+    out = rec.report(time.perf_counter() - start)
+    out.update(
+        {
+            "mode": "tcp",
+            "loop": "open" if rate > 0 else "closed",
+            "target_rate": rate,
+            "connections": connections,
+            "pipeline": pipeline,
+        }
+    )
+    out["server_received"] = await _server_delta(stats_urls, before, DEFAULT_SETTLE_SEC)
+    return out
+
+
+async def run_udp(
+    host: str,
+    port: int,
+    analyzers: int = 10,
+    rate: float = 0.0,
+    duration: float = 10.0,
+    count: int = 0,
+    mllp: bool = False,
+    seed: int = 1234,
+    pool: int = DEFAULT_POOL,
+    stats_urls: Sequence[str] = (),
+    settle_sec: float = DEFAULT_SETTLE_SEC,
+) -> Dict[str, Any]:
+    """
+    Ráfaga Finecare por UDP: un datagrama por mensaje desde `analyzers` sockets.
+    `rate` = 0 envía tan rápido como se pueda (cediendo el loop cada 64 envíos).
+    """
+    loop = asyncio.get_running_loop()
+    analyzers = max(1, int(analyzers))
+    templates = build_corpus(pool, seed, (("finecare", 1.0),))
+    transports = []
+    for _ in range(analyzers):
+        transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=(host, port)
+        )
+        transports.append(transport)
+    before = await asyncio.to_thread(fetch_submitted, stats_urls) if stats_urls else None
+    tag = _run_tag()
+    interval = 1.0 / rate if rate > 0 else 0.0
+    sent, errors = 0, 0
+    start = time.perf_counter()
+    deadline = start + duration
+    try:
+        for seq in itertools.count():
+            if (count and seq >= count) or (not count and time.perf_counter() >= deadline):
+                break
+            if interval > 0:
+                delay = start + seq * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif seq % 64 == 0:
+                await asyncio.sleep(0)
+            analyzer = seq % analyzers
+            _, text = templates[seq % len(templates)]
+            data = with_control_id(text, make_control_id(tag, analyzer, seq)).encode("utf-8")
+            try:
+                transports[analyzer].sendto(VT + data + FS + CR if mllp else data)
+                sent += 1
+            except OSError:
+                errors += 1
+    finally:
+        elapsed = time.perf_counter() - start
+        for transport in transports:
+            transport.close()
+    received = await _server_delta(stats_urls, before, settle_sec)
+    return {
+        "mode": "udp",
+        "analyzers": analyzers,
+        "target_rate": rate,
+        "mllp": mllp,
+        "elapsed_sec": round(elapsed, 3),
+        "sent": sent,
+        "send_errors": errors,
+        "send_rate": round(sent / elapsed, 1) if elapsed > 0 else 0.0,
+        "server_received": received,
+        "lost": None if received is None else max(0, sent - received),
+        "loss_pct": (
+            None if received is None or not sent else round(max(0, sent - received) / sent * 100, 3)
+        ),
+    }
+
+
+def format_load_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"modo {report['mode']}: {report['sent']} enviados en {report['elapsed_sec']}s "
+        f"({report['send_rate']:.0f} msg/s)"
+    ]
+    if report["mode"] == "tcp":
+        lat = report["latency"]
+        lines.append(
+            f"ACK {report['acked']} {report['ack_codes']} ({report['ack_rate']:.0f} ACK/s), "
+            f"perdidos {report['lost']} ({report['loss_pct']}%), "
+            f"errores de conexión {report['connection_errors']}"
+        )
+        lines.append(
+            f"latencia ACK ms: p50 {lat['p50_ms']}  p90 {lat['p90_ms']}  p99 {lat['p99_ms']}  "
+            f"p99.9 {lat['p999_ms']}  max {lat['max_ms']}"
+        )
+        for kind, k in report["latency_by_kind"].items():
+            lines.append(f"  {kind:<9} n={k['count']:<7} p50 {k['p50_ms']}  p99 {k['p99_ms']}")
+    if report.get("server_received") is not None:
+        lines.append(f"recibidos por el listener (/stats): {report['server_received']}")
+    if report["mode"] == "udp":
+        if report["lost"] is None:
+            lines.append("pérdida: sin --stats-url no se puede medir (UDP no tiene ACK)")
+        else:
+            lines.append(f"perdidos {report['lost']} ({report['loss_pct']}%)")
+    return "\n".join(lines)
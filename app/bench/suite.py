@@ -0,0 +1,328 @@
+"""
+Suite de benchmarks reproducible (`python run.py bench`).
+
+Cada caso corre sobre el mismo corpus sintético (app.bench.corpus, con semilla fija)
+y reporta msgs/s y latencia p50/p99 por mensaje (la mejor de `repeat` corridas):
+
+- frame: `read_mllp_messages` sobre un stream con todo el corpus enmarcado.
+- validate: `validate_hl7_message_or_raise` (mensajes ya indexados).
+- normalize: `HL7Normalizer.normalize`.
+- to_sofia_payload: `HL7Normalizer.to_sofia_payload` sobre resultados ya normalizados.
+- tcp_roundtrip: TcpSender -> TcpServer -> ResultsService -> JSON en disco; la
+  latencia es la del ACK (ack_mode processed: el JSON ya se escribió).
+
+El reporte se guarda como JSON y se puede comparar contra una corrida base.
+"""
+
+import asyncio
+import gc
+import math
+import os
+import platform
+import socket
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.bench.corpus import DEFAULT_MIX, build_corpus
+from app.commons.hl7_engine import HL7Engine
+from app.commons.hl7_message import HL7Message
+from app.commons.hl7_normalizer import HL7Normalizer
+from app.helpers.router import FlowRouter
+from app.helpers.tcp_transport import CR, FS, VT, TcpSender, read_mllp_messages
+from app.validation.validators import validate_hl7_message_or_raise
+
+DEFAULT_COUNT = 5000
+DEFAULT_E2E_COUNT = 1000
+DEFAULT_SEED = 1234
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.10
+WARMUP = 50
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Percentil por rango más cercano (sin interpolar) sobre valores ya ordenados."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, Any]:
+    lat = sorted(latencies)
+    n = len(lat)
+    return {
+        "count": n,
+        "msgs_per_sec": round(n / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_us": round(percentile(lat, 0.50) * 1e6, 2),
+        "p99_us": round(percentile(lat, 0.99) * 1e6, 2),
+        "mean_us": round(sum(lat) / n * 1e6, 2) if n else 0.0,
+        "max_us": round(lat[-1] * 1e6, 2) if n else 0.0,
+    }
+
+
+def _timed(fn: Callable[[Any], Any], items: Iterable[Any]) -> Dict[str, Any]:
+    clock = time.perf_counter
+    lat: List[float] = []
+    # Como timeit: sin pausas del GC dentro de la medición
+    gc.collect()
+    gc.disable()
+    try:
+        start = clock()
+        for item in items:
+            t0 = clock()
+            fn(item)
+            lat.append(clock() - t0)
+        elapsed = clock() - start
+    finally:
+        gc.enable()
+    return summarize(lat, elapsed)
+
+
+def _warm(fn: Callable[[Any], Any], texts: List[str]):
+    for text in texts[:WARMUP]:
+        fn(HL7Message(text))
+
+
+# -------- casos --------
+
+
+def bench_frame(texts: List[str], opts: Dict[str, Any]) -> Dict[str, Any]:
+    """Costo por mensaje del framer: tiempo entre mensajes consecutivos del generador."""
+    data = b"".join(VT + t.encode("utf-8") + FS + CR for t in texts)
+
+    async def run():
+        reader = asyncio.StreamReader(limit=len(data) + 1)
+        reader.feed_data(data)
+        reader.feed_eof()
+        clock = time.perf_counter
+        lat: List[float] = []
+        start = last = clock()
+        async for _ in read_mllp_messages(reader):
+            now = clock()
+            lat.append(now - last)
+            last = now
+        return summarize(lat, clock() - start)
+
+    return asyncio.run(run())
+
+
+def bench_validate(texts: List[str], opts: Dict[str, Any]) -> Dict[str, Any]:
+    _warm(validate_hl7_message_or_raise, texts)
+    msgs = [HL7Message(t) for t in texts]  # indexados fuera de la medición, memo vacío
+    return _timed(validate_hl7_message_or_raise, msgs)
+
+
+def bench_normalize(texts: List[str], opts: Dict[str, Any]) -> Dict[str, Any]:
+    normalizer = HL7Normalizer()
+    _warm(normalizer.normalize, texts)
+    msgs = [HL7Message(t) for t in texts]
+    return _timed(normalizer.normalize, msgs)
+
+
+def bench_payload(texts: List[str], opts: Dict[str, Any]) -> Dict[str, Any]:
+    normalizer = HL7Normalizer()
+    results = [normalizer.normalize(t) for t in texts]
+    for norm in results[:WARMUP]:
+        normalizer.to_sofia_payload(norm)
+    return _timed(normalizer.to_sofia_payload, results)
+
+
+def _free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+async def _wait_listening(host: str, port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.02)
+            continue
+        writer.close()
+        return
+
+
+def bench_tcp_roundtrip(texts: List[str], opts: Dict[str, Any]) -> Dict[str, Any]:
+    """Loopback completo con la configuración por defecto de ResultsService (salida .json)."""
+    from app.services.results_service import (
+        ResultsService,  # importa el pipeline completo
+    )
+
+    texts = texts[: opts.get("e2e_count", DEFAULT_E2E_COUNT)]
+    concurrency = max(1, int(opts.get("concurrency", 1)))
+    host = "127.0.0.1"
+
+    async def run(root: Path):
+        paths = {k: str(root / k) for k in ("inbox", "archive", "error", "logs_root")}
+        router = FlowRouter(HL7Engine({}), {"paths": paths})
+        transport = {"results": {"tcp": {"ack_mode": "processed", "pipeline_depth": 64}}}
+        svc = ResultsService(router, transport, paths)
+        port = _free_port(host)
+        serve = asyncio.create_task(svc.run_tcp_mode(host, port))
+        await _wait_listening(host, port)
+        sender = TcpSender(host, port, pool_size=1, max_in_flight=concurrency)
+        slots = asyncio.Semaphore(concurrency)
+        lat: List[float] = []
+        failed = 0
+
+        async def one(text: str):
+            nonlocal failed
+            async with slots:
+                t0 = time.perf_counter()
+                try:
+                    await sender.send(text)
+                except Exception:
+                    failed += 1
+                    return
+                lat.append(time.perf_counter() - t0)
+
+        try:
+            for text in texts[:WARMUP]:
+                await sender.send(text)
+            start = time.perf_counter()
+            await asyncio.gather(*(one(t) for t in texts[WARMUP:]))
+            out = summarize(lat, time.perf_counter() - start)
+        finally:
+            await sender.close()
+            serve.cancel()
+            try:
+                await serve
+            except asyncio.CancelledError:
+                pass
+        out["failed"] = failed
+        out["json_written"] = sum(1 for _ in Path(paths["archive"]).glob("*.json"))
+        out["concurrency"] = concurrency
+        return out
+
+    with tempfile.TemporaryDirectory(prefix="lab-bench-") as tmp:
+        return asyncio.run(run(Path(tmp)))
+
+
+CASES: Dict[str, Callable[[List[str], Dict[str, Any]], Dict[str, Any]]] = {
+    "frame": bench_frame,
+    "validate": bench_validate,
+    "normalize": bench_normalize,
+    "to_sofia_payload": bench_payload,
+    "tcp_roundtrip": bench_tcp_roundtrip,
+}
+
+
+# -------- corrida / comparación --------
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            timeout=5,
+            cwd=Path(__file__).resolve().parent,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_suite(
+    count: int = DEFAULT_COUNT,
+    seed: int = DEFAULT_SEED,
+    mix: Sequence[Tuple[str, float]] = DEFAULT_MIX,
+    only: Optional[Sequence[str]] = None,
+    e2e_count: int = DEFAULT_E2E_COUNT,
+    concurrency: int = 1,
+    repeat: int = DEFAULT_REPEAT,
+    on_case: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    names = list(only) if only else list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        raise ValueError(f"Caso(s) desconocido(s): {unknown} (disponibles: {list(CASES)})")
+    corpus = build_corpus(count, seed, mix)
+    texts = [text for _, text in corpus]
+    opts = {"e2e_count": e2e_count, "concurrency": concurrency}
+    report: Dict[str, Any] = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": seed,
+            "count": count,
+            "repeat": repeat,
+            "mix": [list(m) for m in mix],
+            "corpus_bytes": sum(len(t.encode("utf-8")) for t in texts),
+        },
+        "cases": {},
+    }
+    for name in names:
+        # Mejor de `repeat` corridas: el ruido (otros procesos, frecuencia) solo resta
+        runs = [CASES[name](texts, opts) for _ in range(max(1, repeat))]
+        result = max(runs, key=lambda r: r["msgs_per_sec"])
+        report["cases"][name] = result
+        if on_case is not None:
+            on_case(name, result)
+    return report
+
+
+def compare(
+    report: Dict[str, Any], baseline: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD
+) -> List[Dict[str, Any]]:
+    """
+    Filas (caso, métrica, base, actual, delta) para msgs/s, p50 y p99. `regression` se
+    marca si msgs/s cae o p50 sube más de `threshold` (p99 es informativo: es ruidoso).
+    """
+    rows = []
+    for name, now in report["cases"].items():
+        base = (baseline.get("cases") or {}).get(name)
+        if not base:
+            continue
+        for metric, higher_is_better, gate in (
+            ("msgs_per_sec", True, True),
+            ("p50_us", False, True),
+            ("p99_us", False, False),
+        ):
+            b, n = base.get(metric), now.get(metric)
+            if not b or n is None:
+                continue
+            delta = (n - b) / b
+            worse = -delta if higher_is_better else delta
+            rows.append(
+                {
+                    "case": name,
+                    "metric": metric,
+                    "base": b,
+                    "now": n,
+                    "delta": round(delta, 4),
+                    "regression": gate and worse > threshold,
+                }
+            )
+    return rows
+
+
+def format_case(name: str, r: Dict[str, Any]) -> str:
+    return (
+        f"{name:<18} {r['msgs_per_sec']:>11.0f} msg/s   p50 {r['p50_us']:>9.1f} µs   "
+        f"p99 {r['p99_us']:>9.1f} µs"
+    )
+
+
+def format_comparison(rows: List[Dict[str, Any]]) -> str:
+    lines = [f"{'caso':<18} {'métrica':<13} {'base':>11} {'actual':>11} {'delta':>8}"]
+    for r in rows:
+        mark = "  <-- regresión" if r["regression"] else ""
+        lines.append(
+            f"{r['case']:<18} {r['metric']:<13} {r['base']:>11.1f} {r['now']:>11.1f} "
+            f"{r['delta']:>+8.1%}{mark}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,173 @@
+import base64
+import binascii
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.commons.hl7_message import HL7Message
+
+HISTOGRAM_NAMES = ("RBCHistogram", "PLTHistogram", "WBCHistogram")
+HISTOGRAM_BINS = 256
+
+# Discriminadores que Icon-3 informa en NTE (en fL) y el histograma al que aplican
+_DISCRIMINATOR_OF = {"rd": "RBCHistogram"}
+_WD_RE = re.compile(r"wd(\d+)")
+
+# fL por canal de cada histograma, para ubicar los discriminadores en los 256 canales.
+# 1.0 = el valor del NTE se toma como número de canal; ajustar según el equipo.
+DEFAULT_FL_PER_BIN = {name: 1.0 for name in HISTOGRAM_NAMES}
+
+
+class Histogram(NamedTuple):
+    name: str
+    b64: str
+    data: Optional[np.ndarray]  # uint8[256], solo lectura; None si no decodifica
+    error: Optional[str]
+
+
+def decode_histogram(b64: str) -> np.ndarray:
+    """base64 -> uint8[256] (sin copiar los bytes). ValueError si no es base64 o no mide 256."""
+    try:
+        raw = base64.b64decode(b64, validate=True)
+    except (binascii.Error, ValueError) as ex:
+        raise ValueError(f"Histogram base64 inválido: {ex}")
+    if len(raw) != HISTOGRAM_BINS:
+        raise ValueError(f"Histogram inválido: longitud {len(raw)} != {HISTOGRAM_BINS}")
+    return np.frombuffer(raw, dtype=np.uint8)
+
+
+def _decode_all(msg: HL7Message) -> Dict[str, Histogram]:
+    comp = msg.seps["c"]
+    out: Dict[str, Histogram] = {}
+    for _, fields in msg.iter_fields("OBX"):
+        ident = fields[3] if len(fields) > 3 else ""
+        name = ident.split(comp, 1)[0] if ident else ""
+        if name not in HISTOGRAM_NAMES or (name in out and out[name].error is not None):
+            continue  # un histograma repetido no tapa el error del anterior
+        value = fields[5] if len(fields) > 5 else ""
+        try:
+            out[name] = Histogram(name, value, decode_histogram(value), None)
+        except ValueError as ex:
+            out[name] = Histogram(name, value, None, str(ex))
+    return out
+
+
+def message_histograms(hl7: Union[str, HL7Message]) -> Dict[str, Histogram]:
+    """Histogramas del mensaje, decodificados una vez (validador, métricas y sidecar)."""
+    return HL7Message.coerce(hl7).memo("histograms", _decode_all)
+
+
+def discriminator_values(hl7: Union[str, HL7Message]) -> Dict[str, List[Tuple[str, float]]]:
+    """NTE RD / WDn -> {histograma: [(nombre, fL), ...]} (WD en orden de índice)."""
+    msg = HL7Message.coerce(hl7)
+    out: Dict[str, List[Tuple[str, float]]] = {}
+    wd: List[Tuple[int, float]] = []
+    for _, fields in msg.iter_fields("NTE"):
+        tag = (fields[1] if len(fields) > 1 else "").lower()
+        raw = (fields[3] if len(fields) > 3 else "") or (fields[4] if len(fields) > 4 else "")
+        try:
+            value = float(raw)
+        except ValueError:
+            continue
+        if tag in _DISCRIMINATOR_OF:
+            out.setdefault(_DISCRIMINATOR_OF[tag], []).append((tag.upper(), value))
+        elif _WD_RE.fullmatch(tag):
+            wd.append((int(tag[2:]), value))
+    if wd:
+        out["WBCHistogram"] = [(f"WD{i}", v) for i, v in sorted(wd)]
+    return out
+
+
+def analyze_batch(
+    messages: Sequence[Union[str, HL7Message]],
+    fl_per_bin: Optional[Dict[str, float]] = None,
+) -> List[Dict[str, Dict]]:
+    """
+    Métricas de histogramas para un lote de mensajes, vectorizadas por tipo de histograma
+    (una matriz N x 256 por RBC/PLT/WBC, sin bucles por canal):
+
+    - peak_bin / peak: canal y altura máximos; area: suma de cuentas; mean_bin: canal medio.
+    - discriminators: RD (RBC) y WDn (WBC) del NTE ubicados en su canal.
+    - fractions: proporción del área entre discriminadores consecutivos
+      (p.ej. WD0/WD1 -> LYM | MID | GRA).
+
+    Retorna, por mensaje, {histograma: métricas} (solo los histogramas válidos).
+    """
+    scale = {**DEFAULT_FL_PER_BIN, **(fl_per_bin or {})}
+    msgs = [HL7Message.coerce(m) for m in messages]
+    out: List[Dict[str, Dict]] = [{} for _ in msgs]
+    discs = [discriminator_values(m) for m in msgs]
+    bins = np.arange(HISTOGRAM_BINS, dtype=np.float64)
+
+    for name in HISTOGRAM_NAMES:
+        rows, arrays = [], []
+        for i, m in enumerate(msgs):
+            h = message_histograms(m).get(name)
+            if h is not None and h.data is not None:
+                rows.append(i)
+                arrays.append(h.data)
+        if not rows:
+            continue
+        hist = np.stack(arrays)  # (N, 256) uint8
+        area = hist.sum(axis=1, dtype=np.int64)
+        peak_bin = hist.argmax(axis=1)
+        peak = hist.max(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_bin = (hist @ bins) / area
+
+        # Discriminadores: matriz (N, K) de canales, -1 donde el mensaje no trae ese índice
+        width = max((len(discs[i].get(name, ())) for i in rows), default=0)
+        disc_bins = np.full((len(rows), width), -1, dtype=np.int64)
+        for r, i in enumerate(rows):
+            for k, (_, value) in enumerate(discs[i].get(name, ())):
+                disc_bins[r, k] = int(round(value / scale[name]))
+        fractions = None
+        if width:
+            # Área acumulada con un 0 al inicio: área a la izquierda del canal d = cum[:, d]
+            cum = np.zeros((len(rows), HISTOGRAM_BINS + 1), dtype=np.int64)
+            np.cumsum(hist, axis=1, dtype=np.int64, out=cum[:, 1:])
+            cuts = np.clip(
+                np.sort(np.where(disc_bins < 0, HISTOGRAM_BINS, disc_bins)), 0, HISTOGRAM_BINS
+            )
+            edges = np.concatenate(
+                [np.zeros((len(rows), 1), dtype=np.int64), np.take_along_axis(cum, cuts, 1)],
+                axis=1,
+            )
+            edges = np.concatenate([edges, area[:, None]], axis=1)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                fractions = np.diff(edges, axis=1) / area[:, None]
+
+        # Conversión a listas de Python una vez por lote (no escalares numpy por mensaje)
+        peak_bin_l, peak_l, area_l = peak_bin.tolist(), peak.tolist(), area.tolist()
+        mean_l = np.round(mean_bin, 2).tolist()
+        disc_l = disc_bins.tolist()
+        frac_l = np.round(fractions, 4).tolist() if fractions is not None else None
+        for r, i in enumerate(rows):
+            metrics = {
+                "peak_bin": peak_bin_l[r],
+                "peak": peak_l[r],
+                "area": area_l[r],
+                "mean_bin": mean_l[r] if area_l[r] else None,
+            }
+            named = discs[i].get(name)
+            if named:
+                metrics["discriminators"] = [
+                    {"name": label, "value": value, "bin": disc_l[r][k]}
+                    for k, (label, value) in enumerate(named)
+                ]
+                metrics["fractions"] = [
+                    None if x != x else x for x in frac_l[r][: len(named) + 1]  # NaN: área 0
+                ]
+            out[i][name] = metrics
+    return out
+
+
+def attach_metrics(
+    pairs: Sequence[Tuple[Dict, HL7Message]], fl_per_bin: Optional[Dict[str, float]] = None
+):
+    """Agrega `extras.histogram_metrics` a cada payload (un solo analyze_batch por lote)."""
+    metrics = analyze_batch([msg for _, msg in pairs], fl_per_bin)
+    for (payload, _), found in zip(pairs, metrics):
+        if found:
+            payload.setdefault("extras", {})["histogram_metrics"] = found
@@ -0,0 +1,54 @@
+from datetime import datetime
+from itertools import count
+from typing import Optional, Union
+
+from app.commons.hl7_message import HL7Message, escape_hl7
+
+# Códigos MSA-1 (modo original de acknowledgment)
+ACK_ACCEPT = "AA"
+ACK_ERROR = "AE"
+ACK_REJECT = "AR"
+
+_ack_seq = count(1)
+
+
+def build_ack(
+    hl7: Union[str, HL7Message],
+    code: str = ACK_ACCEPT,
+    text: Optional[str] = None,
+) -> str:
+    """
+    Construye un ACK^<evento> para el mensaje recibido:
+    - Usa los separadores detectados en MSH-1/MSH-2 del mensaje original.
+    - Intercambia emisor/receptor (MSH-3/4 <-> MSH-5/6).
+    - MSA-2 = MSH-10 del mensaje original; MSA-3 = texto opcional (escapado).
+    """
+    msg = HL7Message.coerce(hl7)
+    s = msg.seps
+    f = s["f"]
+    m = msg.first_fields("MSH")
+
+    def g(i: int) -> str:
+        return m[i] if len(m) > i else ""
+
+    event = msg.components(g(8))
+    trigger = event[1] if len(event) > 1 and event[1] else "R01"
+    now = datetime.now()
+    msh = [
+        "MSH",
+        s["c"] + s["r"] + s["e"] + s["s"],
+        g(4),  # MSH-3 <- receptor original
+        g(5),
+        g(2),  # MSH-5 <- emisor original
+        g(3),
+        now.strftime("%Y%m%d%H%M%S"),
+        "",
+        f"ACK{s['c']}{trigger}{s['c']}ACK",
+        f"{now.strftime('%Y%m%d%H%M%S')}{next(_ack_seq):06d}",
+        g(10) or "P",
+        g(11) or "2.5",
+    ]
+    msa = ["MSA", code, msg.control_id]
+    if text:
+        msa.append(escape_hl7(text.replace("\r", " ").replace("\n", " "), s)[:80])
+    return f.join(msh) + "\r" + f.join(msa) + "\r"
@@ -1,9 +1,15 @@
-from typing import Any, Dict
+import time
+from typing import Any, Dict, Optional, Union
 
 import yaml
 
+from app.commons.hl7_extractor import GroupedExtractorPlan, compile_extractors
+from app.commons.hl7_message import HL7Message
 from app.commons.hl7_normalizer import HL7Normalizer
+from app.commons.hl7_template import TemplateCompiler, TemplateError
 from app.parsers.models import NormalizedResult
+from app.parsers.registry import ParserRegistry
+from app.validation.validators import RuleValidator
 
 
 class HL7Engine:
@@ -11,7 +17,12 @@ class HL7Engine:
     Existing code calling HL7Engine(template_yaml) seguirá funcionando.
     """
 
-    def __init__(self, config_path_or_obj: Any):
+    def __init__(
+        self,
+        config_path_or_obj: Any,
+        parsers_cfg: Optional[Dict] = None,
+        validation_cfg: Optional[Dict] = None,
+    ):
         # Soportar rutas o dict ya cargado
         if isinstance(config_path_or_obj, str):
             with open(config_path_or_obj, "r", encoding="utf-8") as f:
@@ -20,18 +31,90 @@ class HL7Engine:
             self.cfg = config_path_or_obj
         else:
             self.cfg = {}
+        # El bloque `parsers` de settings.yaml viaja en cfg (ParsePool reconstruye el motor con él)
+        if parsers_cfg is not None:
+            self.cfg = {**self.cfg, "parsers": parsers_cfg}
+        if validation_cfg is not None:
+            self.cfg = {**self.cfg, "validation": validation_cfg}
 
-        parsers_cfg = self.cfg.get("parsers", {})
+        parsers_cfg = self.cfg.get("parsers") or {}
         autodetect = bool(parsers_cfg.get("autodetect", True))
         override = parsers_cfg.get("override", "")
-        self.normalizer = HL7Normalizer(autodetect=autodetect, override=override)
+        self.normalizer = HL7Normalizer(
+            autodetect=autodetect,
+            override=override,
+            registry=ParserRegistry.from_config(parsers_cfg),
+        )
+        # Reglas de validación (generales y por analizador)
+        self.validator = RuleValidator.from_config(self.cfg.get("validation"))
+        # Plantillas de salida (ORM): se compilan una sola vez aquí
+        self.templates = TemplateCompiler(self.cfg).compile_all() if "templates" in self.cfg else {}
+        # Extractores (HEADER_PATIENT, OBR_OBX_GROUPED...): plan de accesos precompilado
+        self.extractors = compile_extractors(self.cfg)
 
-    def normalize(self, hl7_text: str) -> NormalizedResult:
-        return self.normalizer.normalize(hl7_text)
+    def validate(self, hl7: Union[str, HL7Message], origin: Any = None):
+        """Levanta ValidationError si el mensaje no cumple las reglas de su analizador."""
+        msg = HL7Message.coerce(hl7)
+        # Solo se detecta el perfil si hay reglas por analizador (queda en caché para normalize)
+        analyzer = self.normalizer.detect(msg, origin) if self.validator.per_analyzer else None
+        self.validator.check(msg, analyzer)
+
+    def normalize(self, hl7: Union[str, HL7Message], origin: Any = None) -> NormalizedResult:
+        return self.normalizer.normalize(hl7, origin)
 
     def to_sofia_payload(self, norm: NormalizedResult) -> Dict:
         return self.normalizer.to_sofia_payload(norm)
 
-    def parse_and_map(self, hl7_text: str) -> Dict:
-        norm = self.normalize(hl7_text)
-        return self.to_sofia_payload(norm)
+    def parse_and_map(
+        self, hl7: Union[str, HL7Message], origin: Any = None, metrics: Any = None
+    ) -> Dict:
+        """`metrics` (app.commons.metrics.Metrics): registra detect/parse/serialize por separado."""
+        if metrics is None:
+            norm = self.normalize(hl7, origin)
+            return self.to_sofia_payload(norm)
+        msg = HL7Message.coerce(hl7)
+        t = time.perf_counter()
+        profile = self.normalizer.detect(msg, origin)
+        t = metrics.lap("detect", t)
+        norm = self.normalizer.registry.parse(msg, profile)
+        t = metrics.lap("parse", t)
+        data = self.to_sofia_payload(norm)
+        metrics.lap("serialize", t)
+        return data
+
+    def render(self, template: str, payload: Any, hl7_in: Any = None) -> str:
+        """
+        Renderiza una plantilla compilada (p.ej. ORM_O01_ORC_EACH) con el payload.
+        `hl7_in` queda reservado para plantillas que copien datos de un mensaje de
+        entrada; ninguna plantilla actual lo usa.
+        """
+        compiled = self.templates.get(template)
+        if compiled is None:
+            raise TemplateError(f"Plantilla no definida: {template!r}")
+        if hasattr(payload, "model_dump"):
+            payload = payload.model_dump()
+        return compiled.render(payload)
+
+    def _plan(self, profile: str):
+        plan = self.extractors.get(profile)
+        if plan is None:
+            raise TemplateError(f"Perfil de extracción no definido: {profile!r}")
+        return plan
+
+    def extract(self, profile: Union[str, Dict], hl7: Union[str, HL7Message]) -> Dict:
+        """
+        Extrae un perfil de `extractors` (p.ej. HEADER_PATIENT) a un dict anidado.
+        Un dict {clave: 'SEG-x-y'} se sigue aceptando (compat con HL7Normalizer.extract).
+        """
+        if isinstance(profile, dict):
+            return self.normalizer.extract(profile, hl7)
+        return self._plan(profile).run(HL7Message.coerce(hl7))
+
+    def extract_grouped(
+        self, profile: str, hl7: Union[str, HL7Message], base_out: Optional[Dict] = None
+    ) -> Dict:
+        """Extrae un perfil de `group_extractors` (p.ej. OBR_OBX_GROUPED) sobre `base_out`."""
+        plan = self._plan(profile)
+        if not isinstance(plan, GroupedExtractorPlan):
+            raise TemplateError(f"{profile!r} no es un perfil de group_extractors")
+        return plan.run(HL7Message.coerce(hl7), base_out=base_out)
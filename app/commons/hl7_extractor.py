@@ -0,0 +1,187 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from app.commons.hl7_message import HL7Message
+from app.commons.hl7_template import TemplateError, compile_transform
+
+# (índice de campo ya ajustado a MSH, componente o None, claves de salida, transforms)
+Accessor = Tuple[int, Optional[int], Tuple[str, ...], Tuple[Callable[[Any], Any], ...]]
+
+
+def _parse_path(path: str) -> Tuple[str, int, Optional[int]]:
+    """'OBX-3-1' -> ('OBX', índice en fields, 1). MSH usa la numeración HL7 (MSH-2 => fields[1])."""
+    parts = str(path).strip().split("-")
+    if len(parts) < 2:
+        raise TemplateError(f"Ruta HL7 inválida: {path!r}")
+    seg = parts[0].strip().upper()
+    field_no = int(parts[1])
+    comp_no = int(parts[2]) if len(parts) > 2 else None
+    return seg, field_no - 1 if seg == "MSH" else field_no, comp_no
+
+
+def _compile_accessor(name: str, spec: Union[str, Dict]) -> Tuple[str, Accessor]:
+    if isinstance(spec, dict):
+        path, transforms = spec.get("path"), spec.get("transforms") or ()
+    else:
+        path, transforms = spec, ()
+    seg, idx, comp = _parse_path(path)
+    fns = tuple(compile_transform(t) for t in transforms)
+    return seg, (idx, comp, tuple(str(name).split(".")), fns)
+
+
+def _assign(out: Dict, keys: Tuple[str, ...], value: Any):
+    for key in keys[:-1]:
+        nxt = out.get(key)
+        if not isinstance(nxt, dict):
+            nxt = out[key] = {}
+        out = nxt
+    out[keys[-1]] = value
+
+
+def _apply(accessors: List[Accessor], fields: List[str], comp_sep: str, out: Dict):
+    n = len(fields)
+    split_cache: Dict[int, List[str]] = {}
+    for idx, comp, keys, fns in accessors:
+        value = fields[idx] if 0 <= idx < n else None
+        if value is not None and comp is not None:
+            comps = split_cache.get(idx)
+            if comps is None:
+                comps = split_cache[idx] = value.split(comp_sep)
+            value = comps[comp - 1] if 0 < comp <= len(comps) else None
+        if value is not None:
+            for fn in fns:
+                value = fn(value)
+        if len(keys) == 1:
+            out[keys[0]] = value
+        else:
+            _assign(out, keys, value)
+
+
+class ExtractorPlan:
+    """
+    `extractors.<perfil>` compilado: por tipo de segmento, la lista de accesos
+    (campo, componente, destino, transforms). Se aplica al primer segmento de
+    cada tipo, en una sola pasada por el mensaje.
+    """
+
+    __slots__ = ("name", "by_segment", "keys")
+
+    def __init__(self, name: str, rules: List[Dict]):
+        self.name = name
+        self.by_segment: Dict[str, List[Accessor]] = {}
+        for rule in rules or ():
+            seg, acc = _compile_accessor(rule["name"], rule)
+            self.by_segment.setdefault(seg, []).append(acc)
+        # Se conservan las salidas aunque falte el segmento (valor None)
+        self.keys = [acc[2] for accs in self.by_segment.values() for acc in accs]
+
+    def run(self, msg: HL7Message, out: Optional[Dict] = None) -> Dict:
+        out = {} if out is None else out
+        for keys in self.keys:
+            _assign(out, keys, None)
+        pending = set(self.by_segment)
+        comp_sep = msg.seps["c"]
+        for i, seg in enumerate(msg.segment_types):
+            if seg in pending:
+                pending.discard(seg)
+                _apply(self.by_segment[seg], msg.fields(i), comp_sep, out)
+                if not pending:
+                    break
+        return out
+
+
+class _GroupLevel:
+    __slots__ = ("base", "assign", "own", "other", "child")
+
+    def __init__(self, spec: Dict):
+        self.base = str(spec["base"]).upper()
+        self.assign = tuple(str(spec.get("assign", "items[*]")).replace("[*]", "").split("."))
+        # Campos del propio segmento base vs. de otro segmento (primer segmento de ese tipo)
+        self.own: List[Accessor] = []
+        self.other: Dict[str, List[Accessor]] = {}
+        for name, fspec in (spec.get("fields") or {}).items():
+            seg, acc = _compile_accessor(name, fspec)
+            if seg == self.base:
+                self.own.append(acc)
+            else:
+                self.other.setdefault(seg, []).append(acc)
+        self.child = _GroupLevel(spec["children"]) if spec.get("children") else None
+
+
+class GroupedExtractorPlan:
+    """
+    `group_extractors.<perfil>` compilado (p.ej. OBR -> ordenes[*], OBX -> examenes[*]).
+
+    Recorre los segmentos una sola vez: cada segmento base abre un item nuevo y
+    cada segmento hijo se agrega al item abierto del nivel superior.
+    """
+
+    __slots__ = ("name", "root", "levels", "by_base", "wanted")
+
+    def __init__(self, name: str, spec: Dict):
+        self.name = name
+        self.root = _GroupLevel(spec)
+        # Niveles en cadena: raíz, hijo, nieto...
+        self.levels: List[_GroupLevel] = []
+        lvl = self.root
+        while lvl is not None:
+            self.levels.append(lvl)
+            lvl = lvl.child
+        self.by_base = {lv.base: depth for depth, lv in enumerate(self.levels)}
+        self.wanted = {seg for lv in self.levels for seg in lv.other}
+
+    def run(self, msg: HL7Message, base_out: Optional[Dict] = None) -> Dict:
+        out = dict(base_out or {})
+        comp_sep = msg.seps["c"]
+        types = msg.segment_types
+        levels, by_base, wanted = self.levels, self.by_base, self.wanted
+
+        # Campos de otros segmentos: se resuelven una vez (primer segmento del tipo)
+        firsts: Dict[str, List[str]] = {}
+        if wanted:
+            for i, seg in enumerate(types):
+                if seg in wanted and seg not in firsts:
+                    firsts[seg] = msg.fields(i)
+
+        roots: List[Dict] = []
+        open_items: List[Optional[Dict]] = [None] * len(levels)
+        for i, seg in enumerate(types):
+            depth = by_base.get(seg)
+            if depth is None:
+                continue
+            if depth > 0 and open_items[depth - 1] is None:
+                continue  # hijo huérfano (antes del primer segmento padre)
+            lv = levels[depth]
+            item: Dict = {}
+            _apply(lv.own, msg.fields(i), comp_sep, item)
+            for oseg, accs in lv.other.items():
+                _apply(accs, firsts.get(oseg, []), comp_sep, item)
+            if lv.child is not None:
+                _assign(item, lv.child.assign, [])
+            if depth == 0:
+                roots.append(item)
+            else:
+                parent = open_items[depth - 1]
+                _container(parent, lv.assign).append(item)
+            open_items[depth] = item
+            for d in range(depth + 1, len(levels)):
+                open_items[d] = None
+
+        _assign(out, self.root.assign, roots)
+        return out
+
+
+def _container(item: Dict, keys: Tuple[str, ...]) -> List:
+    node = item
+    for key in keys[:-1]:
+        node = node.setdefault(key, {})
+    return node.setdefault(keys[-1], [])
+
+
+def compile_extractors(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Compila `extractors` y `group_extractors` del YAML (nombre de perfil -> plan)."""
+    plans: Dict[str, Any] = {}
+    for name, rules in (cfg.get("extractors") or {}).items():
+        plans[name] = ExtractorPlan(name, rules)
+    for name, spec in (cfg.get("group_extractors") or {}).items():
+        plans[name] = GroupedExtractorPlan(name, spec)
+    return plans
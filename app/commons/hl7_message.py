@@ -0,0 +1,205 @@
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+# Segmentos separados por CR, LF o CRLF (las líneas en blanco se omiten)
+_SEGMENT_RE = re.compile(r"[^\r\n]+")
+
+DEFAULT_SEPS = {"f": "|", "c": "^", "r": "~", "e": "\\", "s": "&"}
+
+
+def _split_with_offsets(text: str) -> Iterator[Tuple[int, str]]:
+    """(offset, línea) para cada línea; str.split en C para el caso de un solo terminador."""
+    has_cr, has_lf = "\r" in text, "\n" in text
+    if has_cr and has_lf:
+        if text.count("\r\n") != text.count("\r") or text.count("\r") != text.count("\n"):
+            # Terminadores mezclados: camino lento con regex
+            for m in _SEGMENT_RE.finditer(text):
+                yield m.start(), m.group()
+            return
+        parts, step = text.split("\r\n"), 2
+    else:
+        parts, step = text.split("\r" if has_cr else "\n"), 1
+    pos = 0
+    for part in parts:
+        yield pos, part
+        pos += len(part) + step
+
+
+class HL7Message:
+    """
+    Mensaje HL7 analizado una sola vez.
+
+    - Índice tipo de segmento -> segmentos, con su posición (start, end) en el texto original.
+    - Separadores tomados de MSH-1 (campo) y MSH-2 (caracteres de codificación).
+    - Los campos de cada segmento se materializan de forma perezosa y se cachean.
+
+    Validadores, detector de perfil, parsers y router reciben este objeto
+    en lugar de volver a partir el texto.
+    """
+
+    __slots__ = ("text", "seps", "_spans", "_types", "_index", "_segments", "_fields", "_memo")
+
+    def __init__(self, text: str):
+        self.text = text
+        spans: List[Tuple[int, int]] = []
+        types: List[str] = []
+        segments: List[str] = []
+        index: Dict[str, List[int]] = {}
+        for start, seg in _split_with_offsets(text):
+            # Omite líneas vacías o con solo espacios (equivalente a `if line.strip()`)
+            if not seg or seg.isspace():
+                continue
+            seg_type = seg[:3]
+            pos = index.get(seg_type)
+            if pos is None:
+                index[seg_type] = [len(spans)]
+            else:
+                pos.append(len(spans))
+            spans.append((start, start + len(seg)))
+            types.append(seg_type)
+            segments.append(seg)
+        self._spans = spans
+        self._types = types
+        self._index = index
+        self._segments = segments
+        self._fields: List[Optional[List[str]]] = [None] * len(spans)
+        self._memo: Optional[Dict[str, Any]] = None
+        self.seps = self._detect_seps()
+
+    @classmethod
+    def coerce(cls, hl7: Union[str, "HL7Message"]) -> "HL7Message":
+        """Acepta texto o un HL7Message ya construido (no vuelve a analizar)."""
+        if isinstance(hl7, HL7Message):
+            return hl7
+        return cls(hl7 or "")
+
+    def _detect_seps(self) -> Dict[str, str]:
+        seps = dict(DEFAULT_SEPS)
+        pos = self._index.get("MSH")
+        if not pos:
+            return seps
+        msh = self.segment(pos[0])
+        if len(msh) < 4:
+            return seps
+        field_sep = msh[3]
+        enc_end = msh.find(field_sep, 4)
+        enc = msh[4:enc_end] if enc_end != -1 else msh[4:]
+        enc = enc or "^~\\&"
+        seps["f"] = field_sep
+        seps["c"] = enc[0] if len(enc) > 0 else "^"
+        seps["r"] = enc[1] if len(enc) > 1 else "~"
+        seps["e"] = enc[2] if len(enc) > 2 else "\\"
+        seps["s"] = enc[3] if len(enc) > 3 else "&"
+        return seps
+
+    # -------- acceso a segmentos --------
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    @property
+    def segment_types(self) -> List[str]:
+        return self._types
+
+    def span(self, i: int) -> Tuple[int, int]:
+        return self._spans[i]
+
+    def segment(self, i: int) -> str:
+        return self._segments[i]
+
+    def segments(self) -> List[str]:
+        return list(self._segments)
+
+    def positions(self, seg_type: str) -> List[int]:
+        """Índices (en orden) de los segmentos del tipo dado."""
+        return self._index.get(seg_type, [])
+
+    def first(self, seg_type: str) -> Optional[int]:
+        pos = self._index.get(seg_type)
+        return pos[0] if pos else None
+
+    def has(self, seg_type: str) -> bool:
+        return seg_type in self._index
+
+    def first_segment(self, seg_type: str) -> str:
+        i = self.first(seg_type)
+        return self.segment(i) if i is not None else ""
+
+    # -------- acceso a campos --------
+
+    def fields(self, i: int) -> List[str]:
+        """Campos del segmento i (misma numeración que `seg.split('|')`)."""
+        fields = self._fields[i]
+        if fields is None:
+            fields = self._fields[i] = self.segment(i).split(self.seps["f"])
+        return fields
+
+    def first_fields(self, seg_type: str) -> List[str]:
+        i = self.first(seg_type)
+        return self.fields(i) if i is not None else []
+
+    def iter_fields(self, seg_type: str) -> Iterator[Tuple[int, List[str]]]:
+        for i in self._index.get(seg_type, ()):
+            yield i, self.fields(i)
+
+    def components(self, value: Optional[str]) -> List[str]:
+        return value.split(self.seps["c"]) if value else []
+
+    def get(self, path: str) -> Optional[str]:
+        """
+        Valor por ruta tipo 'SEG-<field>[-<component>]' (p.ej. 'OBX-3-1'),
+        tomado del primer segmento del tipo. MSH usa la numeración HL7 (MSH-2 => fields[1]).
+        """
+        parts = path.split("-")
+        if len(parts) < 2:
+            return None
+        seg = parts[0].strip().upper()
+        i = self.first(seg)
+        if i is None:
+            return None
+        return self.value_at(i, int(parts[1]), int(parts[2]) if len(parts) > 2 else None)
+
+    def value_at(self, i: int, field_no: int, comp_no: Optional[int] = None) -> Optional[str]:
+        fields = self.fields(i)
+        idx = field_no - 1 if self._types[i] == "MSH" else field_no
+        if idx < 0 or idx >= len(fields):
+            return None
+        val = fields[idx]
+        if comp_no is None:
+            return val
+        comps = val.split(self.seps["c"])
+        return comps[comp_no - 1] if 0 < comp_no <= len(comps) else None
+
+    def memo(self, key: str, build: Callable[["HL7Message"], Any]) -> Any:
+        """Dato derivado del mensaje (p.ej. histogramas decodificados), calculado una sola vez."""
+        memo = self._memo
+        if memo is None:
+            memo = self._memo = {}
+        if key not in memo:
+            memo[key] = build(self)
+        return memo[key]
+
+    # -------- atajos MSH --------
+
+    @property
+    def control_id(self) -> str:
+        """MSH-10 (message control id)."""
+        f = self.first_fields("MSH")
+        return f[9] if len(f) > 9 else ""
+
+    @property
+    def message_type(self) -> str:
+        """MSH-9 (p.ej. 'ORU^R01')."""
+        f = self.first_fields("MSH")
+        return f[8] if len(f) > 8 else ""
+
+
+def escape_hl7(value: str, seps: Dict[str, str] = DEFAULT_SEPS) -> str:
+    """Escapa separadores dentro de un valor (\\F\\ \\S\\ \\R\\ \\E\\ \\T\\)."""
+    esc = seps["e"]
+    if not value or not any(ch in value for ch in seps.values()):
+        return value
+    out = value.replace(esc, f"{esc}E{esc}")
+    for key, code in (("f", "F"), ("c", "S"), ("r", "R"), ("s", "T")):
+        out = out.replace(seps[key], f"{esc}{code}{esc}")
+    return out
@@ -1,22 +1,34 @@
-import re
-from typing import Dict
+from typing import Any, Dict, Optional, Union
 
-from app.parsers.base import detect_profile
-from app.parsers.finecare import parse_finecare
-from app.parsers.icon3 import parse_icon3
+from app.commons.hl7_message import HL7Message
 from app.parsers.models import NormalizedResult
+from app.parsers.registry import ParserRegistry
 
 
 class HL7Normalizer:
-    def __init__(self, autodetect: bool = True, override: str = ""):
+    def __init__(
+        self,
+        autodetect: bool = True,
+        override: str = "",
+        registry: Optional[ParserRegistry] = None,
+    ):
         self.autodetect = autodetect
         self.override = (override or "").upper()
+        self.registry = registry or ParserRegistry.from_config()
+        if self.override:
+            self.registry.parser(self.override)  # falla al arrancar, no con el primer mensaje
 
-    def normalize(self, hl7_text: str) -> NormalizedResult:
-        profile = self.override or (detect_profile(hl7_text) if self.autodetect else "FINECARE")
-        if profile == "ICON3":
-            return parse_icon3(hl7_text)
-        return parse_finecare(hl7_text)
+    def detect(self, hl7: Union[str, HL7Message], origin: Any = None) -> str:
+        """Perfil del mensaje. `origin` (peer o carpeta) permite reusar la detección cacheada."""
+        if self.override:
+            return self.override
+        if not self.autodetect:
+            return self.registry.default
+        return self.registry.detect(HL7Message.coerce(hl7), origin)
+
+    def normalize(self, hl7: Union[str, HL7Message], origin: Any = None) -> NormalizedResult:
+        msg = HL7Message.coerce(hl7)
+        return self.registry.parse(msg, self.detect(msg, origin))
 
     def to_sofia_payload(self, norm: NormalizedResult) -> Dict:
         """Map normalized result into a generic payload expected by SOFIA API.
@@ -57,69 +69,35 @@ class HL7Normalizer:
 
     def split_segments(self, hl7_text: str):
         """Divide en segmentos HL7 (CR/LF), omite vacíos."""
-        return [s for s in re.split(r"\r\n|\n|\r", hl7_text) if s]
+        return HL7Message.coerce(hl7_text).segments()
 
-    def _seps(self, hl7_text: str):
+    def _seps(self, hl7: Union[str, HL7Message]):
         """
         Detecta separadores desde MSH:
         - field sep = MSH[3]
         - encoding chars (MSH-2): comp, rept, esc, subcomp
         """
-        first_msh = next((s for s in self.split_segments(hl7_text) if s.startswith("MSH")), "")
-        # Defaults HL7
-        seps = {"f": "|", "c": "^", "r": "~", "e": "\\", "s": "&"}
-        if not first_msh or len(first_msh) < 4:
-            return seps
-        field_sep = first_msh[3]
-        fields = first_msh.split(field_sep)
-        enc = fields[1] if len(fields) > 1 else "^~\\&"
-        comp = enc[0] if len(enc) > 0 else "^"
-        rept = enc[1] if len(enc) > 1 else "~"
-        esc = enc[2] if len(enc) > 2 else "\\"
-        sub = enc[3] if len(enc) > 3 else "&"
-        return {"f": field_sep, "c": comp, "r": rept, "e": esc, "s": sub}
+        return dict(HL7Message.coerce(hl7).seps)
 
-    def get_value_from_hl7(self, hl7_text: str, path: str):
+    def get_value_from_hl7(self, hl7: Union[str, HL7Message], path: str):
         """
         Extrae un valor por ruta tipo 'SEG-<field>[-<component>]',
         e.g. 'OBX-3-1'. Respeta separadores detectados.
+        Pasar un HL7Message evita volver a partir el texto en cada ruta.
         """
-        seps = self._seps(hl7_text)
-        f, c = seps["f"], seps["c"]
-        parts = path.split("-")
-        seg = parts[0].strip().upper()
-        if len(parts) < 2:
-            return None
-        field_idx = int(parts[1])
-        comp_idx = int(parts[2]) - 1 if len(parts) > 2 else None
-
-        seg_line = next(
-            (line for line in self.split_segments(hl7_text) if line.startswith(seg + f)), None
-        )
-        if not seg_line:
-            return None
-
-        fields = seg_line.split(f)
-        # Nota: Para MSH la numeración HL7 está desplazada (MSH-2 => fields[1])
-        idx = field_idx - 1 if seg == "MSH" else field_idx
-        if idx < 0 or idx >= len(fields):
-            return None
-        val = fields[idx]
-        if comp_idx is not None:
-            comps = val.split(c) if val is not None else []
-            return comps[comp_idx] if 0 <= comp_idx < len(comps) else None
-        return val
+        return HL7Message.coerce(hl7).get(path)
 
-    def extract(self, profile, hl7_text: str):
+    def extract(self, profile, hl7: Union[str, HL7Message]):
         """
         Soporte simple: si 'profile' es { key: 'SEG-x-y' | [paths] } devuelve dict con valores.
         (Back-compat para tests/routers que llamen engine.extract)
         """
+        msg = HL7Message.coerce(hl7)
         out = {}
         if isinstance(profile, dict):
             for k, p in profile.items():
                 if isinstance(p, str):
-                    out[k] = self.get_value_from_hl7(hl7_text, p)
+                    out[k] = msg.get(p)
                 elif isinstance(p, (list, tuple)):
-                    out[k] = [self.get_value_from_hl7(hl7_text, q) for q in p]
+                    out[k] = [msg.get(q) for q in p]
         return out
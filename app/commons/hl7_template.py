@@ -0,0 +1,307 @@
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.commons.hl7_message import DEFAULT_SEPS, escape_hl7
+
+# @NOMBRE (mapping) o @THIS.ruta (campo del item actual de un for_each)
+_TOKEN_RE = re.compile(r"@(THIS\.[A-Za-z_][\w.\[\]]*|[A-Z_][A-Z0-9_]*)")
+_STEP_RE = re.compile(r"([^.\[\]]+)|\[(\d+)\]")
+
+# Formatos de entrada aceptados por datefmt (el payload del HIS no es uniforme)
+_DATE_INPUTS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%Y%m%d%H%M%S",
+    "%Y%m%d%H%M",
+    "%Y%m%d",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y",
+)
+
+MISSING_POLICIES = ("error", "empty", "keep")
+
+Resolver = Callable[[Any, Any], str]
+
+
+class TemplateError(ValueError):
+    """Plantilla mal definida (al compilar) o dato faltante con missing_placeholder=error."""
+
+
+def _compile_path(path: str) -> Tuple:
+    """'ordenes[0].orden_id' -> ('ordenes', 0, 'orden_id')."""
+    steps = []
+    for key, idx in _STEP_RE.findall(path):
+        steps.append(int(idx) if idx else key)
+    if not steps:
+        raise TemplateError(f"Ruta vacía o inválida: {path!r}")
+    return tuple(steps)
+
+
+def _lookup(obj: Any, steps: Tuple) -> Any:
+    for step in steps:
+        if obj is None:
+            return None
+        if isinstance(step, int):
+            obj = obj[step] if isinstance(obj, (list, tuple)) and step < len(obj) else None
+        elif isinstance(obj, dict):
+            obj = obj.get(step)
+        else:
+            obj = getattr(obj, step, None)
+    return obj
+
+
+def _parse_date(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return _parse_date_text(str(value).strip())
+
+
+@lru_cache(maxsize=4096)
+def _parse_date_text(text: str) -> Optional[datetime]:
+    # Las fechas se repiten mucho entre órdenes de un lote; strptime es caro
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    for fmt in _DATE_INPUTS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def compile_transform(spec: str) -> Callable[[Any], Any]:
+    name, _, arg = str(spec).partition(":")
+    if name == "upper":
+        return lambda v: str(v).upper()
+    if name == "lower":
+        return lambda v: str(v).lower()
+    if name == "trim":
+        return lambda v: str(v).strip()
+    if name == "datefmt":
+        if not arg:
+            raise TemplateError("datefmt requiere formato (p.ej. datefmt:%Y%m%d)")
+
+        def datefmt(v):
+            dt = _parse_date(v)
+            # Si no se reconoce la fecha se deja el valor tal cual (mejor que perder el dato)
+            return dt.strftime(arg) if dt is not None else str(v)
+
+        return datefmt
+    if name == "datefmt_in":
+        # Extractores: fecha HL7 -> datetime (si no calza el formato, queda el texto)
+        if not arg:
+            raise TemplateError("datefmt_in requiere formato")
+
+        @lru_cache(maxsize=4096)
+        def parse(text: str) -> Optional[datetime]:
+            try:
+                return datetime.strptime(text, arg)
+            except ValueError:
+                return None
+
+        def datefmt_in(v):
+            if isinstance(v, datetime):
+                return v
+            dt = parse(str(v).strip())
+            return v if dt is None else dt
+
+        return datefmt_in
+    if name == "datefmt_out":
+        if not arg:
+            raise TemplateError("datefmt_out requiere formato")
+        return lambda v: v.strftime(arg) if isinstance(v, datetime) else v
+    raise TemplateError(f"Transformación desconocida: {spec!r}")
+
+
+class CompiledTemplate:
+    """
+    Plantilla ya compilada: lista de nodos (línea o for_each) sin YAML ni regex en render.
+
+    Cada línea es una tupla de literales y otra de resolvers (closures); renderizar
+    es intercalarlos y hacer un join.
+    """
+
+    __slots__ = ("name", "nodes", "terminator")
+
+    def __init__(self, name: str, nodes: List, terminator: str = "\r"):
+        self.name = name
+        self.nodes = nodes
+        self.terminator = terminator
+
+    def render(self, data: Any) -> str:
+        out: List[str] = []
+        self._emit(self.nodes, data, None, out)
+        out.append("")
+        return self.terminator.join(out)
+
+    def _emit(self, nodes: List, data: Any, item: Any, out: List[str]):
+        for node in nodes:
+            if node[0] == "line":
+                literals, resolvers = node[1], node[2]
+                if not resolvers:
+                    out.append(literals[0])
+                    continue
+                parts = [literals[0]]
+                for resolve, lit in zip(resolvers, literals[1:]):
+                    parts.append(resolve(data, item))
+                    parts.append(lit)
+                out.append("".join(parts))
+            else:  # for_each
+                items = _lookup(data, node[1]) or ()
+                for child in items:
+                    self._emit(node[2], data, child, out)
+
+
+class TemplateCompiler:
+    """
+    Compila los bloques `templates`, `mappings`, `defaults` y `options` del YAML
+    (template_reader_orm_hl7.yaml) a CompiledTemplate, una sola vez.
+    """
+
+    def __init__(self, cfg: Dict[str, Any]):
+        hl7 = cfg.get("hl7") or {}
+        self.seps = {
+            "f": hl7.get("field_sep", DEFAULT_SEPS["f"]),
+            "c": hl7.get("comp_sep", DEFAULT_SEPS["c"]),
+            "r": hl7.get("rep_sep", DEFAULT_SEPS["r"]),
+            "e": hl7.get("esc", DEFAULT_SEPS["e"]),
+            "s": hl7.get("subcomp_sep", DEFAULT_SEPS["s"]),
+        }
+        options = cfg.get("options") or {}
+        self.missing = str(options.get("missing_placeholder", "error")).lower()
+        if self.missing not in MISSING_POLICIES:
+            raise TemplateError(
+                f"missing_placeholder inválido: {self.missing!r} "
+                f"(use {', '.join(MISSING_POLICIES)})"
+            )
+        self.escape = bool(options.get("escape_at", True))
+        self._finish = _make_finisher(self.seps, self.escape)
+        self.defaults = cfg.get("defaults") or {}
+        self.mappings = cfg.get("mappings") or {}
+        self.templates = cfg.get("templates") or {}
+        self._resolvers: Dict[str, Resolver] = {}
+
+    def compile_all(self) -> Dict[str, CompiledTemplate]:
+        return {name: self.compile(name) for name in self.templates}
+
+    def compile(self, name: str) -> CompiledTemplate:
+        if name not in self.templates:
+            raise TemplateError(f"Plantilla no definida: {name!r}")
+        return CompiledTemplate(name, self._compile_nodes(self.templates[name], name))
+
+    # -------- compilación --------
+
+    def _compile_nodes(self, lines: List, where: str) -> List:
+        nodes = []
+        for line in lines or ():
+            if isinstance(line, dict) and "for_each" in line:
+                path = _compile_path(str(line["for_each"]).removeprefix("DATA:"))
+                nodes.append(("for_each", path, self._compile_nodes(line.get("lines"), where)))
+            elif isinstance(line, str):
+                nodes.append(self._compile_line(line, where))
+            else:
+                raise TemplateError(f"{where}: línea no soportada: {line!r}")
+        return nodes
+
+    def _compile_line(self, line: str, where: str) -> Tuple:
+        literals: List[str] = []
+        resolvers: List[Resolver] = []
+        pos = 0
+        for m in _TOKEN_RE.finditer(line):
+            literals.append(line[pos : m.start()])
+            resolvers.append(self._token_resolver(m.group(1), where))
+            pos = m.end()
+        literals.append(line[pos:])
+        return ("line", tuple(literals), tuple(resolvers))
+
+    def _token_resolver(self, token: str, where: str) -> Resolver:
+        if token.startswith("THIS."):
+            path = token[5:]
+            return self._make_resolver(token, _compile_path(path), on_item=True)
+        if token in self._resolvers:
+            return self._resolvers[token]
+        mapping = self.mappings.get(token)
+        if mapping is None:
+            # Sin mapping: con "error" falla al compilar; si no, se trata como dato faltante
+            if self.missing == "error":
+                raise TemplateError(f"{where}: @{token} no tiene mapping")
+            literal = f"@{token}" if self.missing == "keep" else ""
+            return lambda data, item: literal
+        if isinstance(mapping, str):
+            mapping = {"source": mapping}
+        source = str(mapping.get("source", ""))
+        if source.startswith("DATA:"):
+            steps = _compile_path(source[5:])
+        elif source.startswith("CONST:"):
+            const = self._finish(source[6:])
+            return lambda data, item: const
+        else:
+            raise TemplateError(f"{where}: source no soportado en {token}: {source!r}")
+        transforms = [compile_transform(t) for t in mapping.get("transforms") or ()]
+        resolver = self._make_resolver(token, steps, transforms=transforms)
+        self._resolvers[token] = resolver
+        return resolver
+
+    def _make_resolver(
+        self, token: str, steps: Tuple, on_item: bool = False, transforms=()
+    ) -> Resolver:
+        # Todo lo que depende solo de la config se decide aquí, no en cada render
+        default = self.defaults.get(steps[-1]) if isinstance(steps[-1], str) else None
+        missing = self.missing
+        placeholder = f"@{token}"
+        finish = self._finish
+        transforms = tuple(transforms)
+        get = _compile_getter(steps)
+
+        def resolve(data, item):
+            value = get(item if on_item else data)
+            if value is None or value == "":
+                value = default
+                if value is None:
+                    if missing == "error":
+                        raise TemplateError(f"Dato faltante para {placeholder}")
+                    return "" if missing == "empty" else placeholder
+            for fn in transforms:
+                value = fn(value)
+            return finish(value)
+
+        return resolve
+
+
+def _compile_getter(steps: Tuple) -> Callable[[Any], Any]:
+    """Acceso especializado: una clave de dict (el caso común) no pasa por el bucle genérico."""
+    if len(steps) == 1 and isinstance(steps[0], str):
+        key = steps[0]
+
+        def get_one(obj):
+            if obj.__class__ is dict:
+                return obj.get(key)
+            return _lookup(obj, steps)
+
+        return get_one
+    return lambda obj: _lookup(obj, steps)
+
+
+def _make_finisher(seps: Dict[str, str], escape: bool) -> Callable[[Any], str]:
+    if not escape:
+        return lambda value: value if value.__class__ is str else str(value)
+    esc = seps["e"]
+    # Un solo search en C decide si hace falta escapar (casi nunca)
+    needs_escape = re.compile("[" + re.escape("".join(seps.values())) + "\r\n]").search
+
+    def finish(value: Any) -> str:
+        text = value if value.__class__ is str else str(value)
+        if needs_escape(text) is None:
+            return text
+        text = escape_hl7(text, seps)
+        return text.replace("\r", f"{esc}X0D{esc}").replace("\n", f"{esc}X0A{esc}")
+
+    return finish
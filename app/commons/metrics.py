@@ -0,0 +1,281 @@
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from app.commons.logger import logger
+
+PathLike = Union[str, Path]
+
+# Segundos: de 100 µs (validar un mensaje) a 10 s (un write con fsync atascado)
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+
+DEFAULT_SNAPSHOT_SEC = 30.0
+
+# Etapas de stage_seconds; "pool" reemplaza a validate..serialize en modo process
+STAGES = (
+    "frame", "archive", "validate", "detect", "parse", "serialize",
+    "histograms", "write", "pool", "total",
+)  # fmt: skip
+
+_HELP = {
+    "stage_seconds": "Latencia por etapa del procesamiento de resultados",
+    "results_total": "Resultados procesados por analizador y código de ACK",
+    "errors_total": "Errores por etapa y clase de excepción",
+    "duplicates_total": "Duplicados respondidos con el ACK original",
+    "queue_depth": "Elementos esperando en cada cola",
+    "mllp_connections": "Conexiones MLLP abiertas",
+    "in_flight": "Mensajes en proceso",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size  # por bucket (no acumulado), más +Inf al final
+        self.sum = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """
+    Contadores, gauges e histogramas en memoria, pensados para dejarlos siempre activos.
+
+    - Se actualizan solo desde el event loop (sin locks): un `inc`/`observe` es un
+      acceso a dict y un bisect.
+    - Los gauges son callbacks que se evalúan al exportar (profundidad de colas,
+      conexiones abiertas), así no cuestan nada por mensaje.
+    - `render()` produce el formato de texto de Prometheus; `snapshot()` un dict.
+    """
+
+    def __init__(
+        self, prefix: str = "lab_integrator", buckets=DEFAULT_BUCKETS, enabled: bool = True
+    ):
+        self.prefix = prefix
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        self.enabled = enabled
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._gauges: Dict[str, List[Tuple[Labels, Callable[[], float]]]] = {}
+        self._stages: Dict[str, _Histogram] = {}  # atajo de lap(): sin armar la tupla de labels
+        self.started_at = time.time()
+
+    # -------- registro --------
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def _histogram(self, name: str, labels: Labels) -> _Histogram:
+        series = self._histograms.setdefault(name, {})
+        h = series.get(labels)
+        if h is None:
+            h = series[labels] = _Histogram(len(self.buckets) + 1)
+        return h
+
+    def _record(self, h: _Histogram, seconds: float):
+        h.counts[bisect_left(self.buckets, seconds)] += 1
+        h.sum += seconds
+        h.count += 1
+
+    def observe(self, name: str, seconds: float, **labels):
+        if self.enabled:
+            self._record(self._histogram(name, tuple(sorted(labels.items()))), seconds)
+
+    def lap(self, stage: str, t0: float) -> float:
+        """Registra la etapa desde `t0` y retorna el instante actual (inicio de la siguiente)."""
+        now = time.perf_counter()
+        if self.enabled:
+            h = self._stages.get(stage)
+            if h is None:
+                h = self._stages[stage] = self._histogram("stage_seconds", (("stage", stage),))
+            self._record(h, now - t0)
+        return now
+
+    def gauge(self, name: str, fn: Callable[[], float], **labels):
+        self._gauges.setdefault(name, []).append((tuple(sorted(labels.items())), fn))
+
+    # -------- exportación --------
+
+    def _gauge_values(self):
+        for name, items in self._gauges.items():
+            for labels, fn in items:
+                try:
+                    yield name, labels, float(fn())
+                except Exception as ex:
+                    logger.debug(f"Gauge {name} falló: {ex}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        def key(labels: Labels) -> str:
+            return ",".join(f"{k}={v}" for k, v in labels) or "_"
+
+        stages = {}
+        for name, series in self._histograms.items():
+            for labels, h in series.items():
+                stages.setdefault(name, {})[key(labels)] = {
+                    "count": h.count,
+                    "avg_ms": round(h.sum / h.count * 1000, 3) if h.count else 0.0,
+                    "p50_ms": self._quantile(h, 0.5),
+                    "p99_ms": self._quantile(h, 0.99),
+                }
+        counters = {
+            name: {key(labels): value for labels, value in series.items()}
+            for name, series in self._counters.items()
+        }
+        gauges: Dict[str, Dict[str, float]] = {}
+        for name, labels, value in self._gauge_values():
+            gauges.setdefault(name, {})[key(labels)] = value
+        return {"histograms": stages, "counters": counters, "gauges": gauges}
+
+    def _quantile(self, h: _Histogram, q: float) -> Optional[float]:
+        """Cota superior del bucket donde cae el cuantil q (en ms)."""
+        if not h.count:
+            return None
+        target = q * h.count
+        seen = 0
+        for bound, n in zip(self.buckets, h.counts):
+            seen += n
+            if seen >= target:
+                return bound * 1000
+        return None  # por encima del último bucket
+
+    def render(self) -> str:
+        """Formato de texto de Prometheus (exposition format 0.0.4)."""
+        out: List[str] = []
+        p = self.prefix
+
+        def head(name: str, kind: str):
+            out.append(f"# HELP {p}_{name} {_HELP.get(name, name)}")
+            out.append(f"# TYPE {p}_{name} {kind}")
+
+        for name, series in self._counters.items():
+            head(name, "counter")
+            for labels, value in series.items():
+                out.append(f"{p}_{name}{_labels(labels)} {_num(value)}")
+        gauges: Dict[str, List[str]] = {}
+        for name, labels, value in self._gauge_values():
+            gauges.setdefault(name, []).append(f"{p}_{name}{_labels(labels)} {_num(value)}")
+        for name, lines in gauges.items():
+            head(name, "gauge")
+            out.extend(lines)
+        for name, series in self._histograms.items():
+            head(name, "histogram")
+            for labels, h in series.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets, h.counts):
+                    cumulative += n
+                    le = labels + (("le", _num(bound)),)
+                    out.append(f"{p}_{name}_bucket{_labels(le)} {cumulative}")
+                le = labels + (("le", "+Inf"),)
+                out.append(f"{p}_{name}_bucket{_labels(le)} {h.count}")
+                out.append(f"{p}_{name}_sum{_labels(labels)} {h.sum!r}")
+                out.append(f"{p}_{name}_count{_labels(labels)} {h.count}")
+        out.append(f"# TYPE {p}_uptime_seconds gauge")
+        out.append(f"{p}_uptime_seconds {time.time() - self.started_at:.3f}")
+        return "\n".join(out) + "\n"
+
+
+def _escape(value: Any) -> str:
+    """Escapa barra invertida, comillas y saltos de línea (hay valores que vienen de MSH-3)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _num(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def write_snapshot(path: PathLike, data: Dict[str, Any]):
+    """JSON atómico (tmp + os.replace): quien lo lea nunca ve un archivo a medias."""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp, p)
+
+
+class MetricsServer:
+    """
+    Endpoint HTTP mínimo en el mismo event loop (sin dependencias):
+    GET /metrics -> texto Prometheus; GET /stats -> JSON con `stats_fn()` y el snapshot.
+    Pensado para escuchar en localhost y ser leído por un agente/scraper local.
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        host: str = "127.0.0.1",
+        port: int = 9464,
+        stats_fn: Optional[Callable[[], Dict[str, Any]]] = None,
+    ):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.stats_fn = stats_fn
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Métricas en http://{self.host}:{port}/metrics")
+        return self._server
+
+    async def aclose(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+            except asyncio.LimitOverrunError:
+                request = None  # cabeceras por encima del límite del StreamReader (64 KiB)
+            parts = request.split(b" ", 2) if request is not None else []
+            method = parts[0] if parts else b""
+            path = parts[1].split(b"?", 1)[0] if len(parts) > 1 else b""
+            if request is None:
+                status, ctype, body = "400 Bad Request", "text/plain", "cabeceras muy grandes\n"
+            elif method != b"GET":
+                status, ctype, body = "405 Method Not Allowed", "text/plain", "solo GET\n"
+            elif path == b"/metrics":
+                status, ctype = "200 OK", "text/plain; version=0.0.4; charset=utf-8"
+                body = self.metrics.render()
+            elif path == b"/stats":
+                data = {"metrics": self.metrics.snapshot()}
+                if self.stats_fn is not None:
+                    data["stats"] = self.stats_fn()
+                status, ctype = "200 OK", "application/json; charset=utf-8"
+                body = json.dumps(data, ensure_ascii=False, default=str)
+            else:
+                status, ctype, body = "404 Not Found", "text/plain", "use /metrics o /stats\n"
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("ascii")
+                + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,152 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+
+from app.commons.histograms import attach_metrics
+from app.commons.hl7_engine import HL7Engine
+from app.commons.hl7_message import HL7Message
+from app.commons.logger import logger
+
+# Motor propio de cada proceso worker (se construye una vez en el initializer)
+_engine: Optional[HL7Engine] = None
+# Métricas de histogramas por lote (None = deshabilitadas): {"fl_per_bin": {...}}
+_histogram_metrics: Optional[Dict[str, Any]] = None
+
+
+class InvalidResultError(ValueError):
+    """Validación fallida dentro de un worker (el ValidationError de pydantic no cruza procesos)."""
+
+
+def _init_worker(engine_cfg: Dict[str, Any], histogram_metrics: Optional[Dict] = None):
+    global _engine, _histogram_metrics
+    _engine = HL7Engine(engine_cfg)
+    _histogram_metrics = histogram_metrics
+
+
+def _warmup(delay: float) -> int:
+    # Mantiene ocupado al worker un instante para forzar que el pool arranque todos los procesos
+    time.sleep(delay)
+    return os.getpid()
+
+
+def validate_and_map(hl7: Union[str, HL7Message], origin: Any = None) -> Dict:
+    """Trabajo CPU de un mensaje: indexar, validar, normalizar y mapear a payload SOFIA."""
+    msg = HL7Message.coerce(hl7)
+    try:
+        _engine.validate(msg, origin)
+    except ValidationError as ve:
+        raise InvalidResultError(str(ve)) from None
+    return _engine.parse_and_map(msg, origin)
+
+
+def validate_and_map_batch(items: List[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+    """
+    Lote de (texto, origen) en un solo viaje al worker.
+    Retorna ("ok", payload) | ("invalid"|"error", texto) por mensaje.
+    Cada worker tiene su propia caché de detección por origen.
+    """
+    out: List[Tuple[str, Any]] = []
+    mapped: List[Tuple[Dict, HL7Message]] = []
+    for text, origin in items:
+        msg = HL7Message(text)
+        try:
+            out.append(("ok", validate_and_map(msg, origin)))
+            mapped.append((out[-1][1], msg))
+        except InvalidResultError as ex:
+            out.append(("invalid", str(ex)))
+        except Exception as ex:
+            out.append(("error", f"{type(ex).__name__}: {ex}"))
+    if _histogram_metrics is not None and mapped:
+        # Vectorizado sobre todo el lote (una matriz N x 256 por tipo de histograma)
+        attach_metrics(mapped, _histogram_metrics.get("fl_per_bin"))
+    return out
+
+
+class ParsePool:
+    """
+    Modo opcional de parseo en procesos.
+
+    - `ProcessPoolExecutor` con contexto spawn (igual en Linux y Windows/PyInstaller).
+    - Cada worker carga la config del motor una sola vez al arrancar.
+    - Solo cruzan la frontera el texto HL7 (ida) y el payload ya mapeado (vuelta).
+    - Mientras todos los procesos están ocupados, los mensajes que llegan se
+      agrupan en lotes (hasta `batch_size`) para repartir el costo fijo de IPC.
+    """
+
+    def __init__(
+        self,
+        engine_cfg: Dict[str, Any],
+        workers: Optional[int] = None,
+        batch_size: int = 32,
+        histogram_metrics: Optional[Dict[str, Any]] = None,
+    ):
+        self.engine_cfg = engine_cfg or {}
+        self.histogram_metrics = histogram_metrics
+        self.workers = int(workers or os.cpu_count() or 1)
+        self.batch_size = max(1, int(batch_size))
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self._pending: List[Tuple[Tuple[str, Any], asyncio.Future]] = []
+        self._inflight = 0
+
+    def start(self):
+        if self.executor is not None:
+            return
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.engine_cfg, self.histogram_metrics),
+        )
+        # Pre-calentado: arranca todos los procesos antes del primer mensaje
+        t0 = time.perf_counter()
+        pids = set(self.executor.map(_warmup, [0.05] * self.workers))
+        logger.info(f"ParsePool listo: {len(pids)} proceso(s) en {time.perf_counter() - t0:.2f}s")
+
+    async def validate_and_map(self, hl7_text: str, origin: Any = None) -> Dict:
+        if self.executor is None:
+            self.start()
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append(((hl7_text, origin), fut))
+        self._dispatch()
+        return await fut
+
+    def _dispatch(self):
+        # Con un worker libre se envía de inmediato; si todos están ocupados los mensajes
+        # se acumulan y salen juntos (hasta batch_size) cuando alguno termina
+        while self._pending and self._inflight < self.workers:
+            batch = self._pending[: self.batch_size]
+            del self._pending[: self.batch_size]
+            self._inflight += 1
+            cf = self.executor.submit(validate_and_map_batch, [item for item, _ in batch])
+            asyncio.wrap_future(cf).add_done_callback(
+                lambda done, batch=batch: self._resolve(batch, done)
+            )
+
+    def _resolve(self, batch, done: asyncio.Future):
+        self._inflight -= 1
+        self._dispatch()
+        if done.cancelled() or done.exception() is not None:
+            err = done.exception() if not done.cancelled() else RuntimeError("lote cancelado")
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(err)
+            return
+        for (_, fut), (status, value) in zip(batch, done.result()):
+            if fut.done():
+                continue
+            if status == "ok":
+                fut.set_result(value)
+            elif status == "invalid":
+                fut.set_exception(InvalidResultError(value))
+            else:
+                fut.set_exception(RuntimeError(value))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
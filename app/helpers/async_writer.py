@@ -0,0 +1,220 @@
+import asyncio
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from app.commons.logger import logger
+from app.helpers.group_commit import call_in_loop, set_future
+
+PathLike = Union[str, Path]
+
+
+def _write_text(path: PathLike, text: str, fsync: bool = False) -> str:
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    with open(p, "w", encoding="utf-8") as f:
+        f.write(text)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    return str(p)
+
+
+def _append_text(path: PathLike, text: str, fsync: bool = False) -> str:
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    with open(p, "a", encoding="utf-8") as f:
+        f.write(text)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    return str(p)
+
+
+def _append_bytes(path: PathLike, data: bytes, fsync: bool = False) -> str:
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    with open(p, "ab") as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    return str(p)
+
+
+def _write_json(path: PathLike, data: Any, indent: Optional[int] = 2) -> str:
+    # La serialización también corre en el hilo de escritura (es CPU pura)
+    return _write_text(path, json.dumps(data, ensure_ascii=False, indent=indent))
+
+
+def _move(src: PathLike, dst: PathLike) -> str:
+    d = Path(dst)
+    d.parent.mkdir(parents=True, exist_ok=True)
+    return str(shutil.move(str(src), str(d)))
+
+
+def _noop() -> None:
+    return None
+
+
+class AsyncFileWriter:
+    """
+    Escrituras de archivos fuera del event loop.
+
+    - N hilos de escritura, cada uno con su cola FIFO.
+    - Cada operación se asigna a un hilo según su destino, así dos escrituras
+      al mismo archivo se ejecutan siempre en el orden en que se encolaron.
+    - `max_pending` acota las operaciones en vuelo; al llenarse, `submit`
+      espera (sin bloquear el loop) hasta que haya cupo.
+    """
+
+    def __init__(self, workers: int = 1, max_pending: int = 1000, name: str = "writer"):
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.name = name
+        self._queues: List[queue.SimpleQueue] = [queue.SimpleQueue() for _ in range(self.workers)]
+        self._threads: List[threading.Thread] = []
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._closed = False
+        # stats
+        self._pending = 0
+        self._max_pending_seen = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    # -------- ciclo de vida --------
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        for i, q in enumerate(self._queues):
+            t = threading.Thread(target=self._run, args=(q,), name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    async def flush(self):
+        """Espera a que termine todo lo encolado hasta ahora (barrera por hilo)."""
+        if not self._threads:
+            return
+        barriers = [await self._submit_to(i, _noop) for i in range(self.workers)]
+        await asyncio.gather(*barriers, return_exceptions=True)
+
+    async def aclose(self):
+        """Vacía las colas y detiene los hilos."""
+        if self._closed:
+            return
+        await self.flush()
+        self._closed = True
+        for q in self._queues:
+            q.put(None)
+        for t in self._threads:
+            await asyncio.to_thread(t.join)
+        self._threads = []
+        logger.info(f"Writer '{self.name}' cerrado: {self.stats()}")
+
+    # -------- envío de operaciones --------
+
+    def _shard(self, key: str) -> int:
+        if self.workers == 1:
+            return 0
+        # crc32 es estable entre procesos (hash() de str no lo es)
+        return zlib.crc32(key.encode("utf-8")) % self.workers
+
+    async def submit(self, key: PathLike, fn: Callable, *args) -> asyncio.Future:
+        """
+        Encola `fn(*args)` en el hilo asignado a `key` y retorna un Future
+        que se resuelve con el resultado (o la excepción) de la operación.
+        """
+        if self._closed:
+            raise RuntimeError(f"Writer '{self.name}' cerrado")
+        return await self._submit_to(self._shard(str(key)), fn, *args)
+
+    async def _submit_to(self, shard: int, fn: Callable, *args) -> asyncio.Future:
+        self._ensure_started()
+        await self._slots.acquire()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+            self._max_pending_seen = max(self._max_pending_seen, self._pending)
+        self._queues[shard].put((fn, args, fut, loop, time.perf_counter()))
+        return fut
+
+    async def write_text(self, path: PathLike, text: str, wait: bool = True, fsync: bool = False):
+        fut = await self.submit(path, _write_text, path, text, fsync)
+        return await fut if wait else fut
+
+    async def append_text(self, path: PathLike, text: str, wait: bool = True, fsync: bool = False):
+        fut = await self.submit(path, _append_text, path, text, fsync)
+        return await fut if wait else fut
+
+    async def append_bytes(self, path: PathLike, data: bytes, wait: bool = True, fsync=False):
+        fut = await self.submit(path, _append_bytes, path, data, fsync)
+        return await fut if wait else fut
+
+    async def write_json(self, path: PathLike, data: Any, wait: bool = True, indent=2):
+        fut = await self.submit(path, _write_json, path, data, indent)
+        return await fut if wait else fut
+
+    async def move(self, src: PathLike, dst: PathLike, wait: bool = True):
+        fut = await self.submit(dst, _move, src, dst)
+        return await fut if wait else fut
+
+    # -------- hilo de escritura --------
+
+    def _run(self, q: queue.SimpleQueue):
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            fn, args, fut, loop, t0 = item
+            result, error = None, None
+            try:
+                result = fn(*args)
+            except Exception as ex:
+                error = ex
+                logger.error(f"Writer '{self.name}': fallo en {getattr(fn, '__name__', fn)}: {ex}")
+            latency = time.perf_counter() - t0
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+                self._failed += 1 if error else 0
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+            call_in_loop(loop, self._resolve, fut, result, error)
+
+    def _resolve(self, fut: asyncio.Future, result, error):
+        self._slots.release()
+        if fut.done():
+            return
+        set_future(fut, result, error)
+        if error is not None:
+            # Ya quedó en el log; evita el aviso de "exception was never retrieved"
+            fut.exception()
+
+    # -------- métricas --------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            done = self._completed or 1
+            return {
+                "workers": self.workers,
+                "queue_depth": self._pending,
+                "max_queue_depth": self._max_pending_seen,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_latency_ms": round(self._latency_total / done * 1000, 3),
+                "max_latency_ms": round(self._latency_max * 1000, 3),
+            }
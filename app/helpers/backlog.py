@@ -0,0 +1,123 @@
+import asyncio
+import fnmatch
+import itertools
+import os
+from pathlib import Path
+from typing import AsyncIterator, Iterator, List, Optional, Set
+
+MANIFEST_NAME = "backlog.manifest"  # en logs_root, fuera del inbox que se escanea
+LEGACY_MANIFEST_NAME = ".backlog.manifest"  # versiones anteriores lo dejaban en el inbox
+
+
+def iter_inbox(inbox: Path, glob_pat: str) -> Iterator[os.DirEntry]:
+    """Recorre la carpeta en streaming (sin materializar ni ordenar el listado completo)."""
+    with os.scandir(inbox) as it:
+        for entry in it:
+            if fnmatch.fnmatch(entry.name, glob_pat) and entry.is_file():
+                yield entry
+
+
+async def scan_inbox(inbox: Path, glob_pat: str, batch: int = 512) -> AsyncIterator[os.DirEntry]:
+    """`iter_inbox` desde el event loop: cada lote de entradas se lee en un hilo."""
+    it = iter_inbox(inbox, glob_pat)
+    try:
+        while True:
+            entries = await asyncio.to_thread(lambda: list(itertools.islice(it, batch)))
+            if not entries:
+                return
+            for entry in entries:
+                yield entry
+    finally:
+        it.close()
+
+
+class BacklogManifest:
+    """
+    Registro persistente de archivos del backlog ya procesados.
+
+    Los exitosos salen del inbox (se mueven a archive/hl7), pero los rechazados (AR)
+    quedan ahí; el manifiesto evita reprocesarlos tras un reinicio y permite
+    reanudar un drenado interrumpido. Solo se registran resultados definitivos: un
+    AE (transitorio) o un drenado cancelado se reintenta en el próximo arranque.
+    Formato: un nombre de archivo por línea.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        writer,
+        flush_every: int = 256,
+        enabled: bool = True,
+        legacy_path: Optional[Path] = None,
+    ):
+        self.path = Path(path)
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self.writer = writer
+        self.enabled = enabled
+        self.flush_every = max(1, int(flush_every))
+        self.done: Set[str] = set()
+        self._buffer: List[str] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def load(self) -> int:
+        if not self.enabled:
+            return 0
+        if self.path.exists():
+            self.done = self._read(self.path)
+        if self.legacy_path is not None and self.legacy_path.exists():
+            # Migra el manifiesto viejo antes de escanear (con un glob "*" se leería como HL7)
+            self.done |= self._read(self.legacy_path)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text("".join(f"{n}\n" for n in sorted(self.done)), encoding="utf-8")
+            self.legacy_path.unlink()
+        return len(self.done)
+
+    @staticmethod
+    def _read(path: Path) -> Set[str]:
+        with open(path, "r", encoding="utf-8") as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.done
+
+    async def record(self, name: str):
+        if not self.enabled:
+            return
+        self.done.add(name)
+        self._buffer.append(name)
+        if len(self._buffer) >= self.flush_every:
+            await self.flush()
+
+    def add(self, name: str):
+        """Como `record`, desde un callback (entrada del watcher): el flush va en una tarea."""
+        if not self.enabled:
+            return
+        self.done.add(name)
+        self._buffer.append(name)
+        if len(self._buffer) >= self.flush_every and self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self.flush())
+            self._flush_task.add_done_callback(self._flushed)
+
+    def _flushed(self, task: asyncio.Task):
+        self._flush_task = None
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        await self.writer.append_text(self.path, "".join(f"{n}\n" for n in lines), wait=False)
+
+    async def aclose(self):
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
+
+    async def compact(self, inbox: Path):
+        """Deja solo los nombres que siguen en el inbox (los demás ya no hacen falta)."""
+        if not self.enabled:
+            return
+        await self.flush()
+        inbox = Path(inbox)
+        self.done = await asyncio.to_thread(lambda: {n for n in self.done if (inbox / n).exists()})
+        text = "".join(f"{n}\n" for n in sorted(self.done))
+        await self.writer.write_text(self.path, text)
@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from app.commons.hl7_message import HL7Message
+from app.commons.logger import logger
+
+PathLike = Union[str, Path]
+
+DEFAULT_TTL_SEC = 24 * 3600
+DEFAULT_MAX_ENTRIES = 100_000
+
+
+def message_key(hl7: Union[str, HL7Message]) -> str:
+    """(emisor MSH-3^MSH-4, MSH-10, hash del contenido) como una sola cadena."""
+    msg = HL7Message.coerce(hl7)
+    f = msg.first_fields("MSH")
+    sender = f"{f[2] if len(f) > 2 else ''}^{f[3] if len(f) > 3 else ''}"
+    # blake2b de 64 bits: el MSH-10 solo no basta (hay equipos que reinician el contador)
+    digest = hashlib.blake2b(msg.text.encode("utf-8"), digest_size=8).hexdigest()
+    return f"{sender}|{msg.control_id}|{digest}"
+
+
+class DedupeCache:
+    """
+    Supresión de mensajes duplicados delante del procesamiento de resultados.
+
+    - LRU en memoria con TTL: clave -> (vence, código de ACK con que se respondió).
+    - Un duplicado que llega mientras el original sigue en proceso espera ese
+      resultado en lugar de procesarse en paralelo (watchdog dispara created y
+      modified casi a la vez).
+    - Solo se recuerdan los códigos de `remember` (AA y AR por defecto): un AE
+      es un error transitorio y el reenvío debe reintentarse.
+    - Persistencia en un archivo JSONL pequeño (append vía AsyncFileWriter, por
+      lotes); al abrir se cargan las entradas vigentes y se compacta. Lo que no
+      alcanzó a escribirse antes de una caída solo se reprocesa.
+    """
+
+    def __init__(
+        self,
+        store: Optional[PathLike],
+        writer=None,
+        ttl_sec: float = DEFAULT_TTL_SEC,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        remember: Iterable[str] = ("AA", "AR"),
+        flush_every: int = 64,
+    ):
+        self.store = Path(store) if store else None
+        self.writer = writer
+        self.ttl = max(0.0, float(ttl_sec))
+        self.max_entries = max(1, int(max_entries))
+        self.remember = frozenset(remember)
+        self.flush_every = max(1, int(flush_every))
+        self._cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._buffer: List[str] = []
+        # stats
+        self.hits = 0
+        self.misses = 0
+        self.inflight_hits = 0
+        self.expired = 0
+        self.evicted = 0
+
+    # -------- persistencia --------
+
+    def load(self) -> int:
+        """Carga las entradas vigentes del store y lo reescribe sin las vencidas."""
+        if self.store is None or not self.store.exists():
+            return 0
+        now = time.time()
+        entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        total = 0
+        with open(self.store, "r", encoding="utf-8") as f:
+            for line in f:
+                total += 1
+                try:
+                    rec = json.loads(line)
+                    key, code, expires = rec["k"], rec["c"], float(rec["e"])
+                except (ValueError, KeyError, TypeError):
+                    continue  # línea truncada por una caída
+                if expires > now:
+                    entries.pop(key, None)
+                    entries[key] = (expires, code)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        self._cache = entries
+        if total != len(entries):
+            tmp = self.store.with_name(self.store.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(_line(k, c, e) for k, (e, c) in entries.items())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.store)
+        logger.info(f"Dedupe: {len(entries)} clave(s) vigentes cargadas de {self.store}")
+        return len(entries)
+
+    async def flush(self):
+        if not self._buffer or self.store is None or self.writer is None:
+            self._buffer = []
+            return
+        lines, self._buffer = self._buffer, []
+        await self.writer.append_text(self.store, "".join(lines), wait=False)
+
+    # -------- consulta / registro --------
+
+    async def seen(self, key: str) -> Optional[str]:
+        """Código de ACK si `key` ya se procesó (o espera al original en vuelo); None si no."""
+        pending = self._inflight.get(key)
+        if pending is not None:
+            code = await asyncio.shield(pending)
+            if code in self.remember:
+                self.inflight_hits += 1
+                return code
+        entry = self._cache.get(key)
+        if entry is not None:
+            expires, code = entry
+            if expires > time.time():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return code
+            del self._cache[key]
+            self.expired += 1
+        self.misses += 1
+        return None
+
+    def begin(self, key: str):
+        """Marca `key` en proceso: los duplicados que lleguen esperan su resultado."""
+        if key not in self._inflight:
+            self._inflight[key] = asyncio.get_running_loop().create_future()
+
+    async def finish(self, key: str, code: Optional[str]):
+        pending = self._inflight.pop(key, None)
+        if pending is not None and not pending.done():
+            pending.set_result(code)
+        if code not in self.remember:
+            return
+        expires = time.time() + self.ttl
+        self._cache[key] = (expires, code)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+            self.evicted += 1
+        if self.store is not None:
+            self._buffer.append(_line(key, code, expires))
+            if len(self._buffer) >= self.flush_every:
+                await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "inflight_hits": self.inflight_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "cached": len(self._cache),
+        }
+
+
+def _line(key: str, code: str, expires: float) -> str:
+    return json.dumps({"k": key, "c": code, "e": round(expires, 3)}, ensure_ascii=False) + "\n"
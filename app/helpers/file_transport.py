@@ -1,12 +1,19 @@
 import asyncio
+import fnmatch
+import os
 import time
 import uuid
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
 
 from watchdog.events import PatternMatchingEventHandler
 from watchdog.observers import Observer
 
+from app.commons.logger import logger
+from app.helpers.inotify_source import InotifySource, inotify_available
+
 
 class FileSender:
     def __init__(self, outbox: str, pattern: str):
@@ -66,46 +73,200 @@ class FileWatcher:
 """
 
 
+@dataclass(slots=True)
+class _Pending:
+    signature: Optional[Tuple[int, int, int]] = None  # (tamaño, mtime_ns, inode) observada
+    stable_since: float = 0.0
+    done: bool = False  # el escritor cerró el archivo (inotify)
+    attempts: int = 0
+
+
+def _signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
 class FileWatcher:
-    def __init__(self, inbox: str, glob: str, on_message_async, loop: asyncio.AbstractEventLoop):
+    """
+    Vigila el inbox y entrega cada archivo una sola vez, cuando ya está completo.
+
+    - El hilo de watchdog solo anota la ruta en el loop (call_soon_threadsafe): no
+      duerme ni lee, así una copia lenta por SMB no frena los eventos de otros archivos.
+    - created/modified/moved de una ruta se fusionan en una sola entrada pendiente.
+    - Un archivo está completo cuando tamaño y mtime no cambian durante `stable_sec`
+      (con inotify, IN_CLOSE_WRITE / IN_MOVED_TO lo da por completo sin esperar).
+    - stat y lectura van en hilos (asyncio.to_thread); la entrega espera a
+      `on_message_async`, que frena el recorrido si la cola de ingesta está llena.
+    - Se recuerda la firma entregada por ruta: eventos tardíos del mismo archivo no
+      lo vuelven a entregar; si se reemplaza por otro contenido, sí.
+    - `claim(ruta)` opcional: reclama el archivo (rename a processing/) antes de leerlo;
+      si retorna None otro worker lo ganó y no se entrega.
+    - source: "watchdog" | "inotify" (asyncio nativo, solo Linux) | "auto".
+    """
+
+    def __init__(
+        self,
+        inbox: str,
+        glob: str,
+        on_message_async,
+        loop: asyncio.AbstractEventLoop,
+        stable_sec: float = 0.5,
+        poll_sec: float = 0.1,
+        source: str = "auto",
+        max_attempts: int = 10,
+        claim: Optional[Callable[[str], Optional[Path]]] = None,
+    ):
         self.inbox = Path(inbox)
         self.inbox.mkdir(parents=True, exist_ok=True)
+        self.glob = glob
         self.loop = loop
         self.on_message_async = on_message_async
-        self.handler = PatternMatchingEventHandler(patterns=[glob], ignore_directories=True)
+        self.stable_sec = max(0.0, float(stable_sec))
+        self.poll_sec = max(0.01, float(poll_sec))
+        self.max_attempts = max(1, int(max_attempts))
+        self.claim = claim
+        self._pending: Dict[str, _Pending] = {}
+        self._delivered: Dict[str, Tuple[int, int, int]] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # stats
+        self.events = 0
+        self.delivered = 0
 
-        def _submit(path: Path):
-            # Si el archivo ya no existe, no hay nada que leer (pudo haberse movido)
-            if not path.exists():
-                return
-            # Espera breve hasta que termine de escribirse
-            for _ in range(10):
-                try:
-                    text = path.read_text(encoding="utf-8")
-                    break
-                except FileNotFoundError:
-                    # Se movió justo ahora: abortar silenciosamente
-                    return
-                except Exception:
-                    time.sleep(0.05)
-            else:
-                # Último intento; si vuelve a fallar, deja que explote para que lo veas en logs
-                text = path.read_text(encoding="utf-8")
+        source = (source or "auto").lower()
+        if source == "auto":
+            source = "inotify" if inotify_available() else "watchdog"
+        self.source = source
+        self.observer = None
+        self.inotify: Optional[InotifySource] = None
+        if source == "inotify":
+            self.inotify = InotifySource(self.inbox, self._touch, loop, on_overflow=self.rescan)
+        else:
+            handler = PatternMatchingEventHandler(patterns=[glob], ignore_directories=True)
 
-            # Ejecutar la corrutina en el loop principal (thread-safe)
-            asyncio.run_coroutine_threadsafe(self.on_message_async(text, str(path)), self.loop)
+            def touch(path: str):
+                # Hilo del observer: solo agenda la ruta en el loop
+                self.loop.call_soon_threadsafe(self._touch, path, False)
 
-        # Usa src en created, dest en moved; y en modified valida que exista
-        self.handler.on_created = lambda e: _submit(Path(e.src_path))
-        self.handler.on_modified = lambda e: _submit(Path(e.src_path))
-        self.handler.on_moved = lambda e: _submit(Path(e.dest_path))
+            handler.on_created = lambda e: touch(e.src_path)
+            handler.on_modified = lambda e: touch(e.src_path)
+            handler.on_deleted = lambda e: touch(e.src_path)
 
-        self.observer = Observer()
+            def on_moved(e):
+                touch(e.src_path)
+                touch(e.dest_path)
+
+            handler.on_moved = on_moved
+            self.handler = handler
+            self.observer = Observer()
 
     def start(self):
-        self.observer.schedule(self.handler, str(self.inbox), recursive=False)
-        self.observer.start()
+        self._task = self.loop.create_task(self._run(), name="file-watcher")
+        if self.inotify is not None:
+            self.inotify.start()
+        else:
+            self.observer.schedule(self.handler, str(self.inbox), recursive=False)
+            self.observer.start()
+        logger.info(f"Watcher de {self.inbox} ({self.source}, estable tras {self.stable_sec}s)")
 
     def stop(self):
-        self.observer.stop()
-        self.observer.join()
+        if self.inotify is not None:
+            self.inotify.stop()
+        elif self.observer is not None and self.observer.is_alive():
+            self.observer.stop()
+            self.observer.join()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def rescan(self):
+        """Agenda todos los archivos del inbox (p.ej. tras perder eventos)."""
+        for name in os.listdir(self.inbox):
+            self._touch(str(self.inbox / name))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"events": self.events, "pending": len(self._pending), "delivered": self.delivered}
+
+    # -------- en el loop --------
+
+    def _touch(self, path: str, done: bool = False):
+        if not fnmatch.fnmatch(os.path.basename(path), self.glob):
+            return
+        self.events += 1
+        entry = self._pending.get(path)
+        if entry is None:
+            entry = self._pending[path] = _Pending()
+        entry.done = entry.done or done
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                await self._wake.wait()
+            self._wake.clear()
+            # Deja que se acumulen los eventos de la ráfaga antes de mirar el disco
+            await asyncio.sleep(self.poll_sec)
+            try:
+                await self._check()
+            except Exception as ex:
+                logger.exception(f"Watcher de {self.inbox}: {ex}")
+
+    async def _check(self):
+        paths = list(self._pending)
+        sigs = await asyncio.to_thread(lambda: [_signature(p) for p in paths])
+        now = time.monotonic()
+        ready = []
+        for path, sig in zip(paths, sigs):
+            entry = self._pending.get(path)
+            if entry is None:
+                continue
+            if sig is None:
+                # Ya no está (se movió o se borró): nada que leer
+                del self._pending[path]
+                self._delivered.pop(path, None)
+            elif self._delivered.get(path) == sig:
+                del self._pending[path]  # evento tardío de un archivo ya entregado
+            elif sig != entry.signature:
+                entry.signature, entry.stable_since = sig, now
+                if entry.done:
+                    ready.append(path)
+            elif entry.done or now - entry.stable_since >= self.stable_sec:
+                ready.append(path)
+        for path in ready:
+            await self._deliver(path)
+
+    async def _deliver(self, src: str):
+        entry = self._pending.pop(src)
+        path = src
+        try:
+            if self.claim is not None:
+                claimed = await asyncio.to_thread(self.claim, src)
+                if claimed is None:
+                    return  # lo tomó otro worker
+                path = str(claimed)
+            text = await asyncio.to_thread(Path(path).read_text, encoding="utf-8")
+        except FileNotFoundError:
+            return  # se movió justo ahora
+        except Exception as ex:
+            if path != src:
+                # Ya reclamado: igual va al pipeline, que lo deja en error/
+                logger.error(f"No se pudo leer {path}: {ex}")
+                text = ""
+            else:
+                entry.attempts += 1
+                if entry.attempts >= self.max_attempts:
+                    logger.error(f"No se pudo leer {src} tras {entry.attempts} intentos: {ex}")
+                    return
+                # Sigue bloqueado o a medio escribir: se reintenta en la próxima vuelta
+                entry.signature = None
+                self._pending.setdefault(src, entry)
+                return
+        self._delivered[src] = entry.signature
+        self.delivered += 1
+        try:
+            await self.on_message_async(text, path)
+        except Exception as ex:
+            logger.error(f"No se pudo encolar {path}: {ex}")
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import queue
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Optional, Union
+
+PathLike = Union[str, Path]
+
+# Piezas comunes de los escritores con hilo propio (RawSpool, NdjsonSink, AsyncFileWriter):
+# juntar un lote de la cola, resolver Futures del event loop desde el hilo y deshacer
+# una escritura fallida en un archivo append-only.
+
+
+def collect_batch(q: queue.SimpleQueue, first: Any, max_batch: int, delay: float = 0.0) -> list:
+    """
+    Lote para un solo write + fsync (group commit): `first` más lo que ya esté en la cola,
+    hasta `max_batch`. Con `delay` > 0 espera ese tiempo extra a que lleguen más.
+    Un None (señal de cierre) termina el lote y queda como último elemento.
+    """
+    batch = [first]
+    deadline = time.monotonic() + delay if delay else None
+    while len(batch) < max_batch:
+        try:
+            if deadline is None:
+                item = q.get_nowait()
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                item = q.get(timeout=remaining)
+        except queue.Empty:
+            break
+        batch.append(item)
+        if item is None:
+            break
+    return batch
+
+
+def call_in_loop(loop: asyncio.AbstractEventLoop, fn: Callable, *args):
+    """`loop.call_soon_threadsafe` desde el hilo de escritura, tolerando un loop ya cerrado."""
+    try:
+        loop.call_soon_threadsafe(fn, *args)
+    except RuntimeError:
+        # El loop ya se cerró: nadie espera este resultado
+        pass
+
+
+def set_future(fut: asyncio.Future, result: Any = None, error: Optional[BaseException] = None):
+    """Resuelve `fut` (en el loop) salvo que ya esté resuelto o cancelado."""
+    if fut.done():
+        return
+    if error is not None:
+        fut.set_exception(error)
+    else:
+        fut.set_result(result)
+
+
+def resolve_threadsafe(loop, fut: asyncio.Future, result: Any = None, error=None):
+    """`set_future` agendado en el loop dueño de `fut`, desde el hilo de escritura."""
+    call_in_loop(loop, set_future, fut, result, error)
+
+
+def discard_tail(f: BinaryIO, path: PathLike, size: int) -> BinaryIO:
+    """
+    Tras un write/flush/fsync fallido en `f` (abierto en "ab"): lo cierra, trunca `path`
+    a `size` (lo último confirmado) y retorna el archivo reabierto. Así el siguiente
+    lote no queda detrás de bytes a medias. Lanza OSError si no se puede truncar.
+    """
+    try:
+        f.close()  # cierra aunque falle el flush: el lote en buffer se descarta
+    except OSError:
+        pass
+    os.truncate(path, size)
+    return open(path, "ab")
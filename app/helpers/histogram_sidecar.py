@@ -0,0 +1,80 @@
+import asyncio
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from app.commons.histograms import HISTOGRAM_BINS, HISTOGRAM_NAMES, message_histograms
+from app.commons.hl7_message import HL7Message
+from app.helpers.async_writer import AsyncFileWriter
+
+PathLike = Union[str, Path]
+
+SIDECAR_SUFFIX = ".u8"
+
+
+class HistogramSidecar:
+    """
+    Histogramas Icon-3 en un binario aparte en lugar de base64 dentro del JSON.
+
+    - Un archivo append-only por día (`histograms-YYYYMMDD.u8`) con registros fijos
+      de 256 bytes (uint8 por canal, tal cual vienen del equipo).
+    - En el payload, el base64 de `results[].value` y `extras.raw_histograms` se
+      reemplaza por {"sidecar": archivo, "index": n, "bins": 256}: el histograma
+      está en el offset n * 256.
+    - Usa los arreglos ya decodificados por el validador (HL7Message.memo).
+    - Los índices se asignan en el event loop y las escrituras van al mismo hilo
+      del AsyncFileWriter (mismo archivo): el orden en disco coincide con el índice.
+    """
+
+    def __init__(self, writer: AsyncFileWriter, directory: PathLike):
+        self.writer = writer
+        self.dir = Path(directory)
+        self._lock = asyncio.Lock()
+        self._current: Optional[Tuple[Path, int]] = None  # (archivo del día, próximo índice)
+        self.written = 0
+
+    async def _slot(self, count: int) -> Tuple[Path, int]:
+        path = self.dir / f"histograms-{datetime.now():%Y%m%d}{SIDECAR_SUFFIX}"
+        if self._current is None or self._current[0] != path:
+            # Reanuda tras el último registro completo del archivo del día
+            size = await asyncio.to_thread(_size_of, path)
+            self._current = (path, size // HISTOGRAM_BINS)
+        path, first = self._current
+        self._current = (path, first + count)
+        return path, first
+
+    async def detach(self, data: Dict, hl7: Union[str, HL7Message]) -> Dict:
+        """Saca los histogramas válidos del payload al sidecar y deja la referencia."""
+        valid = [h for h in message_histograms(hl7).values() if h.data is not None]
+        if not valid:
+            return data
+        blob = b"".join(h.data.tobytes() for h in valid)
+        async with self._lock:
+            path, first = await self._slot(len(valid))
+            fut = await self.writer.append_bytes(path, blob, wait=False)
+        await fut
+        self.written += len(valid)
+
+        refs = {
+            h.name: {"sidecar": path.name, "index": first + k, "bins": HISTOGRAM_BINS}
+            for k, h in enumerate(valid)
+        }
+        extras = data.get("extras") or {}
+        raw = extras.get("raw_histograms")
+        if isinstance(raw, dict):
+            for name in list(raw):
+                if name in refs:
+                    raw[name] = refs[name]
+        for item in data.get("results") or ():
+            code = item.get("test_code")
+            if code in refs and code in HISTOGRAM_NAMES:
+                item["value"] = refs[code]
+        return data
+
+
+def _size_of(path: Path) -> int:
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
@@ -0,0 +1,180 @@
+import os
+import socket
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from app.commons.logger import logger
+
+PathLike = Union[str, Path]
+
+HEARTBEAT_NAME = ".heartbeat"
+DEFAULT_HEARTBEAT_SEC = 10.0
+DEFAULT_ORPHAN_AFTER_SEC = 60.0
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _free_name(directory: Path, name: str) -> Path:
+    """`directory/name`, o con un sufijo si ya existe (un rename no debe pisar otro archivo)."""
+    dst = directory / name
+    if not dst.exists():
+        return dst
+    p = Path(name)
+    return directory / f"{p.stem}.{uuid.uuid4().hex[:8]}{p.suffix}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True  # existe pero es de otro usuario (o no se puede saber)
+    return True
+
+
+class InboxClaimer:
+    """
+    Reclamo de archivos del inbox por rename atómico, para que varios procesos (o
+    varios hosts con la carpeta compartida) drenen el mismo inbox sin duplicar.
+
+    - `inbox/x.hl7 -> processing/<worker-id>/x.hl7`: el rename lo gana un solo
+      worker; a los demás les falla con FileNotFoundError y lo ignoran.
+    - Al terminar, el archivo sale de processing/ a archive/hl7 o error/.
+    - Cada worker mantiene `processing/<worker-id>/.heartbeat` al día. Un worker
+      sin latido por `orphan_after_sec` (o con el PID muerto, si es del mismo host)
+      está caído: sus archivos vuelven al inbox y alguien los reprocesa.
+    - processing/ debe estar en el mismo sistema de archivos que el inbox.
+    """
+
+    def __init__(
+        self,
+        inbox: PathLike,
+        processing_dir: Optional[PathLike] = None,
+        worker_id: Optional[str] = None,
+        heartbeat_sec: float = DEFAULT_HEARTBEAT_SEC,
+        orphan_after_sec: float = DEFAULT_ORPHAN_AFTER_SEC,
+    ):
+        self.inbox = Path(inbox)
+        self.root = Path(processing_dir) if processing_dir else self.inbox.parent / "processing"
+        self.worker_id = worker_id or default_worker_id()
+        self.dir = self.root / self.worker_id
+        self.heartbeat_sec = max(0.1, float(heartbeat_sec))
+        self.orphan_after = max(self.heartbeat_sec * 2, float(orphan_after_sec))
+        self._host = socket.gethostname()
+        # stats
+        self.claimed = 0
+        self.lost = 0
+        self.recovered = 0
+
+    # -------- ciclo de vida --------
+
+    def open(self) -> int:
+        """Crea el directorio propio, late y devuelve al inbox lo huérfano. Retorna cuántos."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # Lo que quedó en el directorio propio es de una ejecución anterior con el mismo id
+        recovered = self._return_to_inbox(self.dir)
+        self.heartbeat()
+        return recovered + self.recover_orphans()
+
+    def heartbeat(self):
+        (self.dir / HEARTBEAT_NAME).write_text(f"{time.time():.3f}\n", encoding="utf-8")
+
+    def close(self):
+        """Apagado ordenado: devuelve lo que no se alcanzó a procesar y borra el directorio."""
+        self._return_to_inbox(self.dir)
+        (self.dir / HEARTBEAT_NAME).unlink(missing_ok=True)
+        try:
+            self.dir.rmdir()
+        except OSError:
+            pass
+
+    # -------- reclamo --------
+
+    def claim(self, path: PathLike) -> Optional[Path]:
+        """Mueve `path` del inbox al directorio propio. None si otro worker lo ganó."""
+        src = Path(path)
+        dst = _free_name(self.dir, src.name)
+        try:
+            os.rename(src, dst)
+        except FileNotFoundError:
+            self.lost += 1
+            return None
+        self.claimed += 1
+        return dst
+
+    def owns(self, path: PathLike) -> bool:
+        return Path(path).parent == self.dir
+
+    def inbox_path(self, path: PathLike) -> Path:
+        """Dónde queda un archivo reclamado si vuelve al inbox."""
+        return self.inbox / Path(path).name
+
+    # -------- huérfanos --------
+
+    def _is_dead(self, worker_dir: Path, now: float) -> bool:
+        host, _, pid = worker_dir.name.rpartition("-")
+        if host == self._host and pid.isdigit() and not _pid_alive(int(pid)):
+            return True
+        try:
+            beat = (worker_dir / HEARTBEAT_NAME).stat().st_mtime
+        except FileNotFoundError:
+            # Sin latido: se juzga por la antigüedad del directorio
+            try:
+                beat = worker_dir.stat().st_mtime
+            except FileNotFoundError:
+                return False
+        return now - beat > self.orphan_after
+
+    def _return_to_inbox(self, worker_dir: Path) -> int:
+        moved = 0
+        try:
+            entries: List[os.DirEntry] = list(os.scandir(worker_dir))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            if entry.name == HEARTBEAT_NAME or not entry.is_file():
+                continue
+            try:
+                os.rename(entry.path, _free_name(self.inbox, entry.name))
+                moved += 1
+            except FileNotFoundError:
+                continue  # otro worker lo recuperó primero
+        return moved
+
+    def recover_orphans(self) -> int:
+        """Devuelve al inbox los archivos de workers caídos. Retorna cuántos."""
+        now = time.time()
+        total = 0
+        try:
+            workers = [Path(e.path) for e in os.scandir(self.root) if e.is_dir()]
+        except FileNotFoundError:
+            return 0
+        for worker_dir in workers:
+            if worker_dir == self.dir or not self._is_dead(worker_dir, now):
+                continue
+            moved = self._return_to_inbox(worker_dir)
+            if moved:
+                logger.warning(
+                    f"Inbox: {moved} archivo(s) huérfano(s) de '{worker_dir.name}' devueltos"
+                )
+            (worker_dir / HEARTBEAT_NAME).unlink(missing_ok=True)
+            try:
+                worker_dir.rmdir()
+            except OSError:
+                pass
+            total += moved
+        self.recovered += total
+        return total
+
+    def stats(self) -> Dict[str, Union[str, int]]:
+        return {
+            "worker_id": self.worker_id,
+            "claimed": self.claimed,
+            "lost": self.lost,
+            "recovered": self.recovered,
+        }
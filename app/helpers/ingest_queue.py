@@ -0,0 +1,151 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.commons.logger import logger
+
+
+class IngestQueue:
+    """
+    Etapa de ingesta entre los listeners (TCP, carpeta, UDP) y el procesamiento.
+
+    - Cola `asyncio.Queue` acotada + N workers que llaman a `handler(*args, **kwargs)`.
+    - `submit` espera mientras la cola está llena: el lector TCP deja de leer
+      del socket y el watcher de carpeta queda bloqueado en `submit_threadsafe`.
+    - `drain` deja de aceptar trabajo, espera a que se vacíe la cola y detiene
+      los workers, así no se pierden mensajes al apagar.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[..., Awaitable[Any]],
+        maxsize: int = 1000,
+        workers: int = 4,
+        name: str = "ingest",
+    ):
+        self.handler = handler
+        self.maxsize = max(1, int(maxsize))
+        self.workers = max(1, int(workers))
+        self.name = name
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._accepting = True
+        # stats
+        self._submitted = 0
+        self._processed = 0
+        self._failed = 0
+        self._busy = 0
+        self._max_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _ensure_started(self):
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"{self.name}-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def start(self):
+        self._ensure_started()
+
+    # -------- productores --------
+
+    async def submit(self, *args, **kwargs) -> asyncio.Future:
+        """Encola un trabajo (espera si la cola está llena) y retorna su Future."""
+        if not self._accepting:
+            raise RuntimeError(f"Cola '{self.name}' cerrada")
+        self._ensure_started()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((args, kwargs, fut, time.perf_counter()))
+        self._submitted += 1
+        self._max_depth = max(self._max_depth, self._queue.qsize())
+        return fut
+
+    async def process(self, *args, **kwargs):
+        """Encola y espera el resultado del handler (p.ej. código de ACK)."""
+        return await (await self.submit(*args, **kwargs))
+
+    def submit_threadsafe(self, *args, timeout: Optional[float] = None, **kwargs):
+        """
+        Para hilos ajenos al loop (watchdog): bloquea el hilo llamante hasta
+        que el trabajo entra a la cola. No espera el procesamiento.
+        """
+        if self._loop is None:
+            raise RuntimeError(f"Cola '{self.name}' sin iniciar (llame start() en el loop)")
+        cf = asyncio.run_coroutine_threadsafe(self.submit(*args, **kwargs), self._loop)
+        cf.result(timeout)
+
+    # -------- workers --------
+
+    async def _worker(self):
+        while True:
+            args, kwargs, fut, t0 = await self._queue.get()
+            wait = time.perf_counter() - t0
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._busy += 1
+            try:
+                result = await self.handler(*args, **kwargs)
+            except asyncio.CancelledError:
+                if not fut.done():
+                    fut.cancel()
+                raise
+            except Exception as ex:
+                self._failed += 1
+                logger.exception(f"Cola '{self.name}': error no controlado en handler: {ex}")
+                if not fut.done():
+                    fut.set_exception(ex)
+                    # Ya quedó en el log; evita el aviso si nadie espera el Future
+                    fut.exception()
+            else:
+                if not fut.done():
+                    fut.set_result(result)
+            finally:
+                self._busy -= 1
+                self._processed += 1
+                self._queue.task_done()
+
+    # -------- apagado --------
+
+    async def join(self):
+        """Espera a que se procese todo lo encolado hasta ahora."""
+        if self._tasks:
+            await self._queue.join()
+
+    async def drain(self, timeout: Optional[float] = None):
+        """Deja de aceptar trabajo, procesa lo pendiente y detiene los workers."""
+        self._accepting = False
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Cola '{self.name}': drenado incompleto, {self._queue.qsize()} pendiente(s)"
+            )
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Cola '{self.name}' drenada: {self.stats()}")
+
+    # -------- métricas --------
+
+    def stats(self) -> Dict[str, Any]:
+        done = self._processed or 1
+        return {
+            "workers": self.workers,
+            "busy": self._busy,
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self._max_depth,
+            "capacity": self.maxsize,
+            "submitted": self._submitted,
+            "processed": self._processed,
+            "failed": self._failed,
+            "avg_wait_ms": round(self._wait_total / done * 1000, 3),
+            "max_wait_ms": round(self._wait_max * 1000, 3),
+        }
@@ -0,0 +1,108 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Callable, Optional
+
+from app.commons.logger import logger
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+# Eventos que indican que el escritor terminó (el archivo ya está completo)
+DONE_MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    return _libc
+
+
+def inotify_available() -> bool:
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        return hasattr(_load_libc(), "inotify_init1")
+    except OSError:
+        return False
+
+
+class InotifySource:
+    """
+    Eventos de una carpeta vía inotify, nativo de asyncio (solo Linux).
+
+    El fd se registra con `loop.add_reader`: no hay hilo observador ni salto entre
+    hilos. Llama a `on_event(ruta, terminado)` en el loop; `terminado` es True para
+    IN_CLOSE_WRITE / IN_MOVED_TO. Si la cola del kernel se desborda, llama a
+    `on_overflow()` para que el consumidor vuelva a recorrer la carpeta.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        on_event: Callable[[str, bool], None],
+        loop: asyncio.AbstractEventLoop,
+        on_overflow: Optional[Callable[[], None]] = None,
+    ):
+        self.dir = Path(directory)
+        self.on_event = on_event
+        self.on_overflow = on_overflow
+        self.loop = loop
+        self._fd: Optional[int] = None
+
+    def start(self):
+        libc = _load_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1: {os.strerror(err)}")
+        if libc.inotify_add_watch(fd, os.fsencode(self.dir), WATCH_MASK) < 0:
+            err = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(err, f"inotify_add_watch({self.dir}): {os.strerror(err)}")
+        self._fd = fd
+        self.loop.add_reader(fd, self._on_readable)
+
+    def stop(self):
+        if self._fd is None:
+            return
+        self.loop.remove_reader(self._fd)
+        os.close(self._fd)
+        self._fd = None
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            _, mask, _, size = _EVENT.unpack_from(data, pos)
+            name = data[pos + _EVENT.size : pos + _EVENT.size + size].rstrip(b"\0")
+            pos += _EVENT.size + size
+            if mask & IN_Q_OVERFLOW:
+                logger.warning(f"inotify: cola desbordada en {self.dir}; se recorre la carpeta")
+                if self.on_overflow is not None:
+                    self.on_overflow()
+                continue
+            if not name or mask & IN_ISDIR:
+                continue
+            self.on_event(str(self.dir / os.fsdecode(name)), bool(mask & DONE_MASK))
@@ -0,0 +1,324 @@
+import asyncio
+import json
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from app.commons.logger import logger
+from app.helpers.group_commit import collect_batch, discard_tail, resolve_threadsafe
+
+PathLike = Union[str, Path]
+
+ACTIVE_SUFFIX = ".ndjson.part"
+FINAL_SUFFIX = ".ndjson"
+MANIFEST_NAME = "manifest.jsonl"  # fuera del patrón *.ndjson de los segmentos
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_AGE_SEC = 300.0
+
+_SEGMENT_RE = re.compile(r"-(\d{8})\.ndjson(\.part)?$")
+_IDLE = object()
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class NdjsonSink:
+    """
+    Salida de resultados como JSON compacto, una línea por resultado, en archivos rotados.
+
+    - El segmento activo es `<prefijo>-<n>.ndjson.part`; se cierra al superar
+      `max_bytes` o `max_age_sec` (también estando ocioso). Al cerrarlo se hace
+      fsync y se renombra a `.ndjson` (os.replace): un `.ndjson` siempre está completo.
+    - Cada segmento cerrado agrega una línea a `manifest.jsonl` (archivo,
+      registros, bytes, crc32, rango de tiempo); los consumidores hacen tail del
+      manifiesto y solo leen archivos ya finalizados.
+    - Un hilo dedicado serializa y escribe: lo que se acumuló mientras escribía
+      el lote anterior sale en un solo write (group flush, fsync opcional).
+    - Tras una caída, los `.part` que quedaron se recortan a la última línea
+      completa y se finalizan al abrir.
+    """
+
+    def __init__(
+        self,
+        directory: PathLike,
+        prefix: str = "results",
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age_sec: float = DEFAULT_MAX_AGE_SEC,
+        max_batch: int = 512,
+        flush_delay_ms: float = 0.0,
+        fsync: bool = False,
+        name: str = "ndjson",
+    ):
+        self.dir = Path(directory)
+        self.prefix = prefix
+        self.max_bytes = max(1024, int(max_bytes))
+        self.max_age = max(0.0, float(max_age_sec))
+        self.max_batch = max(1, int(max_batch))
+        self.flush_delay = max(0.0, float(flush_delay_ms)) / 1000
+        self.fsync = fsync
+        self.name = name
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._opened = False
+        self._manifest = None
+        # segmento activo
+        self._file = None
+        self._path: Optional[Path] = None
+        self._next_n = 1
+        self._records = 0
+        self._bytes = 0
+        self._crc = 0
+        self._opened_at = 0.0
+        self._first_ts: Optional[float] = None
+        # stats
+        self._written = 0
+        self._flushes = 0
+        self._max_batch_seen = 0
+        self._finalized = 0
+        self._failed = 0
+
+    # -------- ciclo de vida --------
+
+    def open(self) -> int:
+        """Finaliza los `.part` de una ejecución anterior y arranca el hilo. Retorna cuántos."""
+        if self._opened:
+            return 0
+        self.dir.mkdir(parents=True, exist_ok=True)
+        numbers = [0]
+        leftovers = []
+        for path in self.dir.glob(f"{self.prefix}-*.ndjson*"):
+            m = _SEGMENT_RE.search(path.name)
+            if not m:
+                continue
+            numbers.append(int(m.group(1)))
+            if m.group(2):
+                leftovers.append(path)
+        self._next_n = max(numbers) + 1
+        self._manifest = open(self.dir / MANIFEST_NAME, "a", encoding="utf-8")
+        for path in sorted(leftovers):
+            self._recover(path)
+        self._opened = True
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"NDJSON '{self.name}' abierto en {self.dir} "
+            f"({len(leftovers)} segmento(s) recuperado(s))"
+        )
+        return len(leftovers)
+
+    async def aclose(self):
+        """Escribe lo pendiente, finaliza el segmento activo y detiene el hilo."""
+        if not self._opened:
+            return
+        self._queue.put(None)
+        await asyncio.to_thread(self._thread.join)
+        self._opened = False
+        logger.info(f"NDJSON '{self.name}' cerrado: {self.stats()}")
+
+    # -------- API async --------
+
+    async def write(self, data: Any, wait: bool = True):
+        """
+        Encola un resultado. Con `wait` retorna el nombre del segmento una vez escrito
+        (y con fsync si está habilitado); sin `wait`, el Future.
+        """
+        if not self._opened:
+            raise RuntimeError(f"NDJSON '{self.name}' no está abierto")
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._queue.put((data, fut, loop))
+        return await fut if wait else fut
+
+    # -------- segmentos --------
+
+    def _start_segment(self):
+        self._path = self.dir / f"{self.prefix}-{self._next_n:08d}{ACTIVE_SUFFIX}"
+        self._next_n += 1
+        self._file = open(self._path, "ab")
+        self._records = self._bytes = self._crc = 0
+        self._opened_at = time.time()
+        self._first_ts = None
+
+    def _finalize(self):
+        """Cierra el segmento activo (si tiene datos): fsync, rename atómico y manifiesto."""
+        if self._file is None:
+            return
+        f, path = self._file, self._path
+        self._file = self._path = None
+        if not self._records:
+            f.close()
+            path.unlink(missing_ok=True)
+            return
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        self._publish(path, self._records, self._bytes, self._crc, self._first_ts, time.time())
+
+    def _publish(self, path: Path, records: int, size: int, crc: int, first_ts, last_ts):
+        final = path.with_name(path.name[: -len(ACTIVE_SUFFIX)] + FINAL_SUFFIX)
+        os.replace(path, final)
+        entry = {
+            "file": final.name,
+            "records": records,
+            "bytes": size,
+            "crc32": f"{crc:08x}",
+            "first_ts": _iso(first_ts),
+            "last_ts": _iso(last_ts),
+        }
+        self._manifest.write(_dumps(entry) + "\n")
+        self._manifest.flush()
+        os.fsync(self._manifest.fileno())
+        with self._lock:
+            self._finalized += 1
+        logger.info(f"NDJSON '{self.name}': {final.name} finalizado ({records} registros)")
+
+    def _recover(self, path: Path):
+        data = path.read_bytes()
+        valid = data.rfind(b"\n") + 1
+        if valid < len(data):
+            logger.warning(
+                f"NDJSON '{self.name}': {path.name} con {len(data) - valid} byte(s) "
+                "de una línea incompleta; se recortan"
+            )
+            with open(path, "r+b") as f:
+                f.truncate(valid)
+                f.flush()
+                os.fsync(f.fileno())
+        if not valid:
+            path.unlink()
+            return
+        mtime = path.stat().st_mtime
+        self._publish(
+            path, data.count(b"\n", 0, valid), valid, zlib.crc32(data[:valid]), None, mtime
+        )
+
+    def _due(self) -> bool:
+        if self._file is None or not self._records:
+            return False
+        if self._bytes >= self.max_bytes:
+            return True
+        return bool(self.max_age) and time.time() - self._opened_at >= self.max_age
+
+    # -------- hilo de escritura --------
+
+    def _wait_timeout(self) -> Optional[float]:
+        # Ocioso con datos: despierta a tiempo para rotar por antigüedad
+        if self._file is None or not self._records or not self.max_age:
+            return None
+        return max(0.0, self._opened_at + self.max_age - time.time())
+
+    def _run(self):
+        stop = False
+        while not stop:
+            try:
+                first = self._queue.get(timeout=self._wait_timeout())
+            except queue.Empty:
+                first = _IDLE
+            batch = (
+                []
+                if first is _IDLE
+                else collect_batch(self._queue, first, self.max_batch, self.flush_delay)
+            )
+            if batch and batch[-1] is None:
+                batch.pop()
+                stop = True
+            try:
+                if batch:
+                    self._commit(batch)
+                if self._due() or stop:
+                    self._finalize()
+            except Exception as ex:
+                logger.exception(f"NDJSON '{self.name}': fallo al escribir lote: {ex}")
+                with self._lock:
+                    self._failed += len(batch)
+                for _, fut, loop in batch:
+                    resolve_threadsafe(loop, fut, None, ex)
+        if self._manifest is not None:
+            self._manifest.close()
+
+    def _commit(self, batch: List):
+        pending, size = [], 0
+        for data, fut, loop in batch:
+            try:
+                line = (_dumps(data) + "\n").encode("utf-8")
+            except (TypeError, ValueError) as ex:
+                # Un resultado no serializable no tumba el lote
+                with self._lock:
+                    self._failed += 1
+                resolve_threadsafe(loop, fut, None, ex)
+                continue
+            # Un lote grande se reparte entre segmentos para respetar max_bytes
+            if (pending or self._records) and self._bytes + size + len(line) > self.max_bytes:
+                self._write_lines(pending)
+                pending, size = [], 0
+                self._finalize()
+            pending.append((line, fut, loop))
+            size += len(line)
+        self._write_lines(pending)
+        if self._bytes >= self.max_bytes:
+            self._finalize()
+
+    def _write_lines(self, items: List):
+        if not items:
+            return
+        if self._file is None:
+            self._start_segment()
+        chunk = b"".join(line for line, _, _ in items)
+        try:
+            self._file.write(chunk)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except Exception:
+            # Sin líneas a medias: bytes/crc32 del manifiesto deben coincidir con el archivo
+            self._discard_tail()
+            raise
+        if self._first_ts is None:
+            self._first_ts = time.time()
+        self._records += len(items)
+        self._bytes += len(chunk)
+        self._crc = zlib.crc32(chunk, self._crc)
+        name = self._path.name[: -len(ACTIVE_SUFFIX)] + FINAL_SUFFIX
+        with self._lock:
+            self._written += len(items)
+            self._flushes += 1
+            self._max_batch_seen = max(self._max_batch_seen, len(items))
+        for _, fut, loop in items:
+            resolve_threadsafe(loop, fut, name)
+
+    def _discard_tail(self):
+        """Tras un write/fsync fallido deja el `.part` en `_bytes` (lo último confirmado)."""
+        try:
+            self._file = discard_tail(self._file, self._path, self._bytes)
+        except OSError as ex:
+            # Se abandona el segmento: al reabrir, la recuperación recorta la línea incompleta
+            logger.error(f"NDJSON '{self.name}': no se pudo truncar {self._path.name}: {ex}")
+            self._file = self._path = None
+
+    # -------- métricas --------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            flushes = self._flushes or 1
+            return {
+                "written": self._written,
+                "flushes": self._flushes,
+                "avg_batch": round(self._written / flushes, 2),
+                "max_batch": self._max_batch_seen,
+                "finalized": self._finalized,
+                "failed": self._failed,
+                "active": self._path.name if self._path else None,
+            }
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts).isoformat(timespec="milliseconds") if ts else None
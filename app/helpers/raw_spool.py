@@ -0,0 +1,501 @@
+import asyncio
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Union
+
+from app.commons.logger import logger
+from app.helpers.group_commit import collect_batch, discard_tail, resolve_threadsafe
+
+PathLike = Union[str, Path]
+
+# Registro: largo del cuerpo (u32), crc32 del cuerpo (u32) | cuerpo:
+#   seq (u64), timestamp (f64), largo del origen (u16), origen (utf-8), mensaje (utf-8)
+_HEADER = struct.Struct("<II")
+_META = struct.Struct("<QdH")
+_SEQ = struct.Struct("<Q")
+# Índice de un segmento sellado: seq base (u64), cantidad (u32) + offsets (u32 c/u)
+_IDX_HEADER = struct.Struct("<QI")
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+DONE_NAME = "spool.done"
+CHECKPOINT_NAME = "spool.checkpoint"
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+# Los offsets del índice son u32: el tope deja margen para el lote que cruza el límite
+MAX_SEGMENT_BYTES = 2**31
+_MAX_OFFSET = 2**32 - 1
+
+
+class SpoolRecord(NamedTuple):
+    seq: int
+    ts: float
+    src: str
+    text: str
+
+
+def _encode_record(seq: int, ts: float, src: str, text: str) -> bytes:
+    src_b = src.encode("utf-8")[:0xFFFF]
+    body = _META.pack(seq, ts, len(src_b)) + src_b + text.encode("utf-8")
+    return _HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def _decode_body(body: bytes) -> SpoolRecord:
+    seq, ts, src_len = _META.unpack_from(body)
+    start = _META.size
+    src = body[start : start + src_len].decode("utf-8", "replace")
+    return SpoolRecord(seq, ts, src, body[start + src_len :].decode("utf-8", "replace"))
+
+
+def _scan_segment(data: bytes) -> tuple:
+    """Recorre un segmento y retorna (offsets, seq base, bytes válidos)."""
+    offsets = array("I")
+    base = None
+    pos, n = 0, len(data)
+    while pos + _HEADER.size <= n:
+        length, crc = _HEADER.unpack_from(data, pos)
+        end = pos + _HEADER.size + length
+        if length < _META.size or end > n:
+            break  # cola incompleta (caída a mitad de escritura)
+        body = data[pos + _HEADER.size : end]
+        if zlib.crc32(body) != crc:
+            break
+        seq = _SEQ.unpack_from(body)[0]
+        if base is None:
+            base = seq
+        elif seq != base + len(offsets):
+            break
+        offsets.append(pos)
+        pos = end
+    return offsets, base, pos
+
+
+class _Segment:
+    __slots__ = ("path", "base", "offsets", "size")
+
+    def __init__(self, path: Path, base: int, offsets: array, size: int):
+        self.path = path
+        self.base = base
+        self.offsets = offsets
+        self.size = size
+
+    @property
+    def end(self) -> int:
+        """Primer seq que ya no pertenece al segmento."""
+        return self.base + len(self.offsets)
+
+
+class RawSpool:
+    """
+    Journal append-only de los mensajes crudos recibidos (write-ahead).
+
+    - Segmentos `<seq base>.seg` con registros enmarcados (largo + CRC32);
+      se rota al superar `segment_bytes` y al sellar se escribe un `.idx`.
+    - Un hilo dedicado escribe: todo lo que se acumuló mientras hacía el fsync
+      anterior sale en un solo write + fsync (group commit).
+    - `append` retorna el seq cuando el registro ya está en disco: es el punto
+      seguro para responder el ACK.
+    - Índice en memoria de 4 bytes por mensaje (offset dentro del segmento)
+      para leer cualquier mensaje por seq con `get`.
+    - `mark_done` registra lo ya procesado (spool.done + checkpoint); tras una
+      caída, `pending` entrega lo que quedó sin procesar para re-encolarlo.
+    """
+
+    def __init__(
+        self,
+        directory: PathLike,
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        max_batch: int = 256,
+        commit_delay_ms: float = 0.0,
+        fsync: bool = True,
+        max_segments: int = 0,
+        name: str = "spool",
+    ):
+        if int(segment_bytes) > MAX_SEGMENT_BYTES:
+            raise ValueError(
+                f"segment_bytes={segment_bytes} supera el máximo de {MAX_SEGMENT_BYTES} "
+                "(offsets de 32 bits en el índice)"
+            )
+        self.dir = Path(directory)
+        self.segment_bytes = max(4096, int(segment_bytes))
+        self.max_batch = max(1, int(max_batch))
+        self.commit_delay = max(0.0, float(commit_delay_ms)) / 1000
+        self.fsync = fsync
+        self.max_segments = max(0, int(max_segments))
+        self.name = name
+        self._segments: List[_Segment] = []
+        self._bases: List[int] = []
+        self._lock = threading.Lock()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._done_file = None
+        self._next_seq = 1
+        # Todo seq <= watermark está procesado; los procesados fuera de orden quedan en _done
+        self._watermark = 0
+        self._done: Set[int] = set()
+        self._opened = False
+        # stats
+        self._appended = 0
+        self._commits = 0
+        self._max_batch_seen = 0
+        self._commit_total = 0.0
+        self._commit_max = 0.0
+
+    # -------- apertura y recuperación --------
+
+    def open(self) -> int:
+        """Carga segmentos, repara la cola del último y retorna cuántos quedan pendientes."""
+        if self._opened:
+            return self.pending_count()
+        self.dir.mkdir(parents=True, exist_ok=True)
+        paths = sorted(self.dir.glob(f"*{SEGMENT_SUFFIX}"))
+        for i, path in enumerate(paths):
+            self._add_segment(self._load_segment(path, last=i == len(paths) - 1))
+        if self._segments:
+            self._next_seq = self._segments[-1].end
+        self._load_done()
+
+        active = self._segments[-1] if self._segments else None
+        if active is None or active.size >= self.segment_bytes:
+            if active is not None:
+                self._write_index(active)
+            active = self._new_segment()
+        self._file = open(active.path, "ab")
+        self._done_file = open(self.dir / DONE_NAME, "ab")
+        self._opened = True
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+        self._thread.start()
+        pending = self.pending_count()
+        logger.info(
+            f"Spool '{self.name}' abierto en {self.dir}: {len(self._segments)} segmento(s), "
+            f"próximo seq {self._next_seq}, {pending} pendiente(s)"
+        )
+        return pending
+
+    def _load_segment(self, path: Path, last: bool) -> _Segment:
+        base_from_name = int(path.stem)
+        idx = path.with_suffix(INDEX_SUFFIX)
+        if not last and idx.exists():
+            raw = idx.read_bytes()
+            base, count = _IDX_HEADER.unpack_from(raw)
+            offsets = array("I")
+            offsets.frombytes(raw[_IDX_HEADER.size : _IDX_HEADER.size + count * 4])
+            return _Segment(path, base, offsets, path.stat().st_size)
+
+        data = path.read_bytes()
+        offsets, base, valid = _scan_segment(data)
+        if valid < len(data):
+            logger.warning(
+                f"Spool '{self.name}': {path.name} con {len(data) - valid} byte(s) "
+                "inválidos al final; se truncan"
+            )
+            with open(path, "r+b") as f:
+                f.truncate(valid)
+        seg = _Segment(path, base if base is not None else base_from_name, offsets, valid)
+        if not last:
+            self._write_index(seg)
+        return seg
+
+    def _load_done(self):
+        ckpt = self.dir / CHECKPOINT_NAME
+        if ckpt.exists():
+            self._watermark = int(ckpt.read_text(encoding="ascii").strip() or 0)
+        done_path = self.dir / DONE_NAME
+        if done_path.exists():
+            raw = done_path.read_bytes()
+            usable = len(raw) - len(raw) % _SEQ.size
+            for (seq,) in _SEQ.iter_unpack(raw[:usable]):
+                self._add_done(seq)
+        # Lo anterior al primer segmento conservado ya no puede reprocesarse
+        if self._segments:
+            self._watermark = max(self._watermark, self._segments[0].base - 1)
+            self._advance_watermark()
+        self._checkpoint()
+
+    def _add_segment(self, seg: _Segment):
+        with self._lock:
+            self._segments.append(seg)
+            self._bases.append(seg.base)
+
+    def _new_segment(self) -> _Segment:
+        path = self.dir / f"{self._next_seq:020d}{SEGMENT_SUFFIX}"
+        path.touch()
+        seg = _Segment(path, self._next_seq, array("I"), 0)
+        self._add_segment(seg)
+        return seg
+
+    def _write_index(self, seg: _Segment):
+        tmp = seg.path.with_suffix(INDEX_SUFFIX + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(_IDX_HEADER.pack(seg.base, len(seg.offsets)))
+            f.write(seg.offsets.tobytes())
+        os.replace(tmp, seg.path.with_suffix(INDEX_SUFFIX))
+
+    # -------- procesados (checkpoint) --------
+
+    def _add_done(self, seq: int):
+        if seq > self._watermark:
+            self._done.add(seq)
+            self._advance_watermark()
+
+    def _advance_watermark(self):
+        done = self._done
+        w = self._watermark
+        while w + 1 in done:
+            w += 1
+            done.discard(w)
+        self._watermark = w
+        if done:
+            # Procesados por debajo de un watermark que saltó (p.ej. al podar segmentos)
+            for seq in [s for s in done if s <= w]:
+                done.discard(seq)
+
+    def _checkpoint(self):
+        """Persiste el watermark y reescribe spool.done solo con lo que está por encima."""
+        tmp = self.dir / (CHECKPOINT_NAME + ".tmp")
+        tmp.write_text(str(self._watermark), encoding="ascii")
+        os.replace(tmp, self.dir / CHECKPOINT_NAME)
+        with self._lock:
+            above = sorted(self._done)
+        tmp = self.dir / (DONE_NAME + ".tmp")
+        tmp.write_bytes(b"".join(_SEQ.pack(s) for s in above))
+        if self._done_file is not None:
+            self._done_file.close()
+        os.replace(tmp, self.dir / DONE_NAME)
+        if self._done_file is not None:
+            self._done_file = open(self.dir / DONE_NAME, "ab")
+
+    def is_done(self, seq: int) -> bool:
+        with self._lock:
+            return seq <= self._watermark or seq in self._done
+
+    # -------- API async --------
+
+    async def append(self, text: str, src: str = "") -> int:
+        """Agrega un mensaje y retorna su seq una vez persistido (fsync)."""
+        if not self._opened:
+            raise RuntimeError(f"Spool '{self.name}' no está abierto")
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._queue.put(("data", (text, src), fut, loop))
+        return await fut
+
+    def mark_done(self, seq: int):
+        """Registra `seq` como procesado (sin esperar disco: en el peor caso se reprocesa)."""
+        if self._opened and seq is not None:
+            self._queue.put(("done", seq, None, None))
+
+    async def aclose(self):
+        if not self._opened:
+            return
+        self._queue.put(None)
+        await asyncio.to_thread(self._thread.join)
+        self._opened = False
+        logger.info(f"Spool '{self.name}' cerrado: {self.stats()}")
+
+    # -------- lectura --------
+
+    def _locate(self, seq: int):
+        with self._lock:
+            i = bisect_right(self._bases, seq) - 1
+            if i < 0:
+                return None
+            seg = self._segments[i]
+            if seq >= seg.end:
+                return None
+            return seg.path, seg.offsets[seq - seg.base]
+
+    @staticmethod
+    def _read_at(f, offset: int) -> SpoolRecord:
+        f.seek(offset)
+        length, crc = _HEADER.unpack(f.read(_HEADER.size))
+        body = f.read(length)
+        if zlib.crc32(body) != crc:
+            raise ValueError(f"CRC inválido en offset {offset}")
+        return _decode_body(body)
+
+    def get(self, seq: int) -> Optional[SpoolRecord]:
+        """Lee un mensaje por seq (None si no existe o ya se podó su segmento)."""
+        loc = self._locate(seq)
+        if loc is None:
+            return None
+        path, offset = loc
+        with open(path, "rb") as f:
+            return self._read_at(f, offset)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            last = self._segments[-1].end - 1 if self._segments else 0
+            return max(0, last - self._watermark - sum(1 for s in self._done if s <= last))
+
+    def pending(self) -> Iterator[SpoolRecord]:
+        """Registros aún no procesados, en orden de llegada (un open por segmento)."""
+        with self._lock:
+            segments = [(s.path, s.base, s.offsets[:]) for s in self._segments]
+            watermark, done = self._watermark, set(self._done)
+        for path, base, offsets in segments:
+            seqs = [
+                seq
+                for seq in range(max(base, watermark + 1), base + len(offsets))
+                if seq not in done
+            ]
+            if not seqs:
+                continue
+            with open(path, "rb") as f:
+                for seq in seqs:
+                    yield self._read_at(f, offsets[seq - base])
+
+    # -------- hilo de escritura --------
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = collect_batch(self._queue, self._queue.get(), self.max_batch, self.commit_delay)
+            if batch[-1] is None:
+                batch.pop()
+                stop = True
+            try:
+                self._commit(batch)
+            except Exception as ex:
+                logger.exception(f"Spool '{self.name}': fallo al escribir lote: {ex}")
+                for kind, _, fut, loop in batch:
+                    if fut is not None:
+                        resolve_threadsafe(loop, fut, None, ex)
+        self._close_files()
+
+    def _commit(self, batch: list):
+        t0 = time.perf_counter()
+        seg = self._segments[-1]
+        chunks, offsets, waiters, done = [], [], [], []
+        pos = seg.size
+        ts = time.time()
+        for kind, value, fut, loop in batch:
+            if kind == "done":
+                done.append(value)
+                continue
+            text, src = value
+            rec = _encode_record(self._next_seq + len(offsets), ts, src, text)
+            if pos > _MAX_OFFSET:
+                # Un lote gigante cruzó el tope: se rechaza antes de escribir nada
+                raise ValueError(f"Spool '{self.name}': offset {pos} fuera del índice de 32 bits")
+            offsets.append(pos)
+            chunks.append(rec)
+            waiters.append((fut, loop))
+            pos += len(rec)
+
+        if done:
+            # Aparte del lote de datos: si este falla, las marcas no se pierden
+            with self._lock:
+                for seq in done:
+                    self._add_done(seq)
+            try:
+                self._done_file.write(b"".join(_SEQ.pack(s) for s in done))
+                self._done_file.flush()
+            except Exception as ex:
+                logger.warning(f"Spool '{self.name}': fallo al escribir {DONE_NAME}: {ex}")
+                self._rewrite_done()
+
+        if chunks:
+            try:
+                self._file.write(b"".join(chunks))
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except Exception:
+                # Sin ACK para el lote: no puede quedar nada suyo en el segmento
+                self._discard_tail(seg)
+                raise
+            with self._lock:
+                seg.offsets.extend(offsets)
+                seg.size = pos
+            first = self._next_seq
+            self._next_seq += len(offsets)
+            for i, (fut, loop) in enumerate(waiters):
+                resolve_threadsafe(loop, fut, first + i)
+
+            elapsed = time.perf_counter() - t0
+            self._appended += len(chunks)
+            self._commits += 1
+            self._max_batch_seen = max(self._max_batch_seen, len(chunks))
+            self._commit_total += elapsed
+            self._commit_max = max(self._commit_max, elapsed)
+        if seg.size >= self.segment_bytes:
+            self._rotate()
+
+    def _discard_tail(self, seg: _Segment):
+        """Tras un write/fsync fallido deja el segmento en `seg.size` (lo último confirmado)."""
+        try:
+            self._file = discard_tail(self._file, seg.path, seg.size)
+        except OSError as ex:
+            # Sin poder truncar se sella con el índice en memoria (ignora la cola) y se rota
+            logger.error(f"Spool '{self.name}': no se pudo truncar {seg.path.name}: {ex}")
+            self._rotate()
+
+    def _rewrite_done(self):
+        """Reescribe spool.done desde memoria (repara también una escritura a medias)."""
+        try:
+            try:
+                self._done_file.close()
+            except OSError:
+                pass
+            self._done_file = None
+            self._checkpoint()
+            self._done_file = open(self.dir / DONE_NAME, "ab")
+        except Exception as ex:
+            logger.exception(f"Spool '{self.name}': no se pudo reescribir {DONE_NAME}: {ex}")
+
+    def _rotate(self):
+        sealed = self._segments[-1]
+        self._file.close()
+        self._write_index(sealed)
+        self._file = open(self._new_segment().path, "ab")
+        self._checkpoint()
+        self._prune()
+
+    def _prune(self):
+        """Con max_segments > 0 borra los segmentos sellados más viejos ya procesados."""
+        if not self.max_segments:
+            return
+        while len(self._segments) > self.max_segments:
+            oldest = self._segments[0]
+            if oldest.end - 1 > self._watermark:
+                break  # aún tiene mensajes sin procesar
+            with self._lock:
+                self._segments.pop(0)
+                self._bases.pop(0)
+            oldest.path.unlink(missing_ok=True)
+            oldest.path.with_suffix(INDEX_SUFFIX).unlink(missing_ok=True)
+            logger.info(f"Spool '{self.name}': segmento {oldest.path.name} eliminado")
+
+    def _close_files(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._done_file is not None:
+            self._done_file.close()
+            self._done_file = None
+        self._checkpoint()
+
+    # -------- métricas --------
+
+    def stats(self) -> Dict[str, Any]:
+        commits = self._commits or 1
+        return {
+            "segments": len(self._segments),
+            "next_seq": self._next_seq,
+            "appended": self._appended,
+            "commits": self._commits,
+            "avg_batch": round(self._appended / commits, 2),
+            "max_batch": self._max_batch_seen,
+            "avg_commit_ms": round(self._commit_total / commits * 1000, 3),
+            "max_commit_ms": round(self._commit_max * 1000, 3),
+            "pending": self.pending_count(),
+        }
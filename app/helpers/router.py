@@ -1,9 +1,11 @@
+import itertools
 import re
 from datetime import datetime
 from pathlib import Path
-from typing import Dict
+from typing import Any, Dict, Union
 
 from app.commons.hl7_engine import HL7Engine
+from app.commons.hl7_message import HL7Message
 
 
 def _replace_none(obj):
@@ -16,17 +18,23 @@ def _replace_none(obj):
     return obj
 
 
+# Desempata archivos crudos creados en el mismo microsegundo
+_raw_counter = itertools.count(1)
+
+
 class FlowRouter:
     def __init__(self, engine: HL7Engine, cfg):
         self.engine = engine
         self.cfg = cfg
         self.paths = cfg["paths"]
 
-    def transform_hl7_result(self, hl7_text: str) -> Dict:
-        """Retorna el payload listo para la API de SOFIA."""
-        return self.engine.parse_and_map(hl7_text)
+    def transform_hl7_result(
+        self, hl7: Union[str, HL7Message], origin: Any = None, metrics: Any = None
+    ) -> Dict:
+        """Retorna el payload listo para la API de SOFIA. `origin`: peer o carpeta de entrada."""
+        return self.engine.parse_and_map(hl7, origin, metrics=metrics)
 
-    def _parse_icon3_nte(self, hl7_text: str) -> dict:
+    def _parse_icon3_nte(self, hl7: Union[str, HL7Message]) -> dict:
         """
         Extrae:
           - profile: NTE|Profile||Human
@@ -34,16 +42,12 @@ class FlowRouter:
           - WDn: NTE|WD0||32|RE^WBC Discriminator #0 (fL)
           - flags: NTE|<RBC/WBC/PLT> flags||a3  o  NTE|Comment6||X4N6|6^WBC flags
         """
-        self.engine._detect_and_apply_separators(hl7_text)
-        segs = self.engine.split_segments(hl7_text)
-        s = self.engine.sep  # separadores actuales
+        msg = HL7Message.coerce(hl7)
+        comp_sep = msg.seps["c"]  # separadores detectados en MSH-1/MSH-2
 
         out = {"icon3": {"profile": None, "discriminators": {"RD": None, "WD": {}}, "flags": {}}}
 
-        for seg in segs:
-            if not seg.startswith("NTE" + s["field"]):
-                continue
-            fields = seg.split(s["field"])
+        for _, fields in msg.iter_fields("NTE"):
             # Campos: NTE|x|source|comment|...
             f1 = fields[1] if len(fields) > 1 else ""
             f2 = fields[2] if len(fields) > 2 else ""
@@ -61,7 +65,7 @@ class FlowRouter:
             # RD (RBC discriminator)
             if tag == "rd":
                 val = f3 or f4
-                name = f5.split(s["comp"], 1)[-1] if f5 else ""
+                name = f5.split(comp_sep, 1)[-1] if f5 else ""
                 out["icon3"]["discriminators"]["RD"] = {"value": val, "name": name}
                 continue
 
@@ -70,7 +74,7 @@ class FlowRouter:
             if mwd:
                 idx = int(mwd.group(2))
                 val = f3 or f4
-                name = f5.split(s["comp"], 1)[-1] if f5 else ""
+                name = f5.split(comp_sep, 1)[-1] if f5 else ""
                 out["icon3"]["discriminators"]["WD"][idx] = {"value": val, "name": name}
                 continue
 
@@ -145,29 +149,36 @@ class FlowRouter:
         # Añade anotaciones NTE
         return data
 
-    def archive_raw(self, direction: str, hl7_text: str, tag: str):
+    def raw_archive_path(self, direction: str, tag: str) -> Path:
+        """Ruta del archivo crudo (sin tocar disco; quien escribe crea la carpeta)."""
         base = Path(self.paths["logs_root"]) / "raw" / direction
-        base.mkdir(parents=True, exist_ok=True)
-        name = f'{datetime.now().strftime("%Y%m%d_%H%M%S")}_{tag}.hl7'
-        (base / name).write_text(hl7_text, encoding="utf-8")
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        name = f"{ts}_{next(_raw_counter) % 1_000_000:06d}_{tag}.hl7"
+        return base / name
+
+    def archive_raw(self, direction: str, hl7_text: str, tag: str):
+        path = self.raw_archive_path(direction, tag)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(hl7_text, encoding="utf-8")
 
     # Renderizar orden -> texto HL7
     def render_order(self, payload_dict: dict) -> str:
         return self.engine.render(self.cfg["engine"]["template"], payload_dict, hl7_in=None)
 
     # Extraer resultados -> dict
-    def extract_results(self, hl7_text: str) -> dict:
+    def extract_results(self, hl7: Union[str, HL7Message]) -> dict:
+        msg = HL7Message.coerce(hl7)
         header_profile = self.cfg["engine"].get("header_profile")
         grouped_profile = self.cfg["engine"]["extractor_profile"]
 
         base = {}
         if header_profile:
-            base = self.engine.extract(header_profile, hl7_text)
+            base = self.engine.extract(header_profile, msg)
 
-        data = self.engine.extract_grouped(grouped_profile, hl7_text, base_out=base)
+        data = self.engine.extract_grouped(grouped_profile, msg, base_out=base)
 
         # Mezcla anotaciones NTE de ICON3
-        annotations = self._parse_icon3_nte(hl7_text)
+        annotations = self._parse_icon3_nte(msg)
         data.update(annotations)
 
         return self._postprocess_icon3(_replace_none(data))
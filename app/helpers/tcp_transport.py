@@ -1,86 +1,618 @@
 import asyncio
+import socket
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from app.commons.hl7_ack import ACK_ACCEPT, ACK_ERROR, build_ack
+from app.commons.hl7_message import HL7Message
+from app.commons.logger import logger
 
 VT = b"\x0b"  # <VT>
 FS = b"\x1c"  # <FS>
 CR = b"\x0d"  # <CR>
 
 
-async def read_mllp_messages(reader: asyncio.StreamReader):
+_CR_BYTE = CR[0]
+
+DEFAULT_MAX_FRAME = 16 * 1024 * 1024  # 16 MiB
+MIN_READ_SIZE = 4096
+MAX_READ_SIZE = 1024 * 1024
+# Se compacta el buffer solo cuando lo consumido supera este tamaño (amortizado)
+_COMPACT_THRESHOLD = 64 * 1024
+
+
+class MllpFrameError(Exception):
+    """Error de enmarcado MLLP (kind: oversize | truncated | junk)."""
+
+    def __init__(self, kind: str, detail: str, nbytes: int = 0):
+        super().__init__(f"{kind}: {detail}")
+        self.kind = kind
+        self.detail = detail
+        self.nbytes = nbytes
+
+
+def decode_payload(payload) -> str:
+    """Bytes recibidos (bytes o memoryview) a texto: UTF-8 y, si no es válido, latin-1."""
+    # str(memoryview, enc) decodifica sin copiar a bytes intermedios
+    try:
+        return str(payload, "utf-8")
+    except UnicodeDecodeError:
+        return str(payload, "latin-1")
+
+
+class MllpFramer:
+    """
+    Enmarcador MLLP incremental (VT ... FS CR).
+
+    - Mantiene cursores (inicio del frame y punto de búsqueda), así cada byte
+      se examina una sola vez aunque el frame llegue en muchos fragmentos.
+    - Extrae el payload con memoryview y solo compacta el buffer de vez en cuando.
+    - Frames mayores a `max_frame` se descartan hasta el siguiente VT.
+    - Los problemas se reportan a `on_error(MllpFrameError)` y en `errors`;
+      ningún frame parcial se pierde en silencio.
+    """
+
+    def __init__(self, max_frame: int = DEFAULT_MAX_FRAME, on_error=None):
+        self.max_frame = max_frame
+        self.on_error = on_error
+        self.buf = bytearray()
+        self._pos = 0  # primer byte no consumido
+        self._start = -1  # primer byte del payload en curso (-1 = buscando VT)
+        self._scan = 0  # desde dónde seguir buscando FS CR
+        self._skipping = False  # resto de un frame sobredimensionado (hasta el próximo VT)
+        self._junk_bytes = 0
+        self.frames = 0
+        self.errors = 0
+
+    @property
+    def buffered(self) -> int:
+        return len(self.buf) - self._pos
+
+    @property
+    def in_frame(self) -> bool:
+        return self._start >= 0
+
+    def _error(self, kind: str, detail: str, nbytes: int = 0):
+        self.errors += 1
+        err = MllpFrameError(kind, detail, nbytes)
+        if self.on_error is not None:
+            self.on_error(err)
+        else:
+            logger.warning(f"MLLP {err}")
+
+    def _junk(self, start: int, end: int):
+        # CR/LF o espacios entre frames son normales; cualquier otra cosa se acumula
+        n = end - start
+        if n <= 0:
+            return
+        if n <= 256 and not bytes(self.buf[start:end]).strip():
+            return
+        self._junk_bytes += n
+
+    def _flush_junk(self):
+        if self._junk_bytes:
+            n, self._junk_bytes = self._junk_bytes, 0
+            self._error("junk", f"{n} byte(s) fuera de un frame descartados", n)
+
+    def feed(self, data) -> List[str]:
+        """Agrega bytes y retorna los mensajes completos (str) encontrados."""
+        buf = self.buf
+        buf.extend(data)
+        n = len(buf)
+        out: List[str] = []
+        # Cursores en variables locales; se guardan en el objeto al salir
+        pos, start, scan = self._pos, self._start, self._scan
+        mv = memoryview(buf)  # se libera antes de compactar (no se puede redimensionar con vistas)
+        try:
+            while True:
+                if start < 0:
+                    vt = buf.find(VT, pos)
+                    if vt < 0:
+                        if not self._skipping:
+                            self._junk(pos, n)
+                        pos = n
+                        break
+                    if vt > pos and not self._skipping:
+                        self._junk(pos, vt)
+                    if self._junk_bytes:
+                        self._flush_junk()
+                    self._skipping = False
+                    start = scan = vt + 1
+                # memchr de un solo byte (FS) es mucho más rápido que buscar el par FS CR
+                end = buf.find(FS, scan)
+                while 0 <= end < n - 1 and buf[end + 1] != _CR_BYTE:
+                    end = buf.find(FS, end + 1)
+                if end < 0 or end == n - 1:
+                    if n - start > self.max_frame:
+                        self._error(
+                            "oversize", f"frame > {self.max_frame} bytes descartado", n - start
+                        )
+                        start = -1
+                        pos = n
+                        self._skipping = True
+                        break
+                    # El FS pudo quedar como último byte: se re-examina solo ese byte
+                    scan = max(start, n - 1)
+                    break
+                # Un VT dentro del frame indica que el anterior quedó truncado
+                vt = buf.rfind(VT, start, end)
+                if vt >= 0:
+                    self._error(
+                        "truncated", "frame sin FS CR reemplazado por uno nuevo", vt - start
+                    )
+                    start = vt + 1
+                if end - start > self.max_frame:
+                    self._error(
+                        "oversize", f"frame > {self.max_frame} bytes descartado", end - start
+                    )
+                else:
+                    out.append(decode_payload(mv[start:end]))
+                pos = end + 2
+                start = -1
+        finally:
+            mv.release()
+            self._pos, self._start, self._scan = pos, start, scan
+        self.frames += len(out)
+        self._compact()
+        return out
+
+    def _compact(self):
+        pos = self._pos
+        if pos == len(self.buf) and self._start < 0:
+            self.buf.clear()
+            self._pos = self._scan = 0
+        elif pos > _COMPACT_THRESHOLD and pos * 2 > len(self.buf):
+            del self.buf[:pos]
+            self._pos = 0
+            self._scan = max(0, self._scan - pos)
+            if self._start >= 0:
+                self._start -= pos
+
+    def close(self):
+        """Fin del stream: reporta un frame incompleto si quedó alguno."""
+        self._flush_junk()
+        if self._start >= 0:
+            self._error(
+                "truncated", "conexión cerrada a mitad de frame", len(self.buf) - self._start
+            )
+        self.buf.clear()
+        self._pos = self._scan = 0
+        self._start = -1
+
+
+async def read_mllp_messages(
+    reader: asyncio.StreamReader,
+    read_size: Optional[int] = None,
+    max_frame: int = DEFAULT_MAX_FRAME,
+    on_error=None,
+):
     """
     Lee un stream MLLP y produce mensajes HL7 (str) delimitados por VT ... FS CR.
     Permite múltiples mensajes en una sola conexión.
+
+    read_size: tamaño fijo de lectura; None = adaptativo (crece mientras las
+    lecturas llegan llenas, vuelve a bajar con tráfico chico).
     """
-    buf = bytearray()
+    framer = MllpFramer(max_frame=max_frame, on_error=on_error)
+    size = read_size or MIN_READ_SIZE
     while True:
-        chunk = await reader.read(4096)
+        chunk = await reader.read(size)
         if not chunk:
             break
-        buf.extend(chunk)
-        while True:
-            # Busca VT
-            try:
-                start = buf.index(VT)
-            except ValueError:
-                # Si no hay VT, descarta basura anterior y sigue leyendo
-                buf.clear()
-                break
-            # Busca FS CR después de start
-            try:
-                fs = buf.index(FS, start + 1)
-                if fs + 1 >= len(buf):
-                    # Falta CR y/o datos -> leer más
-                    break
-                if buf[fs + 1] != CR[0]:
-                    # No hay CR después de FS -> espera más
-                    break
-                # Extraer mensaje entre VT y FS
-                payload = bytes(buf[start + 1 : fs])  # sin VT/FS/CR
-                # Consumir hasta CR (fs+2)
-                del buf[: fs + 2]
-                # Decodificar (UTF-8 por defecto; puedes aplicar fallback si falla)
-                try:
-                    msg = payload.decode("utf-8")
-                except UnicodeDecodeError:
-                    msg = payload.decode("latin-1")
-                yield msg
-            except ValueError:
-                # No hay FS aún
-                break
+        if read_size is None:
+            if len(chunk) >= size:
+                size = min(size * 2, MAX_READ_SIZE)
+            elif len(chunk) < size // 4:
+                size = max(size // 2, MIN_READ_SIZE)
+        for msg in framer.feed(chunk):
+            yield msg
+    framer.close()
+
+
+class MllpAckError(Exception):
+    """El receptor respondió con un ACK negativo (AE/AR) o inválido."""
+
+    def __init__(self, code: str, text: Optional[str] = "", control_id: str = ""):
+        text = text or ""  # MSA-3 ausente llega como None
+        detail = f": {text}" if text else ""
+        super().__init__(f"ACK {code} para {control_id or '?'}{detail}")
+        self.code = code
+        self.text = text
+        self.control_id = control_id
+
+
+class _MllpConnection:
+    """Una conexión del pool: un lector de ACK y los envíos pendientes por MSH-10."""
+
+    def __init__(self, reader, writer, max_in_flight: int, max_frame: int):
+        self.reader = reader
+        self.writer = writer
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        # MSH-10 -> Futures en orden de envío (un mismo id puede repetirse)
+        self.pending: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.last_used = time.monotonic()
+        self.unmatched = 0
+        self._reader_task = asyncio.create_task(self._read_acks(max_frame))
+
+    @property
+    def healthy(self) -> bool:
+        return not self.writer.is_closing() and not self._reader_task.done()
+
+    def expect(self, control_id: str) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self.pending.setdefault(control_id, deque()).append(fut)
+        return fut
+
+    def forget(self, control_id: str, fut: asyncio.Future):
+        waiters = self.pending.get(control_id)
+        if waiters and fut in waiters:
+            waiters.remove(fut)
+            if not waiters:
+                del self.pending[control_id]
+
+    def _take(self, control_id: str) -> Optional[asyncio.Future]:
+        if control_id:
+            if control_id not in self.pending:
+                # MSA-2 desconocido (p.ej. ACK tardío de un envío que ya expiró): se descarta
+                self.unmatched += 1
+                return None
+            key = control_id
+        elif self.pending:
+            # ACK sin MSA-2: se asume el más antiguo (orden MLLP)
+            self.unmatched += 1
+            key = next(iter(self.pending))
+        else:
+            return None
+        waiters = self.pending[key]
+        fut = waiters.popleft()
+        if not waiters:
+            del self.pending[key]
+        return fut
+
+    async def _read_acks(self, max_frame: int):
+        error: Exception = ConnectionError("conexión cerrada por el receptor")
+        try:
+            async for text in read_mllp_messages(self.reader, max_frame=max_frame):
+                ack = HL7Message(text)
+                fut = self._take(ack.get("MSA-2"))
+                if fut is None:
+                    logger.warning(f"ACK sin envío pendiente: {ack.get('MSA-2')!r}")
+                elif not fut.done():
+                    fut.set_result((ack.get("MSA-1"), ack.get("MSA-3")))
+        except Exception as ex:
+            error = ex
+        finally:
+            self.fail_all(error)
+
+    def fail_all(self, error: Exception):
+        for waiters in self.pending.values():
+            for fut in waiters:
+                if not fut.done():
+                    fut.set_exception(error)
+        self.pending.clear()
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+        self._reader_task.cancel()
+        await asyncio.gather(self._reader_task, return_exceptions=True)
 
 
 class TcpSender:
-    def __init__(self, host: str, port: int, timeout: float = 5.0):
+    """
+    Emisor MLLP con pool de conexiones persistentes.
+
+    - Cada mensaje sale enmarcado (VT ... FS CR) por una conexión ya abierta;
+      el costo por orden queda en una escritura + el ida y vuelta del ACK.
+    - Los ACK se emparejan por MSH-10 (MSA-2), así varios mensajes pueden
+      estar en vuelo en la misma conexión (hasta `max_in_flight`).
+    - Conexiones caídas o inactivas más de `idle_timeout` se descartan; si una
+      escritura falla en una conexión reutilizada se reintenta en una nueva.
+    - `expect_ack=False` mantiene el modo anterior (enviar sin esperar respuesta).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        timeout: float = 5.0,
+        pool_size: int = 2,
+        max_in_flight: int = 8,
+        ack_timeout: Optional[float] = None,
+        idle_timeout: float = 60.0,
+        expect_ack: bool = True,
+        max_frame: int = DEFAULT_MAX_FRAME,
+    ):
         self.host = host
         self.port = port
         self.timeout = timeout
+        self.pool_size = max(1, int(pool_size))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.ack_timeout = ack_timeout or timeout
+        self.idle_timeout = idle_timeout
+        self.expect_ack = expect_ack
+        self.max_frame = max_frame
+        self._conns: List[_MllpConnection] = []
+        self._connecting = 0
+        self._lock: Optional[asyncio.Lock] = None
+        # stats
+        self.sent = 0
+        self.connects = 0
+        self.reconnects = 0
+        self.nacks = 0
 
-    async def send(self, hl7_text: str) -> None:
+    async def _open(self) -> _MllpConnection:
         reader, writer = await asyncio.wait_for(
             asyncio.open_connection(self.host, self.port), timeout=self.timeout
         )
-        writer.write(hl7_text.encode("utf-8"))
-        await writer.drain()
-        writer.close()
-        await writer.wait_closed()
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connects += 1
+        return _MllpConnection(reader, writer, self.max_in_flight, self.max_frame)
+
+    async def _prune(self):
+        now = time.monotonic()
+        for conn in list(self._conns):
+            idle = conn.in_flight == 0 and now - conn.last_used > self.idle_timeout
+            if not conn.healthy or idle:
+                self._conns.remove(conn)
+                await conn.close()
+
+    async def _acquire(self) -> Tuple[_MllpConnection, bool]:
+        """
+        Conexión con menos mensajes en vuelo; abre otra si hay cupo en el pool.
+        Retorna (conexión, recién abierta).
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self._prune()
+            best = min(self._conns, key=lambda c: c.in_flight, default=None)
+            fresh = best is None or (best.in_flight > 0 and len(self._conns) < self.pool_size)
+            if fresh:
+                best = await self._open()
+                self._conns.append(best)
+            best.in_flight += 1
+        try:
+            await best.slots.acquire()
+        except BaseException:
+            best.in_flight -= 1
+            raise
+        return best, fresh
+
+    def _release(self, conn: _MllpConnection):
+        conn.in_flight -= 1
+        conn.last_used = time.monotonic()
+        conn.slots.release()
+
+    async def send(self, hl7_text: str) -> Optional[str]:
+        """
+        Envía un mensaje y espera su ACK. Retorna el código (AA/CA) o None sin ACK;
+        lanza MllpAckError con AE/AR y TimeoutError si el ACK no llega a tiempo.
+        """
+        control_id = HL7Message(hl7_text).control_id or ""
+        frame = VT + hl7_text.encode("utf-8") + FS + CR
+        for attempt in (1, 2):
+            conn, fresh = await self._acquire()
+            fut = conn.expect(control_id) if self.expect_ack else None
+            try:
+                conn.writer.write(frame)
+                await conn.writer.drain()
+            except (ConnectionError, OSError) as ex:
+                if fut is not None:
+                    conn.forget(control_id, fut)
+                self._release(conn)
+                await conn.close()
+                if attempt == 2 or fresh:
+                    raise
+                self.reconnects += 1
+                logger.warning(
+                    f"Conexión MLLP a {self.host}:{self.port} caída ({ex}); reconectando"
+                )
+                continue
+            try:
+                self.sent += 1
+                if fut is None:
+                    return None
+                try:
+                    code, text = await asyncio.wait_for(fut, self.ack_timeout)
+                except asyncio.TimeoutError:
+                    conn.forget(control_id, fut)
+                    raise
+            finally:
+                self._release(conn)
+            if code not in (ACK_ACCEPT, "CA"):
+                self.nacks += 1
+                raise MllpAckError(code, text, control_id)
+            return code
+
+    async def close(self):
+        conns, self._conns = self._conns, []
+        for conn in conns:
+            await conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self._conns),
+            "in_flight": sum(c.in_flight for c in self._conns),
+            "sent": self.sent,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "nacks": self.nacks,
+            "unmatched_acks": sum(c.unmatched for c in self._conns),
+        }
 
 
 class TcpServer:
-    def __init__(self, host: str, port: int, on_message_async):
+    """
+    Listener MLLP de resultados.
+
+    Por conexión hay dos tareas: la que lee/enmarca mensajes y la que escribe
+    los ACK. Hasta `pipeline_depth` mensajes de una misma conexión se procesan
+    en paralelo mientras se sigue leyendo el siguiente frame; los ACK salen
+    siempre en el orden de llegada.
+
+    ack_mode:
+      - "processed": ACK con el resultado de `on_message_async` (AA/AE/AR).
+      - "receipt": ACK AA apenas `on_receipt_async` deja el mensaje en disco
+        (escritura durable); el procesamiento sigue después y
+        `on_message_async` recibe como tercer argumento lo que retornó
+        `on_receipt_async` (p.ej. el seq del spool).
+      - "none": no se responde (comportamiento anterior).
+
+    `reuse_port`: bind con SO_REUSEPORT para que varios procesos escuchen el mismo
+    puerto y el kernel reparta las conexiones entre ellos (ver TcpSupervisor).
+
+    `metrics` (app.commons.metrics.Metrics): etapa "frame" (indexar el mensaje) y
+    errores de framing por tipo.
+    """
+
+    ACK_MODES = ("processed", "receipt", "none")
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        on_message_async,
+        ack_mode: str = "processed",
+        on_receipt_async=None,
+        pipeline_depth: int = 8,
+        max_frame: int = DEFAULT_MAX_FRAME,
+        read_size: Optional[int] = None,
+        reuse_port: bool = False,
+        metrics=None,
+    ):
+        if ack_mode not in self.ACK_MODES:
+            raise ValueError(f"ack_mode inválido: {ack_mode!r} (use {', '.join(self.ACK_MODES)})")
+        if ack_mode == "receipt" and on_receipt_async is None:
+            raise ValueError("ack_mode='receipt' requiere on_receipt_async")
         self.host = host
         self.port = port
         self.on_message_async = on_message_async
+        self.on_receipt_async = on_receipt_async
+        self.ack_mode = ack_mode
+        self.pipeline_depth = max(1, int(pipeline_depth))
+        self.max_frame = max_frame
+        self.read_size = read_size
+        self.reuse_port = reuse_port
+        self.metrics = metrics
+        self.framing_errors = 0
+        self.accepted = 0
+        self.active = 0
+        self.messages = 0
         self._server = None
+        # Procesamientos que siguen vivos aunque la conexión ya cerró
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def _dispatch(self, msg: HL7Message, peer, ack: asyncio.Future):
+        try:
+            extra = ()
+            if self.ack_mode == "receipt":
+                try:
+                    extra = (await self.on_receipt_async(msg, peer),)
+                except Exception as ex:
+                    logger.exception(f"No se pudo persistir mensaje de {peer}: {ex}")
+                    ack.set_result((ACK_ERROR, "Error almacenando mensaje"))
+                    return
+                ack.set_result((ACK_ACCEPT, None))
+            try:
+                code = await self.on_message_async(msg, peer, *extra)
+            except Exception as ex:
+                logger.exception(f"Error procesando mensaje de {peer}: {ex}")
+                code = ACK_ERROR
+            if not ack.done():
+                ack.set_result((code or ACK_ACCEPT, None))
+        finally:
+            # Cancelación u otro error inesperado: nunca dejar al escritor de ACK esperando
+            if not ack.done():
+                ack.set_result((ACK_ERROR, None))
+
+    async def _ack_loop(self, pending: asyncio.Queue, writer, peer):
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            msg, ack = item
+            code, text = await ack
+            if self.ack_mode == "none" or writer.is_closing():
+                continue
+            try:
+                writer.write(VT + build_ack(msg, code, text).encode("utf-8") + FS + CR)
+                await writer.drain()
+            except ConnectionError as ex:
+                logger.warning(f"No se pudo enviar ACK a {peer}: {ex}")
 
     async def _handle(self, reader, writer):
         peer = writer.get_extra_info("peername")
+        self.accepted += 1
+        self.active += 1
+        pending: asyncio.Queue = asyncio.Queue()
+        slots = asyncio.Semaphore(self.pipeline_depth)
+        acker = asyncio.create_task(self._ack_loop(pending, writer, peer))
+
+        def on_error(err: MllpFrameError):
+            self.framing_errors += 1
+            if self.metrics is not None:
+                self.metrics.inc("errors_total", stage="frame", kind=err.kind)
+            logger.warning(f"MLLP de {peer}: {err}")
+
         try:
-            async for hl7 in read_mllp_messages(reader):
-                await self.on_message_async(hl7, peer)
+            async for hl7 in read_mllp_messages(
+                reader, read_size=self.read_size, max_frame=self.max_frame, on_error=on_error
+            ):
+                # Pipeline lleno: se deja de leer del socket hasta que se libere un cupo
+                await slots.acquire()
+                self.messages += 1
+                if self.metrics is not None:
+                    t0 = time.perf_counter()
+                    msg = HL7Message(hl7)
+                    self.metrics.lap("frame", t0)
+                else:
+                    msg = HL7Message(hl7)
+                ack = asyncio.get_running_loop().create_future()
+                task = asyncio.create_task(self._dispatch(msg, peer, ack))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                task.add_done_callback(lambda _t: slots.release())
+                pending.put_nowait((msg, ack))
+        except (ConnectionError, OSError) as ex:
+            # El analizador cortó la conexión (RST): lo ya recibido igual se procesa
+            logger.warning(f"Conexión MLLP de {peer} caída: {ex}")
         finally:
-            writer.close()
-            await writer.wait_closed()
+            pending.put_nowait(None)
+            try:
+                await acker
+            finally:
+                self.active -= 1
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except (ConnectionError, OSError):
+                    pass
+
+    async def listen(self):
+        """Abre el socket sin bloquear (útil para pruebas con port=0)."""
+        kwargs = {"reuse_port": True} if self.reuse_port else {}
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, **kwargs)
+        return self._server
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "accepted": self.accepted,
+            "active": self.active,
+            "messages": self.messages,
+            "in_flight": len(self._tasks),
+            "framing_errors": self.framing_errors,
+        }
 
     async def start(self):
-        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        await self.listen()
         async with self._server:
             await self._server.serve_forever()
@@ -0,0 +1,249 @@
+import asyncio
+import socket
+from typing import Any, Dict, List, Optional, Set
+
+from app.commons.logger import logger
+from app.helpers.tcp_transport import (
+    DEFAULT_MAX_FRAME,
+    VT,
+    MllpFrameError,
+    MllpFramer,
+    decode_payload,
+)
+
+DEFAULT_RCVBUF = 4 * 1024 * 1024  # 4 MiB: aguanta ráfagas mientras el loop está ocupado
+DEFAULT_IDLE_FLUSH = 0.2  # s sin datagramas de un peer = fin del mensaje (HL7 sin MLLP)
+FORMATS = ("auto", "HL7", "ASTM")
+
+
+def guess_payload_format(payload: str) -> str:
+    # Heurística rápida: HL7 suele iniciar con 'MSH'
+    return "HL7" if payload.lstrip().startswith("MSH") else "ASTM"
+
+
+class _PeerBuffer:
+    """
+    Reensamblado por peer.
+
+    - Con MLLP (el primer byte es VT) se usa el mismo enmarcador que TCP.
+    - Sin MLLP, un mensaje termina cuando llega otro que empieza con MSH
+      o cuando el peer deja de enviar durante `idle_flush` segundos.
+    """
+
+    __slots__ = ("framer", "chunks", "size", "parts", "timer")
+
+    def __init__(self):
+        self.framer: Optional[MllpFramer] = None
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.parts = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def take(self) -> Optional[bytes]:
+        if not self.chunks:
+            return None
+        data = self.chunks[0] if len(self.chunks) == 1 else b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        self.parts = 0
+        return data
+
+
+class FinecareUdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server: "UdpServer"):
+        self.server = server
+
+    def datagram_received(self, data: bytes, addr):
+        self.server._on_datagram(data, addr)
+
+    def error_received(self, exc: Exception):
+        logger.warning(f"UDP error: {exc}")
+
+
+class UdpServer:
+    """
+    Receptor UDP (Finecare) que entrega los mensajes directo al pipeline.
+
+    - `on_message_async(text, peer)` recibe cada mensaje HL7 ya reensamblado.
+    - `on_raw_async(text, peer, fmt)` (opcional) recibe además cada mensaje
+      para dejarlo en disco; los que no son HL7 (ASTM) solo van ahí.
+    - SO_RCVBUF grande para no perder datagramas en ráfagas; `max_pending`
+      acota los mensajes en vuelo (los que excedan se cuentan como descartados).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        on_message_async,
+        on_raw_async=None,
+        message_format: str = "auto",
+        rcvbuf: int = DEFAULT_RCVBUF,
+        idle_flush: float = DEFAULT_IDLE_FLUSH,
+        max_message: int = DEFAULT_MAX_FRAME,
+        max_pending: int = 10000,
+    ):
+        if message_format not in FORMATS:
+            raise ValueError(f"message_format inválido: {message_format!r} (use {FORMATS})")
+        self.host = host
+        self.port = port
+        self.on_message_async = on_message_async
+        self.on_raw_async = on_raw_async
+        self.message_format = message_format
+        self.rcvbuf = int(rcvbuf)
+        self.idle_flush = float(idle_flush)
+        self.max_message = int(max_message)
+        self.max_pending = max(1, int(max_pending))
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._peers: Dict[Any, _PeerBuffer] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        # stats
+        self.datagrams = 0
+        self.bytes = 0
+        self.messages = 0
+        self.reassembled = 0
+        self.unsupported = 0
+        self.dropped = 0
+        self.framing_errors = 0
+
+    # -------- socket --------
+
+    def _make_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        except OSError as ex:
+            logger.warning(f"No se pudo fijar SO_RCVBUF={self.rcvbuf}: {ex}")
+        sock.bind((self.host, self.port))
+        sock.setblocking(False)
+        effective = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if effective < self.rcvbuf:
+            # Linux lo limita a net.core.rmem_max (y reporta el doble de lo concedido)
+            logger.warning(f"SO_RCVBUF efectivo {effective} < {self.rcvbuf} solicitado")
+        return sock
+
+    async def listen(self) -> asyncio.DatagramTransport:
+        """Abre el socket sin bloquear (útil para pruebas con port=0)."""
+        self._loop = asyncio.get_running_loop()
+        self.transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: FinecareUdpProtocol(self), sock=self._make_socket()
+        )
+        return self.transport
+
+    async def start(self):
+        await self.listen()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.close()
+
+    def close(self):
+        for peer in list(self._peers):
+            self._flush_peer(peer)
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    # -------- reensamblado --------
+
+    def _on_datagram(self, data: bytes, peer):
+        self.datagrams += 1
+        self.bytes += len(data)
+        buf = self._peers.get(peer)
+        if buf is None:
+            buf = self._peers[peer] = _PeerBuffer()
+
+        if buf.framer is None and not buf.chunks and data.lstrip(b"\r\n ")[:1] == VT:
+            buf.framer = MllpFramer(max_frame=self.max_message, on_error=self._framing_error)
+        if buf.framer is not None:
+            for text in buf.framer.feed(data):
+                self._emit(text, peer)
+            # El timer también libera el estado de peers que dejan de enviar
+            self._arm_timer(peer, buf)
+            return
+
+        # HL7 sin MLLP: un MSH al inicio del datagrama cierra el mensaje anterior
+        if buf.chunks and data[:3] == b"MSH":
+            self._emit_bytes(buf, peer)
+        buf.chunks.append(data)
+        buf.size += len(data)
+        buf.parts += 1
+        if buf.size > self.max_message:
+            self._framing_error(
+                MllpFrameError("oversize", f"mensaje UDP > {self.max_message} bytes", buf.size)
+            )
+            buf.take()
+            return
+        self._arm_timer(peer, buf)
+
+    def _arm_timer(self, peer, buf: _PeerBuffer):
+        if buf.timer is not None:
+            buf.timer.cancel()
+        buf.timer = self._loop.call_later(self.idle_flush, self._flush_peer, peer)
+
+    def _flush_peer(self, peer):
+        buf = self._peers.pop(peer, None)
+        if buf is None:
+            return
+        if buf.timer is not None:
+            buf.timer.cancel()
+        if buf.framer is not None:
+            buf.framer.close()
+        else:
+            self._emit_bytes(buf, peer)
+
+    def _emit_bytes(self, buf: _PeerBuffer, peer):
+        parts = buf.parts
+        data = buf.take()
+        if data is None or not data.strip():
+            return
+        if parts > 1:
+            self.reassembled += 1
+        self._emit(decode_payload(data), peer)
+
+    def _framing_error(self, err: MllpFrameError):
+        self.framing_errors += 1
+        logger.warning(f"UDP: {err}")
+
+    # -------- entrega al pipeline --------
+
+    def _emit(self, text: str, peer):
+        fmt = self.message_format
+        if fmt == "auto":
+            fmt = guess_payload_format(text)
+        if len(self._tasks) >= self.max_pending:
+            self.dropped += 1
+            logger.error(f"UDP: {len(self._tasks)} mensajes en vuelo; se descarta uno de {peer}")
+            return
+        self.messages += 1
+        if fmt != "HL7":
+            self.unsupported += 1
+            if self.on_raw_async is None:
+                logger.warning(f"UDP: mensaje {fmt} de {peer} sin destino (spool deshabilitado)")
+                return
+        task = asyncio.ensure_future(self._deliver(text, peer, fmt))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, text: str, peer, fmt: str):
+        try:
+            if self.on_raw_async is not None:
+                await self.on_raw_async(text, peer, fmt)
+            if fmt == "HL7":
+                await self.on_message_async(text, peer)
+        except Exception as ex:
+            logger.exception(f"Error entregando mensaje UDP de {peer}: {ex}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "datagrams": self.datagrams,
+            "bytes": self.bytes,
+            "messages": self.messages,
+            "reassembled": self.reassembled,
+            "unsupported": self.unsupported,
+            "dropped": self.dropped,
+            "framing_errors": self.framing_errors,
+            "in_flight": len(self._tasks),
+            "peers": len(self._peers),
+        }
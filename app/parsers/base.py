@@ -1,4 +1,6 @@
-from typing import List
+from typing import List, Optional, Union
+
+from app.commons.hl7_message import HL7Message
 
 
 def _split_fields(seg: str) -> List[str]:
@@ -9,19 +11,25 @@ def _split_comp(val: str) -> List[str]:
     return val.split("^") if val else []
 
 
-def detect_profile(hl7: str) -> str:
-    """Return 'ICON3' or 'FINECARE'."""
-    lines = [line for line in hl7.splitlines() if line.strip()]
-    msh = next((line for line in lines if line.startswith("MSH")), "")
-    sft = next((line for line in lines if line.startswith("SFT")), "")
-    f = _split_fields(msh)
+def detect_builtin(hl7: Union[str, HL7Message]) -> Optional[str]:
+    """Detector de los analizadores incorporados: 'ICON3', 'FINECARE' o None si no reconoce."""
+    # Solo mira campos que forman la clave del caché de detección (ParserRegistry.detect)
+    msg = HL7Message.coerce(hl7)
+    sft = msg.first_segment("SFT")
+    f = msg.first_fields("MSH")
     sending_app = f[2] if len(f) > 2 else ""
     version = f[11] if len(f) > 11 else ""
+    charset = f[17] if len(f) > 17 else ""
 
     if "Icon-3" in sending_app or "Icon-3" in sft:
         return "ICON3"
     if "QIAnalyzer" in sending_app:
         return "FINECARE"
-    if "UNICODE UTF-8" in msh and version.startswith("2.5"):
+    if "UNICODE UTF-8" in charset and version.startswith("2.5"):
         return "ICON3"
-    return "FINECARE"
+    return None
+
+
+def detect_profile(hl7: Union[str, HL7Message]) -> str:
+    """Return 'ICON3' or 'FINECARE'."""
+    return detect_builtin(hl7) or "FINECARE"
@@ -1,54 +1,45 @@
-from typing import List
+from typing import List, Union
 
-from .base import _split_comp, _split_fields
-from .models import NormalizedResult, Observation, OrderInfo, Patient
+from app.commons.hl7_message import HL7Message
 
+from .models import NormalizedResult, Observation, OrderInfo, Patient, interned
 
-def parse_finecare(hl7: str) -> NormalizedResult:
-    # Normaliza líneas y descarta vacías
-    lines = [line for line in hl7.splitlines() if line.strip()]
 
-    # Segmentos principales
-    msh = next((line for line in lines if line.startswith("MSH")), "")
-    pid = next((line for line in lines if line.startswith("PID")), "")
-    obr = next((line for line in lines if line.startswith("OBR")), "")
+def parse_finecare(hl7: Union[str, HL7Message]) -> NormalizedResult:
+    # Segmentos ya indexados por tipo (sin volver a partir el texto)
+    msg = HL7Message.coerce(hl7)
 
     # MSH
-    f = _split_fields(msh)
+    f = msg.first_fields("MSH")
     version = f[11] if len(f) > 11 else "2.4"
 
     # PID
-    p = _split_fields(pid) if pid else []
+    p = msg.first_fields("PID")
     name = None
     if len(p) > 5 and p[5]:
-        comp = _split_comp(p[5])  # last^first normalmente
+        comp = msg.components(p[5])  # last^first normalmente
         # apellido^nombre → "nombre apellido"; si no hay ^, usa tal cual
         name = (comp[1] + " " + comp[0]).strip() if len(comp) > 1 else p[5]
 
     patient = Patient(
         name=name or None,
         dob=(p[7] if len(p) > 7 else None),
-        sex=(p[8] if len(p) > 8 else None),
+        sex=(interned(p[8]) if len(p) > 8 else None),
         id=(p[3] if len(p) > 3 else None),
     )
 
     # OBR
-    o = _split_fields(obr) if obr else []
+    o = msg.first_fields("OBR")
     order = OrderInfo(
         placer_order=o[1] if len(o) > 1 else None,
         filler_order=o[2] if len(o) > 2 else None,
         collection_dt=o[7] if len(o) > 7 else None,
-        sample_type=o[18] if len(o) > 18 else None,
+        sample_type=interned(o[18]) if len(o) > 18 else None,
     )
 
     # OBX (observaciones)
     observations: List[Observation] = []
-    for line in lines:
-        if not line.startswith("OBX|"):
-            continue
-
-        o = _split_fields(line)
-
+    for i, o in msg.iter_fields("OBX"):
         # Inicializa campos
         code = ""
         text = None
@@ -60,7 +51,7 @@ def parse_finecare(hl7: str) -> NormalizedResult:
 
         # OBX-3: CE -> "code^text" o solo "code"
         raw_obx3 = o[3] if len(o) > 3 else ""
-        comp = _split_comp(raw_obx3) if raw_obx3 else []
+        comp = msg.components(raw_obx3) if raw_obx3 else []
         if comp:
             code = comp[0] if len(comp) > 0 else (raw_obx3 or "")
             text = comp[1] if len(comp) > 1 else None
@@ -68,7 +59,7 @@ def parse_finecare(hl7: str) -> NormalizedResult:
             code = raw_obx3 or ""
 
         # Fallback 1: algunos Finecare ponen el nombre del analito en OBX-4 (texto plano)
-        if (not text) and len(o) > 4 and o[4] and "^" not in o[4]:
+        if (not text) and len(o) > 4 and o[4] and msg.seps["c"] not in o[4]:
             text = o[4]
 
         # Valores comunes
@@ -77,8 +68,8 @@ def parse_finecare(hl7: str) -> NormalizedResult:
         ref_range = o[7] if len(o) > 7 and o[7] != "" else None
 
         # Fallback 2: a veces meten "Testosterone^16" en OBX-9 (!)
-        if (not text or not code) and len(o) > 9 and o[9] and "^" in o[9]:
-            tcomp = _split_comp(o[9])
+        if (not text or not code) and len(o) > 9 and o[9] and msg.seps["c"] in o[9]:
+            tcomp = msg.components(o[9])
             if len(tcomp) >= 2:
                 a, b = tcomp[0], tcomp[1]
                 a_is_num, b_is_num = a.isdigit(), b.isdigit()
@@ -91,26 +82,27 @@ def parse_finecare(hl7: str) -> NormalizedResult:
                 else:
                     text = text or a
 
-        status = o[11] if len(o) > 11 and o[11] != "" else None
+        status = interned(o[11]) if len(o) > 11 and o[11] != "" else None
         measured_at = o[14] if len(o) > 14 and o[14] != "" else None
 
         observations.append(
             Observation(
-                code=code,
-                text=text,
+                code=interned(code),
+                text=interned(text),
                 value=value,
-                units=units,
+                units=interned(units),
                 status=status,
-                ref_range=ref_range,
+                ref_range=interned(ref_range),
                 measured_at=measured_at,
-                raw={"segment": line},
+                offset=msg.span(i)[0],
+                source=msg.text,
             )
         )
 
-    analyzer = _split_fields(msh)[2] if msh else "QIAnalyzer"
+    analyzer = f[2] if len(f) > 2 else "QIAnalyzer"
     return NormalizedResult(
-        analyzer=analyzer or "QIAnalyzer",
-        hl7_version=version,
+        analyzer=interned(analyzer or "QIAnalyzer"),
+        hl7_version=interned(version),
         patient=patient,
         order=order,
         observations=observations,
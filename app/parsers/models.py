@@ -1,11 +1,24 @@
 # ===============================
 # File: app/parsers/models.py
 # ===============================
-from dataclasses import dataclass
-from typing import Dict, List, Optional
+import re
+import sys
+from dataclasses import InitVar, dataclass, field
+from typing import Dict, List, Optional, Tuple
 
+_SEGMENT_AT = re.compile(r"[^\r\n]*")
 
-@dataclass
+# Modelos con __slots__: un backlog de resultados en memoria son millones de Observation.
+# Unidades, códigos, nombres y estados se repiten mensaje tras mensaje ("fL", "RBC", "F"):
+# los parsers los internan para que todas las observaciones compartan el mismo str.
+
+
+def interned(value: Optional[str]) -> Optional[str]:
+    """sys.intern para campos de baja cardinalidad (None y "" pasan tal cual)."""
+    return sys.intern(value) if value else value
+
+
+@dataclass(slots=True)
 class Patient:
     name: Optional[str] = None
     age: Optional[int] = None
@@ -14,7 +27,7 @@ class Patient:
     dob: Optional[str] = None  # YYYYMMDD
 
 
-@dataclass
+@dataclass(slots=True)
 class Observation:
     code: str
     text: Optional[str]
@@ -23,10 +36,39 @@ class Observation:
     status: Optional[str] = None
     ref_range: Optional[str] = None
     measured_at: Optional[str] = None  # OBX-14 if present
-    raw: Dict = None
+    # Segmento crudo: offset de inicio dentro del texto original (sin copiar la línea)
+    offset: Optional[int] = None
+    source: Optional[str] = None
+    # Compat: `raw=` del constructor anterior; si se pasa, reemplaza al valor derivado
+    raw: InitVar[Optional[Dict]] = None
+    _raw: Optional[Dict] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self, raw: Optional[Dict]):
+        self._raw = raw
+
+    @property
+    def span(self) -> Optional[Tuple[int, int]]:
+        if self.offset is None or self.source is None:
+            return None
+        return _SEGMENT_AT.match(self.source, self.offset).span()
+
+    @property
+    def segment(self) -> Optional[str]:
+        if self.offset is None or self.source is None:
+            return None
+        return _SEGMENT_AT.match(self.source, self.offset).group()
+
+
+def _observation_raw(self: Observation) -> Dict:
+    """Compat: antes era un dict {"segment": línea} guardado en cada observación."""
+    return self._raw if self._raw is not None else {"segment": self.segment}
+
+
+# Después del decorador: en el cuerpo de la clase el nombre `raw` es el InitVar del constructor
+Observation.raw = property(_observation_raw)
 
 
-@dataclass
+@dataclass(slots=True)
 class OrderInfo:
     placer_order: Optional[str] = None
     filler_order: Optional[str] = None
@@ -34,7 +76,7 @@ class OrderInfo:
     collection_dt: Optional[str] = None  # YYYYMMDDHHMMSS
 
 
-@dataclass
+@dataclass(slots=True)
 class NormalizedResult:
     analyzer: str
     hl7_version: str
@@ -0,0 +1,187 @@
+from collections import OrderedDict
+from importlib import import_module
+from importlib.metadata import entry_points
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.commons.hl7_message import HL7Message
+from app.commons.logger import logger
+from app.parsers.models import NormalizedResult
+
+# Analizadores instalados como paquete aparte: [project.entry-points."lab_integrator.parsers"]
+# NOMBRE = "paquete.modulo:parse_fn"; detector opcional en "lab_integrator.detectors" (mismo NOMBRE)
+PARSERS_GROUP = "lab_integrator.parsers"
+DETECTORS_GROUP = "lab_integrator.detectors"
+
+BUILTIN_PARSERS = {
+    "ICON3": "app.parsers.icon3:parse_icon3",
+    "FINECARE": "app.parsers.finecare:parse_finecare",
+}
+BUILTIN_DETECTOR = "app.parsers.base:detect_builtin"
+
+Parser = Callable[[HL7Message], NormalizedResult]
+Target = Any  # "modulo:atributo" | EntryPoint | callable
+
+
+def _load(target: Target) -> Callable:
+    """Importa el objeto recién cuando se usa (el módulo del parser no se carga antes)."""
+    if hasattr(target, "load"):  # EntryPoint
+        return target.load()
+    if callable(target):
+        return target
+    module, _, attr = str(target).partition(":")
+    if not attr:
+        raise ValueError(f"Referencia de parser inválida (use 'modulo:funcion'): {target!r}")
+    obj = import_module(module)
+    for part in attr.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+class _Lazy:
+    __slots__ = ("target", "fn")
+
+    def __init__(self, target: Target):
+        self.target = target
+        self.fn: Optional[Callable] = None
+
+    def get(self) -> Callable:
+        if self.fn is None:
+            self.fn = _load(self.target)
+        return self.fn
+
+
+class ParserRegistry:
+    """
+    Perfil -> parser, con detección por detectores registrados.
+
+    - Parsers y detectores se registran por referencia ('modulo:funcion') y se
+      importan la primera vez que se usan.
+    - La detección se cachea por (MSH-3, MSH-4, MSH-12, MSH-18, SFT, origen): una
+      conexión TCP o una carpeta de inbox que siempre trae el mismo analizador solo
+      corre los detectores con su primer mensaje. Un detector propio que mire otros
+      campos necesita `detect_cache_size: 0`.
+    """
+
+    def __init__(self, default: str = "FINECARE", cache_size: int = 1024):
+        self.default = default.upper()
+        self.cache_size = max(0, int(cache_size))
+        self._parsers: Dict[str, _Lazy] = {}
+        self._detectors: List[Tuple[int, int, Optional[str], _Lazy]] = []
+        self._cache: "OrderedDict[Tuple, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # -------- registro --------
+
+    def register(
+        self,
+        name: str,
+        parser: Target,
+        detect: Optional[Target] = None,
+        priority: int = 50,
+    ):
+        """Registra (o reemplaza) un perfil. `detect` True => el mensaje es de este perfil."""
+        name = str(name).upper()
+        self._parsers[name] = _Lazy(parser)
+        if detect is not None:
+            self.register_detector(detect, priority=priority, name=name)
+        self._cache.clear()
+
+    def register_detector(self, detect: Target, priority: int = 50, name: Optional[str] = None):
+        """
+        `detect(msg)` retorna el nombre del perfil, o True/False si se registró con `name`.
+        Menor `priority` se consulta primero; los incorporados usan 100.
+        """
+        self._detectors.append((int(priority), len(self._detectors), name, _Lazy(detect)))
+        self._detectors.sort(key=lambda d: (d[0], d[1]))
+        self._cache.clear()
+
+    def load_entry_points(self, group: str = PARSERS_GROUP) -> int:
+        """Registra los analizadores publicados por paquetes instalados (sin importarlos)."""
+        detectors = {ep.name.upper(): ep for ep in entry_points(group=DETECTORS_GROUP)}
+        count = 0
+        for ep in entry_points(group=group):
+            self.register(ep.name, ep, detect=detectors.get(ep.name.upper()))
+            count += 1
+        if count:
+            logger.info(f"Parsers por entry point ({group}): {count}")
+        return count
+
+    @classmethod
+    def from_config(cls, cfg: Optional[Dict[str, Any]] = None) -> "ParserRegistry":
+        """
+        Incorporados + entry points + bloque `parsers.registry` de la config:
+          NOMBRE: {parser: "mod:func", detect: "mod:func", priority: 50}
+        """
+        cfg = cfg or {}
+        reg = cls(
+            default=str(cfg.get("default") or "FINECARE"),
+            cache_size=cfg.get("detect_cache_size", 1024),
+        )
+        for name, target in BUILTIN_PARSERS.items():
+            reg.register(name, target)
+        reg.register_detector(BUILTIN_DETECTOR, priority=100)
+        if cfg.get("entry_points", True):
+            reg.load_entry_points()
+        for name, spec in (cfg.get("registry") or {}).items():
+            if isinstance(spec, str):
+                spec = {"parser": spec}
+            reg.register(
+                name, spec["parser"], detect=spec.get("detect"), priority=spec.get("priority", 50)
+            )
+        if reg.default not in reg._parsers:
+            raise ValueError(f"parsers.default no registrado: {reg.default!r}")
+        return reg
+
+    # -------- uso --------
+
+    def names(self) -> List[str]:
+        return list(self._parsers)
+
+    def parser(self, name: str) -> Parser:
+        lazy = self._parsers.get(str(name).upper())
+        if lazy is None:
+            raise ValueError(f"Parser no registrado: {name!r} (disponibles: {self.names()})")
+        return lazy.get()
+
+    def detect(self, msg: HL7Message, origin: Any = None) -> str:
+        f = msg.first_fields("MSH")
+        key = (
+            f[2] if len(f) > 2 else "",
+            f[3] if len(f) > 3 else "",
+            f[11] if len(f) > 11 else "",
+            f[17] if len(f) > 17 else "",
+            msg.first_segment("SFT"),
+            origin,
+        )
+        cache = self._cache
+        profile = cache.get(key)
+        if profile is not None:
+            self.hits += 1
+            cache.move_to_end(key)
+            return profile
+        self.misses += 1
+        profile = self._run_detectors(msg)
+        if self.cache_size:
+            cache[key] = profile
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return profile
+
+    def _run_detectors(self, msg: HL7Message) -> str:
+        for _prio, _seq, name, lazy in self._detectors:
+            found = lazy.get()(msg)
+            if isinstance(found, str) and found:
+                return found.upper()
+            if found and name:
+                return name
+        return self.default
+
+    def parse(self, msg: HL7Message, profile: str) -> NormalizedResult:
+        return self.parser(profile)(msg)
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "cached": len(self._cache)}
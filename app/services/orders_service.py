@@ -1,8 +1,33 @@
 import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, Iterable, List, Optional, Union
 
+from app.commons.hl7_ack import ACK_REJECT
+from app.commons.hl7_message import HL7Message
 from app.commons.logger import logger
 from app.helpers.file_transport import FileSender
-from app.helpers.tcp_transport import TcpSender
+from app.helpers.tcp_transport import MllpAckError, TcpSender
+
+
+@dataclass
+class OrderOutcome:
+    """Resultado de una orden dentro de un envío masivo."""
+
+    index: int
+    control_id: str = ""
+    status: str = "pending"  # sent | rejected | failed
+    attempts: int = 0
+    ack: Optional[str] = None
+    destination: Optional[str] = None  # archivo escrito (transporte file)
+    error: Optional[str] = None
+    elapsed_ms: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "sent"
 
 
 class OrdersService:
@@ -11,30 +36,151 @@ class OrdersService:
         self.transport_cfg = transport_cfg
         self.paths = paths
         self.retry = retry
+        # Un solo emisor TCP por servicio: sus conexiones se reutilizan entre órdenes
+        self._tcp_sender: Optional[TcpSender] = None
+        self._file_sender: Optional[FileSender] = None
 
-    async def send_order(self, payload: dict):
-        hl7 = self.router.render_order(payload)
-        self.router.archive_raw("sent", hl7, tag="order")
+    def _get_tcp_sender(self) -> TcpSender:
+        if self._tcp_sender is None:
+            tcp = self.transport_cfg["orders"]["tcp"]
+            self._tcp_sender = TcpSender(
+                tcp["host"],
+                tcp["port"],
+                tcp.get("timeout_sec", 5),
+                pool_size=tcp.get("pool_size", 2),
+                max_in_flight=tcp.get("max_in_flight", 8),
+                ack_timeout=tcp.get("ack_timeout_sec"),
+                idle_timeout=tcp.get("idle_timeout_sec", 60),
+                expect_ack=tcp.get("expect_ack", True),
+            )
+        return self._tcp_sender
 
-        if self.transport_cfg["orders"]["type"] == "file":
-            sender = FileSender(
+    def _get_file_sender(self) -> FileSender:
+        if self._file_sender is None:
+            self._file_sender = FileSender(
                 self.paths["outbox"], self.transport_cfg["orders"]["file"]["filename_pattern"]
             )
-            p = sender.send(hl7)
-            logger.info(f"Orden escrita en {p}")
+        return self._file_sender
+
+    async def close(self):
+        if self._tcp_sender is not None:
+            await self._tcp_sender.close()
+            self._tcp_sender = None
+
+    def _backoff(self, attempt: int) -> float:
+        """Backoff exponencial con jitter: base * 2^(n-1), tope max_backoff_sec, ± la mitad."""
+        base = float(self.retry.get("backoff_sec", 2))
+        delay = min(base * 2 ** (attempt - 1), float(self.retry.get("max_backoff_sec", 30)))
+        if self.retry.get("jitter", True):
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        return delay
+
+    async def _deliver(self, hl7: str, outcome: OrderOutcome):
+        """Un intento de entrega por el transporte configurado."""
+        if self.transport_cfg["orders"]["type"] == "file":
+            outcome.destination = await asyncio.to_thread(self._get_file_sender().send, hl7)
+            logger.info(f"Orden escrita en {outcome.destination}")
         else:
-            tcp = self.transport_cfg["orders"]["tcp"]
-            sender = TcpSender(tcp["host"], tcp["port"], tcp.get("timeout_sec", 5))
-            attempts = self.retry["attempts"]
-            backoff = self.retry["backoff_sec"]
+            outcome.ack = await self._get_tcp_sender().send(hl7)
+            logger.info(f"Orden enviada por TCP (ACK {outcome.ack or '-'})")
+
+    async def _dispatch(
+        self, payload: dict, index: int = 0, slots: Optional[asyncio.Semaphore] = None
+    ) -> OrderOutcome:
+        """
+        Renderiza, archiva y entrega una orden con reintentos.
+        Con `slots`, el cupo se toma solo durante cada intento: una orden esperando
+        su backoff no frena a las demás.
+        """
+        outcome = OrderOutcome(index=index)
+        t0 = time.perf_counter()
+        attempts = max(1, int(self.retry.get("attempts", 1)))
+        try:
+            hl7 = self.router.render_order(payload)
+            outcome.control_id = HL7Message(hl7).control_id or ""
+            await asyncio.to_thread(self.router.archive_raw, "sent", hl7, "order")
             for i in range(1, attempts + 1):
+                outcome.attempts = i
                 try:
-                    await sender.send(hl7)
-                    logger.info("Orden enviada por TCP")
+                    if slots is None:
+                        await self._deliver(hl7, outcome)
+                    else:
+                        async with slots:
+                            await self._deliver(hl7, outcome)
+                    outcome.status = "sent"
                     break
                 except Exception as ex:
-                    logger.error(f"Intento {i}/{attempts} fallo: {ex}")
+                    outcome.errors.append(f"{type(ex).__name__}: {ex}")
+                    if isinstance(ex, MllpAckError) and ex.code == ACK_REJECT:
+                        # AR: el receptor no la aceptará aunque se reintente
+                        logger.error(f"Orden {outcome.control_id} rechazada: {ex}")
+                        outcome.status = "rejected"
+                        outcome.ack = ex.code
+                        break
+                    logger.error(f"Orden {outcome.control_id} intento {i}/{attempts} fallo: {ex}")
                     if i < attempts:
-                        await asyncio.sleep(backoff)
+                        await asyncio.sleep(self._backoff(i))
                     else:
-                        raise
+                        outcome.status = "failed"
+        except Exception as ex:
+            # Render/archivo: no tiene sentido reintentar
+            logger.exception(f"Orden #{index} no se pudo preparar: {ex}")
+            outcome.errors.append(f"{type(ex).__name__}: {ex}")
+            outcome.status = "failed"
+        outcome.error = outcome.errors[-1] if outcome.status != "sent" else None
+        outcome.elapsed_ms = round((time.perf_counter() - t0) * 1000, 3)
+        return outcome
+
+    async def send_order(self, payload: dict) -> OrderOutcome:
+        outcome = await self._dispatch(payload)
+        if not outcome.ok:
+            raise RuntimeError(f"Orden {outcome.control_id or '#0'} no enviada: {outcome.error}")
+        return outcome
+
+    async def send_orders(
+        self,
+        payloads: Union[AsyncIterable[dict], Iterable[dict]],
+        concurrency: Optional[int] = None,
+    ) -> List[OrderOutcome]:
+        """
+        Envía un lote de órdenes en paralelo (hasta `concurrency` entregas a la vez)
+        y retorna un resultado por orden, en el orden de entrada.
+        El iterable se consume a medida que hay cupo, así no se materializa completo.
+        """
+        limit = concurrency or self.transport_cfg["orders"].get("concurrency", 16)
+        slots = asyncio.Semaphore(max(1, int(limit)))
+        # Acota órdenes vivas (incluidas las que esperan backoff) para no leer todo el iterable
+        window = asyncio.Semaphore(max(1, int(limit)) * 4)
+        tasks: List[asyncio.Task] = []
+        t0 = time.perf_counter()
+
+        async def one(payload: dict, index: int) -> OrderOutcome:
+            try:
+                return await self._dispatch(payload, index, slots)
+            finally:
+                window.release()
+
+        async def feed():
+            if hasattr(payloads, "__aiter__"):
+                async for payload in payloads:
+                    yield payload
+            else:
+                for payload in payloads:
+                    yield payload
+
+        index = 0
+        async for payload in feed():
+            await window.acquire()
+            tasks.append(asyncio.create_task(one(payload, index)))
+            index += 1
+        outcomes = list(await asyncio.gather(*tasks))
+
+        elapsed = time.perf_counter() - t0
+        sent = sum(1 for o in outcomes if o.ok)
+        logger.info(
+            f"Lote de órdenes: {sent}/{len(outcomes)} enviadas, "
+            f"{sum(1 for o in outcomes if o.status == 'rejected')} rechazadas, "
+            f"{sum(1 for o in outcomes if o.status == 'failed')} fallidas "
+            f"en {elapsed:.2f}s ({len(outcomes) / max(elapsed, 1e-9):.1f} órdenes/s)"
+        )
+        return outcomes
@@ -1,19 +1,51 @@
 # app/services/results_service.py
 import asyncio
-import json
+import functools
 import os
 import re
-import shutil
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Union
+from typing import Optional, Set, Union
 
 from pydantic import ValidationError
 
+from app.commons.histograms import attach_metrics
+from app.commons.hl7_ack import ACK_ACCEPT, ACK_ERROR, ACK_REJECT
+from app.commons.hl7_message import HL7Message
 from app.commons.logger import logger
+from app.commons.metrics import (
+    DEFAULT_SNAPSHOT_SEC,
+    Metrics,
+    MetricsServer,
+    write_snapshot,
+)
+from app.commons.parse_pool import InvalidResultError, ParsePool
+from app.helpers.async_writer import AsyncFileWriter
+from app.helpers.backlog import (
+    LEGACY_MANIFEST_NAME,
+    MANIFEST_NAME,
+    BacklogManifest,
+    scan_inbox,
+)
+from app.helpers.dedupe import (
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_TTL_SEC,
+    DedupeCache,
+    message_key,
+)
 from app.helpers.file_transport import FileWatcher
-from app.helpers.tcp_transport import TcpServer
-from app.validation.validators import validate_hl7_message_or_raise
+from app.helpers.histogram_sidecar import HistogramSidecar
+from app.helpers.inbox_claim import (
+    DEFAULT_HEARTBEAT_SEC,
+    DEFAULT_ORPHAN_AFTER_SEC,
+    InboxClaimer,
+)
+from app.helpers.ingest_queue import IngestQueue
+from app.helpers.ndjson_sink import DEFAULT_MAX_AGE_SEC, DEFAULT_MAX_BYTES, NdjsonSink
+from app.helpers.raw_spool import DEFAULT_SEGMENT_BYTES, RawSpool
+from app.helpers.tcp_transport import DEFAULT_MAX_FRAME, TcpServer
+from app.helpers.udp_transport import DEFAULT_IDLE_FLUSH, DEFAULT_RCVBUF, UdpServer
 
 
 def generate_inbox_filename(
@@ -49,93 +81,640 @@ def generate_inbox_filename(
     return filename
 
 
+def detection_origin(src: str) -> str:
+    """Origen para la caché de detección de perfil: el peer (tcp_/udp_) o la carpeta del archivo."""
+    if not src or src.startswith(("tcp_", "udp_")):
+        return src
+    return str(Path(src).parent)
+
+
 class ResultsService:
-    def __init__(self, router, transport_cfg, paths, strict_histogram_256: bool = True):
+    def __init__(
+        self,
+        router,
+        transport_cfg,
+        paths,
+        strict_histogram_256: bool = True,
+        writer_cfg: Optional[dict] = None,
+        ingest_cfg: Optional[dict] = None,
+        parse_cfg: Optional[dict] = None,
+        spool_cfg: Optional[dict] = None,
+        output_cfg: Optional[dict] = None,
+        histogram_cfg: Optional[dict] = None,
+        dedupe_cfg: Optional[dict] = None,
+        metrics_cfg: Optional[dict] = None,
+    ):
         self.router = router
         self.transport_cfg = transport_cfg
         self.paths = paths
         self.strict_histogram_256 = strict_histogram_256
         Path(paths["archive"]).mkdir(parents=True, exist_ok=True)
         Path(paths["error"]).mkdir(parents=True, exist_ok=True)
+        # Toda escritura a disco del pipeline pasa por aquí (fuera del event loop)
+        writer_cfg = writer_cfg or {}
+        self.writer = AsyncFileWriter(
+            workers=writer_cfg.get("workers", 1),
+            max_pending=writer_cfg.get("max_pending", 1000),
+            name="results-writer",
+        )
+        # Cola acotada + workers entre los listeners y _process_text
+        ingest_cfg = ingest_cfg or {}
+        self.ingest = IngestQueue(
+            self._process_text,
+            maxsize=ingest_cfg.get("max_queue", 1000),
+            workers=ingest_cfg.get("workers", 4),
+            name="results-ingest",
+        )
+        # Histogramas Icon-3: métricas derivadas y/o sidecar binario en lugar de base64
+        histogram_cfg = histogram_cfg or {}
+        self.histogram_metrics: Optional[dict] = None
+        if histogram_cfg.get("metrics", False):
+            self.histogram_metrics = {"fl_per_bin": histogram_cfg.get("fl_per_bin") or {}}
+        self.sidecar: Optional[HistogramSidecar] = None
+        if histogram_cfg.get("output", "base64") == "sidecar":
+            self.sidecar = HistogramSidecar(
+                self.writer,
+                histogram_cfg.get("sidecar_dir") or Path(paths["archive"]) / "histograms",
+            )
+        # Opcional: validación + parseo en procesos (mode: inline | process)
+        parse_cfg = parse_cfg or {}
+        self.parse_pool: Optional[ParsePool] = None
+        if parse_cfg.get("mode", "inline") == "process":
+            self.parse_pool = ParsePool(
+                router.engine.cfg,
+                workers=parse_cfg.get("workers") or None,
+                histogram_metrics=self.histogram_metrics,
+            )
+        # Opcional: journal append-only para los crudos (reemplaza un .hl7 por mensaje)
+        spool_cfg = spool_cfg or {}
+        self.spool: Optional[RawSpool] = None
+        if spool_cfg.get("enabled", False):
+            self.spool = RawSpool(
+                spool_cfg.get("dir") or Path(paths["logs_root"]) / "raw" / "spool",
+                segment_bytes=spool_cfg.get("segment_bytes", DEFAULT_SEGMENT_BYTES),
+                max_batch=spool_cfg.get("max_batch", 256),
+                commit_delay_ms=spool_cfg.get("commit_delay_ms", 0),
+                fsync=spool_cfg.get("fsync", True),
+                max_segments=spool_cfg.get("max_segments", 0),
+                name="results-spool",
+            )
+        # Salida: un .json por resultado (compat) o NDJSON rotado con manifiesto
+        output_cfg = output_cfg or {}
+        self.sink: Optional[NdjsonSink] = None
+        if output_cfg.get("format", "files") == "ndjson":
+            nd = output_cfg.get("ndjson") or {}
+            self.sink = NdjsonSink(
+                nd.get("dir") or Path(paths["archive"]) / "ndjson",
+                prefix=nd.get("prefix", "results"),
+                max_bytes=nd.get("max_bytes", DEFAULT_MAX_BYTES),
+                max_age_sec=nd.get("max_age_sec", DEFAULT_MAX_AGE_SEC),
+                max_batch=nd.get("max_batch", 512),
+                flush_delay_ms=nd.get("flush_delay_ms", 0),
+                fsync=nd.get("fsync", False),
+                name="results-ndjson",
+            )
+        self.tcp_server: Optional[TcpServer] = None  # en run_tcp_mode (para stats)
+        # Opcional: duplicados (reenvíos sin ACK, eventos repetidos del watcher) se responden
+        # con el ACK original sin volver a archivar, parsear ni escribir
+        dedupe_cfg = dedupe_cfg or {}
+        self.dedupe: Optional[DedupeCache] = None
+        if dedupe_cfg.get("enabled", False):
+            self.dedupe = DedupeCache(
+                dedupe_cfg.get("store") or Path(paths["logs_root"]) / "dedupe.jsonl",
+                self.writer,
+                ttl_sec=dedupe_cfg.get("ttl_sec", DEFAULT_TTL_SEC),
+                max_entries=dedupe_cfg.get("max_entries", DEFAULT_MAX_ENTRIES),
+            )
+        # Opcional (modo carpeta): varios procesos/hosts drenan el mismo inbox reclamando
+        # cada archivo por rename a processing/<worker-id>/
+        claim_cfg = self._claim_cfg(transport_cfg)
+        self.claims: Optional[InboxClaimer] = None
+        if claim_cfg.get("enabled", False):
+            self.claims = InboxClaimer(
+                paths["inbox"],
+                claim_cfg.get("processing_dir") or None,
+                worker_id=claim_cfg.get("worker_id") or None,
+                heartbeat_sec=claim_cfg.get("heartbeat_sec", DEFAULT_HEARTBEAT_SEC),
+                orphan_after_sec=claim_cfg.get("orphan_after_sec", DEFAULT_ORPHAN_AFTER_SEC),
+            )
+        # Modo carpeta: lo que terminó en AA/AR no se reprocesa tras un reinicio.
+        # Con claims los archivos siempre salen del inbox: el manifiesto (compartido) sobra
+        file_cfg = ((transport_cfg or {}).get("results") or {}).get("file") or {}
+        backlog_cfg = file_cfg.get("backlog") or {}
+        self.manifest = BacklogManifest(
+            Path(paths["logs_root"]) / MANIFEST_NAME,
+            self.writer,
+            enabled=bool(backlog_cfg.get("manifest", True)) and self.claims is None,
+            legacy_path=Path(paths["inbox"]) / LEGACY_MANIFEST_NAME,
+        )
+        # Opcional: contadores e histogramas por etapa, endpoint Prometheus y snapshot a disco
+        self.metrics_cfg = metrics_cfg or {}
+        self.metrics: Optional[Metrics] = None
+        self.metrics_server: Optional[MetricsServer] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+        if self.metrics_cfg.get("enabled", False):
+            self.metrics = Metrics(prefix=self.metrics_cfg.get("prefix", "lab_integrator"))
+            self._register_gauges()
+
+    def _register_gauges(self):
+        """Profundidades y ocupación: se leen al exportar, no cuestan nada por mensaje."""
+        m = self.metrics
+        m.gauge("queue_depth", lambda: self.ingest.stats()["queue_depth"], queue="ingest")
+        m.gauge("queue_depth", lambda: self.writer.stats()["queue_depth"], queue="writer")
+        m.gauge("in_flight", lambda: self.ingest.stats()["busy"], component="ingest")
+        if self.spool is not None:
+            m.gauge("queue_depth", self.spool.pending_count, queue="spool")
+
+    @staticmethod
+    def _claim_cfg(transport_cfg) -> dict:
+        file_cfg = ((transport_cfg or {}).get("results") or {}).get("file") or {}
+        return file_cfg.get("claim") or {}
+
+    async def _write_error(self, hl7_text: str, src: str) -> Path:
+        # → Este archivo está mal: llévalo a error/ y NO tumbar el servicio
+        err_name = Path(src).name if src else "tcp_result.err.hl7"
+        errp = Path(self.paths["error"]) / err_name
+        if self.claims is not None and src and self.claims.owns(src):
+            # Reclamado: sale de processing/ a error/ (no queda copia en el inbox)
+            await self.writer.move(src, errp)
+        else:
+            await self.writer.write_text(errp, hl7_text, wait=False)
+        return errp
+
+    async def _archive_raw(self, hl7_text: str, src: str = "", durable: bool = False):
+        """Archiva el crudo; con spool retorna su seq (siempre durable, por group commit)."""
+        t0 = time.perf_counter()
+        if self.spool is not None:
+            receipt = await self.spool.append(hl7_text, src)
+        else:
+            raw_path = self.router.raw_archive_path("recv", tag="result")
+            # durable: espera a que quede en disco (fsync) antes de retornar
+            await self.writer.write_text(raw_path, hl7_text, wait=durable, fsync=durable)
+            receipt = None
+        if self.metrics is not None:
+            self.metrics.lap("archive", t0)
+        return receipt
+
+    async def _receive_durable(self, msg: HL7Message, peer):
+        """Punto de ACK en modo 'receipt': el crudo ya está persistido."""
+        return await self._archive_raw(msg.text, f"tcp_{peer}", durable=True)
+
+    async def _process_text(
+        self,
+        hl7: Union[str, HL7Message],
+        src: str,
+        archived: bool = False,
+        receipt: Optional[int] = None,
+    ) -> str:
+        """
+        Procesa un resultado y retorna el código de ACK (AA/AE/AR).
+        `receipt`: seq del spool si el crudo ya fue archivado; se marca procesado al final.
+        """
+        t0 = time.perf_counter()
+        # Se indexa una sola vez; validación, detección y parseo reusan el mismo objeto
+        msg = HL7Message.coerce(hl7)
+        if self.metrics is not None and msg is not hl7:
+            self.metrics.lap("frame", t0)  # TCP ya lo indexó (y lo midió) al leer el frame
+        try:
+            if self.claims is not None and src and self.claims.owns(src):
+                try:
+                    return await self._process_deduped(msg, src, archived, receipt)
+                finally:
+                    # Lo que siga en processing/ (p.ej. un duplicado rechazado) sale a error/
+                    if Path(src).exists():
+                        await self.writer.move(src, Path(self.paths["error"]) / Path(src).name)
+            return await self._process_deduped(msg, src, archived, receipt)
+        finally:
+            if self.metrics is not None:
+                self.metrics.lap("total", t0)
+
+    async def _process_deduped(
+        self, msg: HL7Message, src: str, archived: bool, receipt: Optional[int]
+    ) -> str:
+        if self.dedupe is None:
+            return await self._process_unique(msg, src, archived, receipt)
+        key = message_key(msg)
+        code = await self.dedupe.seen(key)
+        if code is not None:
+            await self._skip_duplicate(msg, src, receipt, code)
+            return code
+        self.dedupe.begin(key)
+        code = None
+        try:
+            code = await self._process_unique(msg, src, archived, receipt)
+            return code
+        finally:
+            await self.dedupe.finish(key, code)
+
+    async def _skip_duplicate(self, msg: HL7Message, src: str, receipt: Optional[int], code: str):
+        logger.info(f"Duplicado de MSH-10 {msg.control_id!r} ({src or 'tcp'}): ACK {code}")
+        if self.metrics is not None:
+            self.metrics.inc("duplicates_total", code=code)
+        if receipt is not None and self.spool is not None:
+            self.spool.mark_done(receipt)
+        # Un archivo repetido sale del inbox: a archive/hl7 (AA) o a error/ (AR), como el original
+        if src and Path(src).exists():
+            if code == ACK_ACCEPT:
+                await self.writer.move(src, Path(self.paths["archive"]) / "hl7" / Path(src).name)
+            elif code == ACK_REJECT:
+                await self.writer.move(src, Path(self.paths["error"]) / Path(src).name)
+
+    async def _process_unique(
+        self, msg: HL7Message, src: str, archived: bool, receipt: Optional[int]
+    ) -> str:
+        hl7_text = msg.text
+        # 1) archiva crudo siempre (en segundo plano, o en el spool)
+        if not archived:
+            receipt = await self._archive_raw(hl7_text, src)
+        try:
+            return await self._process_archived(msg, src)
+        finally:
+            if receipt is not None and self.spool is not None:
+                self.spool.mark_done(receipt)
 
-    async def _process_text(self, hl7_text: str, src: str):
-        # 1) archiva crudo siempre
-        self.router.archive_raw("recv", hl7_text, tag="result")
+    async def _process_archived(self, msg: HL7Message, src: str) -> str:
+        hl7_text = msg.text
+        m = self.metrics
+        t = time.perf_counter()
+        stage, analyzer = "validate", "unknown"
         try:
-            # 2) valida (MSH-9 requerido y histogramas de 256 bytes)
-            validate_hl7_message_or_raise(hl7_text)
-            # 3) extrae y escribe JSON
-            # data = self.router.extract_results(hl7_text)
-            data = self.router.transform_hl7_result(hl7_text)
-            filename = generate_inbox_filename(src, origin="file" if src else "tcp")
-            out_json = Path(self.paths["archive"]) / f"{filename}"
-            out_json.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-            logger.info(f"Resultado procesado y archivado: {out_json}")
+            if self.parse_pool is not None:
+                # 2+3) valida y mapea en un proceso del pool (solo viajan texto y payload)
+                stage = "pool"
+                data = await self.parse_pool.validate_and_map(hl7_text, detection_origin(src))
+                if m is not None:
+                    t = m.lap("pool", t)
+            else:
+                # 2) valida con las reglas del analizador (MSH-9, histogramas de 256 bytes...)
+                self.router.engine.validate(msg, detection_origin(src))
+                if m is not None:
+                    t = m.lap("validate", t)
+                # 3) extrae y escribe JSON (detect/parse/serialize se miden en el motor)
+                # data = self.router.extract_results(msg)
+                stage = "parse"
+                data = self.router.transform_hl7_result(msg, detection_origin(src), metrics=m)
+                if self.histogram_metrics is not None:
+                    t = time.perf_counter()
+                    attach_metrics([(data, msg)], self.histogram_metrics["fl_per_bin"])
+                    if m is not None:
+                        m.lap("histograms", t)
+                t = time.perf_counter()
+            analyzer = data.get("analyzer") or analyzer
+            stage = "write"
+            if self.sidecar is not None:
+                data = await self.sidecar.detach(data, msg)
+            if self.sink is not None:
+                segment = await self.sink.write(data)
+                logger.info(f"Resultado procesado y archivado en {segment}")
+            else:
+                filename = generate_inbox_filename(src, origin="file" if src else "tcp")
+                out_json = Path(self.paths["archive"]) / f"{filename}"
+                await self.writer.write_json(out_json, data)
+                logger.info(f"Resultado procesado y archivado: {out_json}")
 
             # 4) mueve el HL7 procesado a archive/hl7/
             if src and Path(src).exists():
                 dst_dir = Path(self.paths["archive"]) / "hl7"
-                dst_dir.mkdir(parents=True, exist_ok=True)
-                shutil.move(src, dst_dir / Path(src).name)
-
-        except ValidationError as ve:
-            if self.strict_histogram_256:
-                # → Este archivo está mal: llévalo a error/ y NO tumbar el servicio
-                err_name = Path(src).name if src else "tcp_result.err.hl7"
-                errp = Path(self.paths["error"]) / err_name
-                errp.write_text(hl7_text, encoding="utf-8")
-                logger.error(f"Validación falló para {err_name}: {ve}")
-                return  # early exit
-
-            # → Este archivo está mal: llévalo a error/ y NO tumbar el servicio
-            err_name = Path(src).name if src else "tcp_result.err.hl7"
-            errp = Path(self.paths["error"]) / err_name
-            errp.write_text(hl7_text, encoding="utf-8")
-            logger.error(f"Validación falló para {err_name}: {ve}")
-            return  # early exit
+                await self.writer.move(src, dst_dir / Path(src).name)
+            if m is not None:
+                m.lap("write", t)
+                m.inc("results_total", analyzer=analyzer, code=ACK_ACCEPT)
+            return ACK_ACCEPT
+
+        except (ValidationError, InvalidResultError) as ve:
+            self._count_failure(stage, ve, analyzer, ACK_REJECT)
+            errp = await self._write_error(hl7_text, src)
+            logger.error(f"Validación falló para {errp.name}: {ve}")
+            return ACK_REJECT  # early exit
         except Exception as ex:
             # Otros errores de parseo/extracción también van a error/
-            err_name = Path(src).name if src else "tcp_result.err.hl7"
-            errp = Path(self.paths["error"]) / err_name
-            errp.write_text(hl7_text, encoding="utf-8")
+            self._count_failure(stage, ex, analyzer, ACK_ERROR)
+            errp = await self._write_error(hl7_text, src)
             logger.exception(f"Error procesando resultado: {ex}. Movido a {errp}")
+            return ACK_ERROR
+
+    def _count_failure(self, stage: str, ex: Exception, analyzer: str, code: str):
+        if self.metrics is not None:
+            self.metrics.inc("errors_total", stage=stage, kind=type(ex).__name__)
+            self.metrics.inc("results_total", analyzer=analyzer, code=code)
+
+    def stats(self) -> dict:
+        out = {"ingest": self.ingest.stats(), "writer": self.writer.stats()}
+        if self.tcp_server is not None:
+            out["tcp"] = self.tcp_server.stats()
+        if self.parse_pool is None:
+            out["detect"] = self.router.engine.normalizer.registry.stats()
+        if self.spool is not None:
+            out["spool"] = self.spool.stats()
+        if self.sink is not None:
+            out["ndjson"] = self.sink.stats()
+        if self.dedupe is not None:
+            out["dedupe"] = self.dedupe.stats()
+        if self.claims is not None:
+            out["claims"] = self.claims.stats()
+        return out
+
+    def metrics_report(self) -> dict:
+        return {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "pid": os.getpid(),
+            "stats": self.stats(),
+            "metrics": self.metrics.snapshot(),
+        }
+
+    async def _write_metrics_snapshot(self):
+        path = self.metrics_cfg.get("snapshot_path")
+        if path:
+            report = self.metrics_report()  # en el loop: los gauges leen estado del pipeline
+            await (await self.writer.submit(path, write_snapshot, path, report))
+
+    async def _snapshot_loop(self):
+        every = float(self.metrics_cfg.get("snapshot_sec", DEFAULT_SNAPSHOT_SEC))
+        while True:
+            await asyncio.sleep(every)
+            try:
+                await self._write_metrics_snapshot()
+            except Exception as ex:
+                logger.warning(f"No se pudo escribir el snapshot de métricas: {ex}")
+
+    async def _start_metrics(self):
+        cfg = self.metrics_cfg
+        if cfg.get("port") not in (None, ""):
+            self.metrics_server = MetricsServer(
+                self.metrics, cfg.get("host", "127.0.0.1"), int(cfg["port"]), self.stats
+            )
+            try:
+                await self.metrics_server.start()
+            except OSError as ex:
+                # Sin endpoint se sigue procesando (p.ej. el puerto lo tiene otra instancia)
+                logger.error(f"No se pudo abrir el endpoint de métricas: {ex}")
+                self.metrics_server = None
+        if cfg.get("snapshot_path"):
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+    async def _stop_metrics(self):
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+            try:
+                await self._write_metrics_snapshot()  # el último, con los totales finales
+            except Exception as ex:
+                logger.warning(f"No se pudo escribir el snapshot de métricas: {ex}")
+        if self.metrics_server is not None:
+            await self.metrics_server.aclose()
+            self.metrics_server = None
+
+    async def startup(self):
+        await self.ingest.start()
+        if self.metrics is not None:
+            await self._start_metrics()
+        if self.claims is not None:
+            # Antes del spool: lo recuperado de workers caídos vuelve al inbox
+            recovered = await asyncio.to_thread(self.claims.open)
+            if recovered:
+                logger.info(f"Inbox: {recovered} archivo(s) en proceso recuperados al inbox")
+        if self.dedupe is not None:
+            await asyncio.to_thread(self.dedupe.load)
+        if self.parse_pool is not None:
+            # Arrancar procesos bloquea un rato: fuera del loop
+            await asyncio.to_thread(self.parse_pool.start)
+        if self.sink is not None:
+            await asyncio.to_thread(self.sink.open)
+        if self.spool is not None:
+            if await asyncio.to_thread(self.spool.open):
+                await self._replay_spool()
+
+    def _still_in_inbox(self, src: str) -> bool:
+        if Path(src).exists():
+            return True
+        # Reclamado por un worker que cayó: ya se devolvió al inbox
+        return self.claims is not None and self.claims.inbox_path(src).exists()
+
+    async def _replay_spool(self):
+        """Re-encola lo que quedó en el spool sin procesar (caída o apagado abrupto)."""
+        records = self.spool.pending()
+        replayed = 0
+        while True:
+            rec = await asyncio.to_thread(next, records, None)
+            if rec is None:
+                break
+            if rec.src and self._still_in_inbox(rec.src):
+                # Vino de la carpeta y el archivo sigue en el inbox: lo retoma el backlog
+                self.spool.mark_done(rec.seq)
+                continue
+            await self.ingest.submit(rec.text, rec.src, archived=True, receipt=rec.seq)
+            replayed += 1
+        if replayed:
+            logger.info(f"Spool: {replayed} mensaje(s) re-encolados tras el reinicio")
+
+    async def shutdown(self):
+        """Drena la cola de ingesta y luego vacía las escrituras pendientes."""
+        await self.ingest.drain()
+        if self.dedupe is not None:
+            await self.dedupe.flush()
+        await self.manifest.aclose()
+        if self.metrics is not None:
+            await self._stop_metrics()
+        await self.writer.aclose()
+        if self.claims is not None:
+            await asyncio.to_thread(self.claims.close)
+        if self.sink is not None:
+            await self.sink.aclose()
+        if self.spool is not None:
+            await self.spool.aclose()
+        if self.parse_pool is not None:
+            await asyncio.to_thread(self.parse_pool.shutdown)
+
+    async def _read_text(self, path: Path) -> str:
+        try:
+            return await asyncio.to_thread(path.read_text, encoding="utf-8")
+        except Exception as e:
+            logger.warning(f"No se pudo leer {path}: {e}; reintento breve...")
+            await asyncio.sleep(0.1)
+            return await asyncio.to_thread(path.read_text, encoding="utf-8")
+
+    async def _submit_file(self, text: str, path: str) -> asyncio.Future:
+        """Entrada del watcher: como en el backlog, un AA/AR queda en el manifiesto."""
+        fut = await self.ingest.submit(text, path)
+        if self.manifest.enabled:
+            fut.add_done_callback(functools.partial(self._record_outcome, Path(path).name))
+        return fut
+
+    def _record_outcome(self, name: str, fut: asyncio.Future):
+        if fut.cancelled() or fut.exception() is not None:
             return
+        if fut.result() in (ACK_ACCEPT, ACK_REJECT):
+            self.manifest.add(name)
 
     async def _process_backlog(self, glob_pat: str):
+        """
+        Drena el inbox en streaming (os.scandir), con hasta `concurrency` archivos en
+        vuelo, reporte de avance y un manifiesto que permite reanudar tras un reinicio.
+        """
         inbox = Path(self.paths["inbox"])
-        files = sorted(inbox.glob(glob_pat))
-        if not files:
-            return
-        logger.info(f"Backlog detectado: {len(files)} archivo(s) en {inbox}")
-        for f in files:
+        file_cfg = (self.transport_cfg.get("results") or {}).get("file") or {}
+        cfg = file_cfg.get("backlog") or {}
+        concurrency = max(1, int(cfg.get("concurrency", 16)))
+        progress_every = max(1, int(cfg.get("progress_every", 1000)))
+        progress_sec = float(cfg.get("progress_sec", 10))
+
+        manifest = self.manifest
+        skipped_before = await asyncio.to_thread(manifest.load)
+        if skipped_before:
+            logger.info(f"Manifiesto de backlog: {skipped_before} archivo(s) ya procesados")
+
+        slots = asyncio.Semaphore(concurrency)
+        tasks: Set[asyncio.Task] = set()
+        counts = {"seen": 0, "skipped": 0, "done": 0, "failed": 0}
+        t0 = last_report = time.monotonic()
+
+        async def one(path: Path):
             try:
-                text = f.read_text(encoding="utf-8")
-            except Exception as e:
-                logger.warning(f"No se pudo leer {f}: {e}; reintento breve...")
-                await asyncio.sleep(0.1)
-                text = f.read_text(encoding="utf-8")
-            # Asegura que un fallo no detenga el backlog completo
+                if self.claims is not None:
+                    path = await asyncio.to_thread(self.claims.claim, path)
+                    if path is None:
+                        counts["skipped"] += 1  # lo tomó otro worker
+                        return
+                text = await self._read_text(path)
+                code = await self.ingest.process(text, str(path))
+                counts["done" if code == ACK_ACCEPT else "failed"] += 1
+                # Solo lo definitivo: un AE (transitorio) se reintenta tras reiniciar
+                if code in (ACK_ACCEPT, ACK_REJECT):
+                    await manifest.record(path.name)
+            except Exception as ex:
+                counts["failed"] += 1
+                logger.exception(f"Fallo inesperado con {path}: {ex}")
+            finally:
+                slots.release()
+
+        def report(final: bool = False):
+            elapsed = max(time.monotonic() - t0, 1e-9)
+            finished = counts["done"] + counts["failed"]
+            logger.info(
+                f"Backlog {'terminado' if final else 'en curso'}: {finished} procesado(s) "
+                f"({counts['failed']} con error), {counts['skipped']} omitido(s), "
+                f"{finished / elapsed:.1f} arch/s"
+            )
+
+        # El listado sale de un hilo por lotes: el loop sigue atendiendo TCP/UDP/métricas
+        async for entry in scan_inbox(inbox, glob_pat):
+            counts["seen"] += 1
+            if entry.name in manifest:
+                counts["skipped"] += 1
+                continue
+            if counts["seen"] == 1 + counts["skipped"]:
+                logger.info(
+                    f"Backlog detectado en {inbox}; drenando con concurrencia {concurrency}"
+                )
+            await slots.acquire()
+            task = asyncio.create_task(one(Path(entry.path)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            now = time.monotonic()
+            if counts["seen"] % progress_every == 0 or now - last_report >= progress_sec:
+                last_report = now
+                report()
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        if counts["seen"] > counts["skipped"]:
+            report(final=True)
+        await manifest.compact(inbox)
+
+    async def _heartbeat(self):
+        """Latido del worker y recuperación periódica de huérfanos (modo carpeta con claims)."""
+        while True:
+            await asyncio.sleep(self.claims.heartbeat_sec)
             try:
-                await self._process_text(text, str(f))
+                await asyncio.to_thread(self.claims.heartbeat)
+                await asyncio.to_thread(self.claims.recover_orphans)
             except Exception as ex:
-                logger.exception(f"Fallo inesperado con {f}: {ex}")
+                logger.exception(f"Inbox: fallo en latido/recuperación: {ex}")
 
     async def run_file_mode(self, glob_pat: str):
         loop = asyncio.get_running_loop()
+        await self.startup()
 
         # 1) Procesar backlog existente
         await self._process_backlog(glob_pat)
 
-        # 2) Arrancar watcher para nuevos archivos
-        watcher = FileWatcher(self.paths["inbox"], glob_pat, self._process_text, loop)
+        # 2) Arrancar watcher para nuevos archivos (espera en submit si la cola está llena)
+        file_cfg = (self.transport_cfg.get("results") or {}).get("file") or {}
+        watcher = FileWatcher(
+            self.paths["inbox"],
+            glob_pat,
+            self._submit_file,
+            loop,
+            stable_sec=file_cfg.get("stable_ms", 500) / 1000,
+            poll_sec=file_cfg.get("poll_ms", 100) / 1000,
+            source=file_cfg.get("source", "auto"),
+            claim=self.claims.claim if self.claims is not None else None,
+        )
         watcher.start()
+        heartbeat = asyncio.create_task(self._heartbeat()) if self.claims is not None else None
         logger.info("Escuchando carpeta de resultados...")
         try:
             await asyncio.Event().wait()
         finally:
             watcher.stop()
+            if heartbeat is not None:
+                heartbeat.cancel()
+            logger.info(f"Watcher detenido: {watcher.stats()}")
+            await self.shutdown()
+
+    async def _write_incoming(self, text: str, peer, fmt: str, inbox: Path):
+        """Copia opcional a disco de lo recibido por UDP (los ASTM solo quedan aquí)."""
+        ext = "hl7" if fmt == "HL7" else "astm"
+        name = generate_inbox_filename(peer, analyzer="finecare", origin="udp", extension=ext)
+        await self.writer.write_text(inbox / name, text, wait=False)
 
-    async def run_tcp_mode(self, host: str, port: int):
-        server = TcpServer(host, port, lambda txt, peer: self._process_text(txt, f"tcp_{peer}"))
-        logger.info(f"Servidor TCP resultados en {host}:{port}")
-        await server.start()
+    async def run_udp_mode(self, host: str, port: int):
+        udp_cfg = (self.transport_cfg.get("results") or {}).get("finecare") or {}
+        on_raw = None
+        if udp_cfg.get("spool_incoming", False):
+            inbox = Path(udp_cfg.get("spool_dir") or Path(self.paths["inbox"]) / "finecare")
+            on_raw = functools.partial(self._write_incoming, inbox=inbox)
+        server = UdpServer(
+            host,
+            port,
+            lambda text, peer: self.ingest.submit(text, f"udp_{peer[0]}_{peer[1]}"),
+            on_raw_async=on_raw,
+            message_format=udp_cfg.get("message_format", "auto"),
+            rcvbuf=udp_cfg.get("rcvbuf_bytes", DEFAULT_RCVBUF),
+            idle_flush=udp_cfg.get("idle_flush_ms", DEFAULT_IDLE_FLUSH * 1000) / 1000,
+        )
+        logger.info(f"Receptor UDP Finecare en {host}:{port}")
+        await self.startup()
+        try:
+            await server.start()
+        finally:
+            logger.info(f"Receptor UDP detenido: {server.stats()}")
+            await self.shutdown()
+
+    async def run_tcp_mode(self, host: str, port: int, reuse_port: bool = False):
+        tcp_cfg = (self.transport_cfg.get("results") or {}).get("tcp") or {}
+        ack_mode = tcp_cfg.get("ack_mode", "processed")
+        server = TcpServer(
+            host,
+            port,
+            lambda msg, peer, receipt=None: self.ingest.process(
+                msg, f"tcp_{peer}", archived=ack_mode == "receipt", receipt=receipt
+            ),
+            ack_mode=ack_mode,
+            on_receipt_async=self._receive_durable,
+            pipeline_depth=tcp_cfg.get("pipeline_depth", 8),
+            max_frame=tcp_cfg.get("max_frame_bytes", DEFAULT_MAX_FRAME),
+            read_size=tcp_cfg.get("read_size") or None,
+            reuse_port=reuse_port,
+            metrics=self.metrics,
+        )
+        self.tcp_server = server
+        if self.metrics is not None:
+            self.metrics.gauge("mllp_connections", lambda: server.active)
+            self.metrics.gauge("in_flight", lambda: server.stats()["in_flight"], component="tcp")
+        logger.info(f"Servidor TCP resultados en {host}:{port} (ack_mode={ack_mode})")
+        await self.startup()
+        try:
+            await server.start()
+        finally:
+            await self.shutdown()
@@ -0,0 +1,274 @@
+import asyncio
+import copy
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.commons.hl7_engine import HL7Engine
+from app.commons.logger import logger, setup_logging
+from app.helpers.router import FlowRouter
+from app.services.results_service import ResultsService
+
+DEFAULT_STATS_SEC = 10.0
+DEFAULT_MAX_BACKOFF_SEC = 30.0
+QUICK_EXIT_SEC = 5.0  # un worker que cae antes de esto se reinicia con backoff
+
+
+def reuse_port_supported() -> bool:
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+def _section(cfg: Dict[str, Any], key: str) -> Dict[str, Any]:
+    if not isinstance(cfg.get(key), dict):
+        cfg[key] = {}
+    return cfg[key]
+
+
+def worker_settings(cfg: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """
+    Copia de settings para el worker `index`: todo lo que es de un solo escritor
+    (spool, NDJSON, sidecar de histogramas, store de dedupe, snapshot y puerto de
+    métricas) pasa a rutas propias.
+    El índice se mantiene al reiniciar un worker, así recupera su propio spool.
+    """
+    cfg = copy.deepcopy(cfg)
+    paths = cfg["paths"]
+    tag = f"w{index}"
+    spool = _section(cfg, "spool")
+    spool["dir"] = str(Path(spool.get("dir") or Path(paths["logs_root"]) / "raw" / "spool") / tag)
+    nd = _section(_section(cfg, "output"), "ndjson")
+    nd["prefix"] = f"{nd.get('prefix', 'results')}-{tag}"
+    hist = _section(cfg, "histograms")
+    hist["sidecar_dir"] = str(
+        Path(hist.get("sidecar_dir") or Path(paths["archive"]) / "histograms") / tag
+    )
+    # Caché por worker: un reenvío que entra por otra conexión suele caer en otro worker
+    dedupe = _section(cfg, "dedupe")
+    store = Path(dedupe.get("store") or Path(paths["logs_root"]) / "dedupe.jsonl")
+    dedupe["store"] = str(store.with_name(f"{store.stem}-{tag}{store.suffix}"))
+    metrics = _section(cfg, "metrics")
+    if metrics.get("port"):
+        # Cada worker expone su propio endpoint en puerto base + 1 + índice
+        metrics["port"] = int(metrics["port"]) + 1 + index
+    if metrics.get("snapshot_path"):
+        snap = Path(metrics["snapshot_path"])
+        metrics["snapshot_path"] = str(snap.with_name(f"{snap.stem}-{tag}{snap.suffix}"))
+    return cfg
+
+
+def build_results_service(cfg: Dict[str, Any]) -> ResultsService:
+    """
+    ResultsService con el motor y las secciones de settings.yaml. Lo usan los comandos
+    de resultados de run.py y cada worker del supervisor.
+    """
+    paths = cfg["paths"]
+    template = Path(paths["executable"]) / paths["config"] / cfg["filename"]["template_hl7"]
+    engine = HL7Engine(
+        str(template), parsers_cfg=cfg.get("parsers"), validation_cfg=cfg.get("validation")
+    )
+    router = FlowRouter(engine, cfg)
+    return ResultsService(
+        router,
+        cfg["transport"],
+        cfg["paths"],
+        cfg["validation"]["strict_histogram_256"],
+        writer_cfg=cfg.get("writer"),
+        ingest_cfg=cfg.get("ingest"),
+        parse_cfg=cfg.get("parsing"),
+        spool_cfg=cfg.get("spool"),
+        output_cfg=cfg.get("output"),
+        histogram_cfg=cfg.get("histograms"),
+        dedupe_cfg=cfg.get("dedupe"),
+        metrics_cfg=cfg.get("metrics"),
+    )
+
+
+def _worker_main(cfg: Dict[str, Any], index: int, stats_q, stats_sec: float):
+    """Proceso worker: su propio event loop y pipeline, escuchando con SO_REUSEPORT."""
+    setup_logging(cfg["paths"]["logs_root"], os.getenv("LOG_LEVEL", "INFO"))
+    cfg = worker_settings(cfg, index)
+    tcp = cfg["transport"]["results"]["tcp"]
+    svc = build_results_service(cfg)
+
+    async def report():
+        while True:
+            await asyncio.sleep(stats_sec)
+            try:
+                stats_q.put_nowait((index, os.getpid(), svc.stats()))
+            except queue.Full:
+                pass
+
+    async def main():
+        serve = asyncio.create_task(svc.run_tcp_mode(tcp["host"], tcp["port"], reuse_port=True))
+        reporter = asyncio.create_task(report())
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, serve.cancel)
+        except NotImplementedError:
+            pass
+        try:
+            await serve
+        except asyncio.CancelledError:
+            pass
+        finally:
+            reporter.cancel()
+
+    logger.info(f"Worker TCP {index} (pid {os.getpid()}) en {tcp['host']}:{tcp['port']}")
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+def _sum_stats(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Suma campo a campo las stats numéricas de los workers (dicts anidados)."""
+    out: Dict[str, Any] = {}
+    for item in items:
+        for key, value in item.items():
+            if isinstance(value, dict):
+                out[key] = _sum_stats([out.get(key) or {}, value])
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                out[key] = out.get(key, 0) + value
+    return out
+
+
+class TcpSupervisor:
+    """
+    Modo multiproceso del listener MLLP de resultados.
+
+    - Arranca N procesos (contexto spawn, igual que ParsePool); cada uno enlaza el
+      puerto de resultados con SO_REUSEPORT y corre su propio loop y pipeline
+      completo, así el kernel reparte las conexiones de los equipos entre núcleos.
+    - Un worker que muere se reinicia con el mismo índice (y sus rutas propias),
+      con backoff exponencial si vuelve a caer enseguida.
+    - Cada worker envía sus stats periódicamente; `stats()` las agrega.
+    """
+
+    def __init__(
+        self,
+        cfg: Dict[str, Any],
+        workers: int,
+        stats_sec: float = DEFAULT_STATS_SEC,
+        max_backoff_sec: float = DEFAULT_MAX_BACKOFF_SEC,
+        target: Optional[Callable] = None,
+    ):
+        self.cfg = cfg
+        self.workers = max(1, int(workers))
+        self.stats_sec = max(0.1, float(stats_sec))
+        self.max_backoff = max(1.0, float(max_backoff_sec))
+        self.target = target or _worker_main
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stats_q = self._ctx.Queue(maxsize=self.workers * 64)
+        self._procs: Dict[int, Any] = {}
+        self._started_at: Dict[int, float] = {}
+        self._backoff: Dict[int, float] = {}
+        self._retry_at: Dict[int, float] = {}
+        self._latest: Dict[int, Dict[str, Any]] = {}
+        self._stopping = False
+        self.restarts = 0
+
+    def _spawn(self, index: int):
+        proc = self._ctx.Process(
+            target=self.target,
+            args=(self.cfg, index, self._stats_q, self.stats_sec),
+            name=f"results-tcp-{index}",
+            daemon=False,
+        )
+        proc.start()
+        self._procs[index] = proc
+        self._started_at[index] = time.monotonic()
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+        logger.info(f"Supervisor TCP: {self.workers} worker(s) con SO_REUSEPORT")
+
+    def poll(self):
+        """Recoge stats y reinicia workers caídos (una vuelta del supervisor)."""
+        while True:
+            try:
+                index, pid, stats = self._stats_q.get_nowait()
+            except queue.Empty:
+                break
+            self._latest[index] = {"pid": pid, **stats}
+        if self._stopping:
+            return
+        now = time.monotonic()
+        for index, proc in list(self._procs.items()):
+            if proc.is_alive():
+                continue
+            if index not in self._retry_at:
+                # Si cayó apenas arrancó se duplica la espera; si llevaba rato arriba, de inmediato
+                if now - self._started_at.get(index, now) < QUICK_EXIT_SEC:
+                    backoff = max(self._backoff.get(index, 0.0) * 2, 0.5)
+                    self._backoff[index] = min(backoff, self.max_backoff)
+                else:
+                    self._backoff[index] = 0.0
+                self._retry_at[index] = now + self._backoff[index]
+                logger.error(
+                    f"Worker TCP {index} (pid {proc.pid}) terminó con código {proc.exitcode}; "
+                    f"se reinicia en {self._retry_at[index] - now:.1f}s"
+                )
+            if now >= self._retry_at[index]:
+                # Las últimas stats del caído quedan hasta que el nuevo reporte
+                del self._retry_at[index]
+                self.restarts += 1
+                self._spawn(index)
+
+    def stats(self) -> Dict[str, Any]:
+        per_worker = {i: self._latest[i] for i in sorted(self._latest)}
+        return {
+            "workers": self.workers,
+            "alive": sum(p.is_alive() for p in self._procs.values()),
+            "restarts": self.restarts,
+            "total": _sum_stats(
+                [{k: v for k, v in s.items() if k != "pid"} for s in per_worker.values()]
+            ),
+            "per_worker": per_worker,
+        }
+
+    def stop(self, timeout: float = 15.0):
+        """SIGTERM a los workers (drenan y cierran su pipeline) y espera que terminen."""
+        self._stopping = True
+        for proc in self._procs.values():
+            if proc.is_alive():
+                proc.terminate()
+        deadline = time.monotonic() + timeout
+        for proc in self._procs.values():
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                logger.warning(f"Worker {proc.name} no terminó a tiempo; se fuerza")
+                proc.kill()
+                proc.join()
+        self.poll()
+
+    def run(self):
+        """Bloquea supervisando hasta Ctrl+C / SIGTERM; registra las stats agregadas."""
+        self.start()
+        stop = []
+        try:
+            signal.signal(signal.SIGTERM, lambda *_: stop.append(True))
+        except ValueError:
+            pass  # fuera del hilo principal
+        last_report = time.monotonic()
+        try:
+            while not stop:
+                time.sleep(0.5)
+                self.poll()
+                if time.monotonic() - last_report >= self.stats_sec:
+                    last_report = time.monotonic()
+                    stats = self.stats()
+                    logger.info(
+                        f"Supervisor TCP: {stats['alive']}/{stats['workers']} vivos, "
+                        f"{stats['restarts']} reinicio(s), total {stats['total']}"
+                    )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            logger.info(f"Supervisor TCP detenido: {self.stats()}")
@@ -1,9 +1,11 @@
 # app/validation/validators.py
-import base64
-import re
-from typing import List, Literal, Optional
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
 
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, ValidationInfo, field_validator
+
+from app.commons.histograms import decode_histogram, message_histograms
+from app.commons.hl7_message import HL7Message
 
 
 class HistogramPayload(BaseModel):
@@ -14,12 +16,7 @@ class HistogramPayload(BaseModel):
     @classmethod
     def _validate_len(cls, v: str):
         # Decodifica y exige 256 bytes exactos
-        try:
-            raw = base64.b64decode(v, validate=True)
-        except Exception as ex:
-            raise ValueError(f"Histogram base64 inválido: {ex}")
-        if len(raw) != 256:
-            raise ValueError(f"Histogram inválido: longitud {len(raw)} != 256")
+        decode_histogram(v)
         return v
 
 
@@ -34,48 +31,192 @@ class HL7MessageMeta(BaseModel):
         return v
 
 
+class MessageTypeCheck(BaseModel):
+    allowed: List[str]
+    msh_9: str
+
+    @field_validator("msh_9")
+    @classmethod
+    def _allowed(cls, v: str, info: ValidationInfo):
+        allowed = info.data.get("allowed") or []
+        if not message_type_allowed(v, allowed):
+            raise ValueError(f"Tipo de mensaje {v!r} no permitido (se espera {', '.join(allowed)})")
+        return v
+
+
+class SegmentCheck(BaseModel):
+    required: List[str]
+    present: List[str]
+
+    @field_validator("present")
+    @classmethod
+    def _required(cls, v: List[str], info: ValidationInfo):
+        missing = [s for s in info.data.get("required") or [] if s not in v]
+        if missing:
+            raise ValueError(f"Faltan segmentos obligatorios: {', '.join(missing)}")
+        return v
+
+
 class ResultValidation(BaseModel):
     header: HL7MessageMeta
     histograms: List[HistogramPayload] = []
+    message_type: Optional[MessageTypeCheck] = None
+    segments: Optional[SegmentCheck] = None
+
+
+# --------- Reglas por analizador ----------
+@dataclass(frozen=True)
+class ValidationRules:
+    """Qué se valida de un mensaje (sección `validation` de settings.yaml)."""
+
+    require_msh9: bool = True
+    histogram_256: bool = True
+    message_types: Tuple[str, ...] = ()  # vacío = cualquiera (p.ej. "ORU^R01")
+    required_segments: Tuple[str, ...] = ()  # p.ej. ("PID", "OBR", "OBX")
+
+    def merged(self, cfg: Optional[Dict[str, Any]]) -> "ValidationRules":
+        cfg = cfg or {}
+        changes: Dict[str, Any] = {}
+        if "strict_histogram_256" in cfg:  # nombre histórico de la opción
+            changes["histogram_256"] = bool(cfg["strict_histogram_256"])
+        for key in ("require_msh9", "histogram_256"):
+            if key in cfg:
+                changes[key] = bool(cfg[key])
+        for key in ("message_types", "required_segments"):
+            if key in cfg:
+                changes[key] = tuple(cfg[key] or ())
+        return replace(self, **changes)
+
+
+def message_type_allowed(msh9: str, allowed) -> bool:
+    # "ORU^R01" acepta también "ORU^R01^ORU_R01"
+    return not allowed or any(msh9 == t or msh9.startswith(t + "^") for t in allowed)
 
 
 # --------- Utilidades para construir el modelo desde el HL7 ----------
-def parse_msh9_from_text(hl7_text: str) -> Optional[str]:
-    # Toma separador de campo real desde MSH (posición 3)
-    text = re.sub(r"(?:\r\n|\n|\r)", "\r", hl7_text.strip())
-    first = text.split("\r", 1)[0]
-    if not first.startswith("MSH"):
+def parse_msh9_from_text(hl7: Union[str, HL7Message]) -> Optional[str]:
+    msg = HL7Message.coerce(hl7)
+    # El primer segmento debe ser MSH; el separador de campo real sale de MSH-1
+    if not len(msg) or msg.segment_types[0] != "MSH":
         return None
-    field_sep = first[3]
-    parts = first.split(field_sep)
+    parts = msg.fields(0)
     # MSH-9 suele ser "ORU^R01"
     return parts[8] if len(parts) > 8 else None
 
 
-def collect_histograms_from_text(hl7_text: str) -> List[HistogramPayload]:
-    text = re.sub(r"(?:\r\n|\n|\r)", "\r", hl7_text.strip())
-    first = text.split("\r", 1)[0]
-    field_sep = first[3] if len(first) > 3 else "|"
-    enc = first.split(field_sep)[1] if field_sep in first else "^~\\&"
-    comp = enc[0] if len(enc) > 0 else "^"
-
+def collect_histograms_from_text(hl7: Union[str, HL7Message]) -> List[HistogramPayload]:
     out = []
-    for seg in filter(None, text.split("\r")):
-        if not seg.startswith("OBX" + field_sep):
-            continue
-        fields = seg.split(field_sep)
-        # OBX-3 (identifier) y OBX-5 (valor)
-        ident = fields[3] if len(fields) > 3 else ""
-        value = fields[5] if len(fields) > 5 else ""
-        code = ident.split(comp)[0] if ident else ""
-        if code in ("RBCHistogram", "PLTHistogram", "WBCHistogram"):
-            out.append(HistogramPayload(name=code, data_b64=value))
+    # Decodificados una vez por mensaje (los reusan métricas y sidecar): aquí solo se revisa
+    for h in message_histograms(hl7).values():
+        if h.error is None:
+            out.append(HistogramPayload.model_construct(name=h.name, data_b64=h.b64))
+        else:
+            out.append(HistogramPayload(name=h.name, data_b64=h.b64))  # levanta ValidationError
     return out
 
 
-def validate_hl7_message_or_raise(hl7_text: str):
-    """Construye el modelo y levanta ValidationError si algo falta/está mal."""
-    msh9 = parse_msh9_from_text(hl7_text) or ""
-    histos = collect_histograms_from_text(hl7_text)
-    # Esto lanzará si MSH-9 falta o histogramas no son de 256 bytes
-    ResultValidation(header=HL7MessageMeta(msh_9=msh9), histograms=histos)
+def passes_rules(msg: HL7Message, rules: ValidationRules) -> bool:
+    """Camino rápido: comprobaciones simples sobre los segmentos ya indexados."""
+    if rules.require_msh9 or rules.message_types:
+        msh9 = parse_msh9_from_text(msg) or ""
+        if rules.require_msh9 and not msh9.strip():
+            return False
+        if not message_type_allowed(msh9, rules.message_types):
+            return False
+    if rules.histogram_256:
+        for h in message_histograms(msg).values():
+            if h.error is not None:
+                return False
+    if rules.required_segments:
+        present = msg.segment_types
+        for seg in rules.required_segments:
+            if seg not in present:
+                return False
+    return True
+
+
+def build_validation_model(
+    hl7: Union[str, HL7Message], rules: Optional[ValidationRules] = None
+) -> ResultValidation:
+    """Construye el modelo pydantic completo; levanta ValidationError con el detalle del fallo."""
+    rules = rules or _DEFAULT_RULES
+    msg = HL7Message.coerce(hl7)
+    msh9 = parse_msh9_from_text(msg) or ""
+    if rules.require_msh9:
+        header = HL7MessageMeta(msh_9=msh9)
+    else:
+        header = HL7MessageMeta.model_construct(msh_9=msh9)
+    return ResultValidation(
+        header=header,
+        histograms=collect_histograms_from_text(msg) if rules.histogram_256 else [],
+        message_type=(
+            MessageTypeCheck(allowed=list(rules.message_types), msh_9=msh9)
+            if rules.message_types
+            else None
+        ),
+        segments=(
+            SegmentCheck(required=list(rules.required_segments), present=msg.segment_types)
+            if rules.required_segments
+            else None
+        ),
+    )
+
+
+_DEFAULT_RULES = ValidationRules()
+
+
+class RuleValidator:
+    """
+    Validación por reglas con camino rápido.
+
+    - Casi todos los mensajes son válidos: se revisan con comparaciones simples sobre
+      el HL7Message ya indexado (y los histogramas ya decodificados), sin pydantic.
+    - Solo si una regla falla se construye el modelo completo, que levanta el mismo
+      ValidationError detallado de siempre.
+    - Reglas por analizador (`validation.analyzers.ICON3: {...}`) sobre las generales.
+    """
+
+    def __init__(
+        self,
+        default: Optional[ValidationRules] = None,
+        analyzers: Optional[Dict[str, ValidationRules]] = None,
+    ):
+        self.default = default or _DEFAULT_RULES
+        self.analyzers = dict(analyzers or {})
+
+    @classmethod
+    def from_config(cls, cfg: Optional[Dict[str, Any]]) -> "RuleValidator":
+        cfg = cfg or {}
+        default = _DEFAULT_RULES.merged(cfg)
+        analyzers = {
+            str(name).upper(): default.merged(rules)
+            for name, rules in (cfg.get("analyzers") or {}).items()
+        }
+        return cls(default, analyzers)
+
+    @property
+    def per_analyzer(self) -> bool:
+        """True si hay reglas por analizador (hace falta detectar el perfil antes)."""
+        return bool(self.analyzers)
+
+    def rules_for(self, analyzer: Optional[str] = None) -> ValidationRules:
+        if analyzer is None:
+            return self.default
+        return self.analyzers.get(analyzer.upper(), self.default)
+
+    def check(self, hl7: Union[str, HL7Message], analyzer: Optional[str] = None):
+        """Levanta ValidationError si el mensaje no cumple las reglas del analizador."""
+        msg = HL7Message.coerce(hl7)
+        rules = self.rules_for(analyzer)
+        if not passes_rules(msg, rules):
+            build_validation_model(msg, rules)
+
+
+def validate_hl7_message_or_raise(
+    hl7: Union[str, HL7Message], rules: Optional[ValidationRules] = None
+):
+    """Valida con las reglas (por defecto: MSH-9 y histogramas de 256 bytes) y levanta
+    ValidationError si algo falta/está mal. El modelo solo se construye ante un fallo."""
+    msg = HL7Message.coerce(hl7)
+    if not passes_rules(msg, rules or _DEFAULT_RULES):
+        build_validation_model(msg, rules)
@@ -0,0 +1,76 @@
+"""
+Benchmark de extracción HEADER_PATIENT + OBR_OBX_GROUPED: una búsqueda por ruta sobre
+el texto (HL7Normalizer.get_value_from_hl7, re-indexa el mensaje por ruta) vs el plan
+compilado de HL7Engine (una pasada sobre los segmentos).
+
+Uso:
+    python -m benchmarks.bench_extractors [--obx 20] [--repeat 2000]
+"""
+
+import argparse
+import time
+
+from app.commons.hl7_engine import HL7Engine
+from app.commons.hl7_message import HL7Message
+from benchmarks.bench_segment_index import build_icon3_message
+
+TEMPLATE = "app/configs/template_reader_orm_hl7.yaml"
+
+
+def extract_per_path(engine: HL7Engine, text: str) -> dict:
+    """Referencia: cada ruta vuelve a partir el texto; los grupos se arman a mano."""
+    norm = engine.normalizer
+    out = {}
+    for rule in engine.cfg["extractors"]["HEADER_PATIENT"]:
+        out[rule["name"]] = norm.get_value_from_hl7(text, rule["path"])
+    grouped = engine.cfg["group_extractors"]["OBR_OBX_GROUPED"]
+    ordenes = []
+    for seg in norm.split_segments(text):
+        one = seg + "\r"
+        if seg.startswith("OBR"):
+            item = {}
+            for name, spec in grouped["fields"].items():
+                item[name] = norm.get_value_from_hl7("MSH|^~\\&\r" + one, _path(spec))
+            item["examenes"] = []
+            ordenes.append(item)
+        elif seg.startswith("OBX") and ordenes:
+            ex = {}
+            for name, spec in grouped["children"]["fields"].items():
+                ex[name] = norm.get_value_from_hl7("MSH|^~\\&\r" + one, _path(spec))
+            ordenes[-1]["examenes"].append(ex)
+    out["ordenes"] = ordenes
+    return out
+
+
+def _path(spec):
+    return spec["path"] if isinstance(spec, dict) else spec
+
+
+def main(n_obx: int, repeat: int):
+    engine = HL7Engine(TEMPLATE)
+    text = build_icon3_message(n_obx)
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        extract_per_path(engine, text)
+    t_path = (time.perf_counter() - t0) / repeat
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        msg = HL7Message(text)
+        engine.extract_grouped(
+            "OBR_OBX_GROUPED", msg, base_out=engine.extract("HEADER_PATIENT", msg)
+        )
+    t_plan = (time.perf_counter() - t0) / repeat
+
+    print(f"OBX por mensaje: {n_obx}")
+    print(f"  por ruta:   {t_path * 1e6:8.1f} µs/msg")
+    print(f"  compilado:  {t_plan * 1e6:8.1f} µs/msg  ({t_path / t_plan:.1f}x)")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--obx", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=2000)
+    args = ap.parse_args()
+    main(args.obx, args.repeat)
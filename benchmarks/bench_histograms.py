@@ -0,0 +1,86 @@
+"""
+Benchmark de histogramas Icon-3: decodificar + validar + métricas (pico, área, fracciones
+entre RD/WDn) mensaje por mensaje en Python puro vs decodificación única a uint8 y métricas
+vectorizadas por lote (analyze_batch).
+
+Uso:
+    python -m benchmarks.bench_histograms [--messages 5000] [--batch 256]
+"""
+
+import argparse
+import base64
+import random
+import time
+
+from app.commons.histograms import analyze_batch, discriminator_values
+from app.commons.hl7_message import HL7Message
+from app.validation.validators import validate_hl7_message_or_raise
+
+
+def build_message(rng: random.Random) -> str:
+    def hist():
+        return base64.b64encode(bytes(rng.randrange(256) for _ in range(256))).decode()
+
+    return "\r".join(
+        [
+            "MSH|^~\\&|Icon-3|NI30H24105|LIS Application|LIS|20250821100844||ORU^R01|1|P|2.5",
+            f"OBX|1|ED|RBCHistogram^RBCHistogram||{hist()}||||||F",
+            f"OBX|2|ED|PLTHistogram^PLTHistogram||{hist()}||||||F",
+            f"OBX|3|ED|WBCHistogram^WBCHistogram||{hist()}||||||F",
+            f"NTE|RD||{rng.randrange(20, 60)}|RE^RBC Discriminator (fL)",
+            f"NTE|WD0||{rng.randrange(30, 60)}|0^WBC Discriminator #0 (fL)",
+            f"NTE|WD1||{rng.randrange(80, 120)}|1^WBC Discriminator #1 (fL)",
+        ]
+    )
+
+
+def metrics_python(msg: HL7Message) -> dict:
+    """Referencia: el validador decodifica para medir el largo y aquí se vuelve a decodificar."""
+    discs = discriminator_values(msg)
+    out = {}
+    for _, fields in msg.iter_fields("OBX"):
+        name = fields[3].split("^")[0]
+        data = base64.b64decode(fields[5], validate=True)
+        area = sum(data)
+        peak = max(data)
+        cuts = sorted(int(round(v)) for _, v in discs.get(name, ()))
+        edges = [0] + [sum(data[:c]) for c in cuts] + [area]
+        out[name] = {
+            "peak_bin": data.index(peak),
+            "peak": peak,
+            "area": area,
+            "fractions": [(b - a) / area if area else None for a, b in zip(edges, edges[1:])],
+        }
+    return out
+
+
+def main(n: int, batch: int):
+    rng = random.Random(7)
+    texts = [build_message(rng) for _ in range(n)]
+
+    t0 = time.perf_counter()
+    for text in texts:
+        msg = HL7Message(text)
+        validate_hl7_message_or_raise(msg)
+        metrics_python(msg)
+    t_py = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in range(0, n, batch):
+        msgs = [HL7Message(text) for text in texts[i : i + batch]]
+        for msg in msgs:
+            validate_hl7_message_or_raise(msg)
+        analyze_batch(msgs)
+    t_np = time.perf_counter() - t0
+
+    print(f"mensajes: {n} (3 histogramas c/u), lote {batch}")
+    print(f"  por mensaje (Python):   {t_py / n * 1e6:8.1f} µs/msg")
+    print(f"  lote (numpy):           {t_np / n * 1e6:8.1f} µs/msg  ({t_py / t_np:.1f}x)")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=5000)
+    ap.add_argument("--batch", type=int, default=256)
+    args = ap.parse_args()
+    main(args.messages, args.batch)
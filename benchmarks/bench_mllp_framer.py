@@ -0,0 +1,103 @@
+"""
+Micro-benchmark del enmarcador MLLP: generador anterior vs MllpFramer.
+
+Cada caso alimenta un StreamReader en memoria con varios frames de 1 KB, 64 KB
+y 1 MB (payload tipo HL7) y mide el tiempo hasta extraer todos los mensajes.
+
+Uso:
+    python -m benchmarks.bench_mllp_framer [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.helpers.tcp_transport import CR, FS, VT, read_mllp_messages
+
+CASES = [("1 KB", 1024, 200), ("64 KB", 64 * 1024, 40), ("1 MB", 1024 * 1024, 4)]
+
+
+async def legacy_read_mllp_messages(reader: asyncio.StreamReader):
+    """Copia del generador original (lecturas de 4096, index desde 0, del buf[:...])."""
+    buf = bytearray()
+    while True:
+        chunk = await reader.read(4096)
+        if not chunk:
+            break
+        buf.extend(chunk)
+        while True:
+            try:
+                start = buf.index(VT)
+            except ValueError:
+                buf.clear()
+                break
+            try:
+                fs = buf.index(FS, start + 1)
+                if fs + 1 >= len(buf):
+                    break
+                if buf[fs + 1] != CR[0]:
+                    break
+                payload = bytes(buf[start + 1 : fs])
+                del buf[: fs + 2]
+                try:
+                    msg = payload.decode("utf-8")
+                except UnicodeDecodeError:
+                    msg = payload.decode("latin-1")
+                yield msg
+            except ValueError:
+                break
+
+
+def _frame(size: int) -> bytes:
+    seg = b"OBX|1|ED|WBCHistogram^WBCHistogram||" + b"A" * 200 + b"||||||F\r"
+    body = b"MSH|^~\\&|Icon-3|LAB|LIS|HOSP|20250101||ORU^R01|1|P|2.5\r"
+    body += seg * max(0, (size - len(body)) // len(seg))
+    return VT + body + FS + CR
+
+
+class _ChunkedReader:
+    """Entrega los bytes en trozos de 16 KiB como llegarían por el socket."""
+
+    def __init__(self, data: bytes, chunk: int = 16 * 1024):
+        self._mv = memoryview(data)
+        self._pos = 0
+        self._chunk = chunk
+
+    async def read(self, n: int) -> bytes:
+        end = min(self._pos + min(n, self._chunk), len(self._mv))
+        out = bytes(self._mv[self._pos : end])
+        self._pos = end
+        return out
+
+
+async def _consume(gen) -> int:
+    count = 0
+    async for _ in gen:
+        count += 1
+    return count
+
+
+async def _time(factory, data: bytes, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await _consume(factory(_ChunkedReader(data)))
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"{'frame':>6} {'frames':>6} {'anterior':>12} {'nuevo':>12} {'speedup':>8}")
+    for label, size, count in CASES:
+        data = _frame(size) * count
+        old = asyncio.run(_time(legacy_read_mllp_messages, data, args.repeat))
+        new = asyncio.run(_time(read_mllp_messages, data, args.repeat))
+        print(f"{label:>6} {count:>6} {old * 1e3:>10.2f}ms {new * 1e3:>10.2f}ms {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
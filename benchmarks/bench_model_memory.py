@@ -0,0 +1,98 @@
+"""
+Benchmark de memoria (tracemalloc) de un backlog de resultados normalizados en memoria.
+
+Compara, sobre los mismos mensajes Icon-3:
+- "anterior": dataclasses con __dict__, raw={"segment": línea} por observación, sin intern.
+- "compacto": modelos actuales (__slots__, strings internados, segmento como offsets).
+
+Cada mensaje es un str distinto (como al leerlo del inbox) y se conservan todos los
+resultados, que es lo que pasa mientras un backlog grande está en vuelo.
+
+Uso:
+    python -m benchmarks.bench_model_memory [--messages 100000] [--obx 20]
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from app.commons.hl7_message import HL7Message
+from app.parsers.icon3 import parse_icon3
+from benchmarks.bench_segment_index import build_icon3_message
+
+
+@dataclass
+class _LegacyObservation:
+    code: str
+    text: Optional[str]
+    value: Optional[str]
+    units: Optional[str]
+    status: Optional[str] = None
+    ref_range: Optional[str] = None
+    measured_at: Optional[str] = None
+    raw: Dict = None
+
+
+def parse_legacy(msg: HL7Message):
+    """Referencia: mismas observaciones con el modelo anterior (copia de la línea en raw)."""
+    res = parse_icon3(msg)
+    res.observations = [
+        _LegacyObservation(
+            code=_copy(o.code),
+            text=_copy(o.text),
+            value=o.value,
+            units=_copy(o.units),
+            status=_copy(o.status),
+            ref_range=_copy(o.ref_range),
+            raw={"segment": msg.segment(i)},
+        )
+        for o, i in zip(res.observations, msg.positions("OBX"))
+    ]
+    return res
+
+
+def _copy(value: Optional[str]) -> Optional[str]:
+    # Un str nuevo, como el que dejaba el split antes de internar
+    return "".join(list(value)) if value else value
+
+
+def _messages(n: int, n_obx: int):
+    base = build_icon3_message(n_obx)
+    for i in range(n):
+        yield base.replace("638913677245350000", f"{638913677245350000 + i}")
+
+
+def _measure(name: str, parse, n: int, n_obx: int):
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    kept = [parse(HL7Message(text)) for text in _messages(n, n_obx)]
+    elapsed = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n_obs = sum(len(r.observations) for r in kept)
+    print(
+        f"{name:<10} retenido {current / 2**20:>8.1f} MiB  ({current / n:>7.0f} B/msg, "
+        f"{current / n_obs:>5.0f} B/obs)  pico {peak / 2**20:>8.1f} MiB  {elapsed:>6.1f}s"
+    )
+    del kept
+    gc.collect()
+    return current
+
+
+def main(n: int, n_obx: int):
+    print(f"mensajes: {n}  OBX por mensaje: {n_obx} (+3 histogramas)")
+    legacy = _measure("anterior", parse_legacy, n, n_obx)
+    compact = _measure("compacto", parse_icon3, n, n_obx)
+    print(f"ahorro: {(1 - compact / legacy) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=100_000)
+    ap.add_argument("--obx", type=int, default=20)
+    args = ap.parse_args()
+    main(args.messages, args.obx)
@@ -0,0 +1,74 @@
+"""
+Benchmark de throughput: validación + parseo + mapeo en línea vs ParsePool con 1..N procesos.
+
+Uso:
+    python -m benchmarks.bench_parse_pool [--count 20000] [--max-workers 8] [--in-flight 256]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import yaml
+
+from app.commons.hl7_engine import HL7Engine
+from app.commons.hl7_message import HL7Message
+from app.commons.parse_pool import ParsePool
+from app.validation.validators import validate_hl7_message_or_raise
+from benchmarks.bench_segment_index import build_icon3_message
+
+TEMPLATE = "app/configs/template_reader_orm_hl7.yaml"
+
+
+def _inline(engine: HL7Engine, texts) -> float:
+    t0 = time.perf_counter()
+    for text in texts:
+        msg = HL7Message(text)
+        validate_hl7_message_or_raise(msg)
+        engine.parse_and_map(msg)
+    return time.perf_counter() - t0
+
+
+async def _pooled(pool: ParsePool, texts, in_flight: int) -> float:
+    sem = asyncio.Semaphore(in_flight)
+
+    async def one(text):
+        async with sem:
+            await pool.validate_and_map(text)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(t) for t in texts))
+    return time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--count", type=int, default=20000)
+    ap.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--in-flight", type=int, default=256, help="mensajes concurrentes")
+    args = ap.parse_args()
+
+    with open(TEMPLATE, "r", encoding="utf-8") as f:
+        engine_cfg = yaml.safe_load(f)
+    texts = [build_icon3_message(20)] * args.count
+
+    dt = _inline(HL7Engine(engine_cfg), texts)
+    base = args.count / dt
+    print(f"{'en línea':>10}: {base:9.0f} msg/s")
+
+    workers = 1
+    while workers <= args.max_workers:
+        pool = ParsePool(engine_cfg, workers=workers)
+        pool.start()
+        try:
+            dt = asyncio.run(_pooled(pool, texts, in_flight=args.in_flight))
+        finally:
+            pool.shutdown()
+        rate = args.count / dt
+        print(f"{workers:>4} proc.: {rate:9.0f} msg/s ({rate / base:4.2f}x vs en línea)")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
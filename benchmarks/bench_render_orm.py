@@ -0,0 +1,105 @@
+"""
+Benchmark del render de ORM: plantilla compilada (HL7Engine.render) vs un render
+interpretado que recorre el YAML y sustituye con regex en cada llamada.
+
+Uso:
+    python -m benchmarks.bench_render_orm [--template ORM_O01_ORC_EACH] [--repeat 2000]
+"""
+
+import argparse
+import re
+import time
+
+from app.commons.hl7_engine import HL7Engine
+from app.commons.hl7_message import escape_hl7
+from app.commons.hl7_template import _compile_path, _lookup, compile_transform
+
+TEMPLATE = "app/configs/template_reader_orm_hl7.yaml"
+_TOKEN_RE = re.compile(r"@(THIS\.[A-Za-z_][\w.\[\]]*|[A-Z_][A-Z0-9_]*)")
+
+
+def build_payload(n_orders: int) -> dict:
+    return {
+        "paciente": {
+            "tipo_doc": "CC",
+            "num_doc": "1234567890",
+            "apellidos": "PEREZ GOMEZ",
+            "nombres": "JUAN CARLOS",
+            "fecha_nac": "1990-01-31",
+            "sexo": "M",
+        },
+        "atencion": {"servicio": "URGENCIAS"},
+        "meta": {"fecha_mensaje": "2025-08-15 12:00:00", "msg_ctrl_id": "ABC123"},
+        "ordenes": [
+            {
+                "orden_id": f"O{i}",
+                "placer_id": f"P{i}",
+                "codigo": f"T{i:03d}",
+                "descripcion": "GLUCOSA",
+                "fecha_orden": "2025-08-15 12:00:00",
+                "fecha_muestra": "2025-08-15 12:05:00",
+            }
+            for i in range(n_orders)
+        ],
+    }
+
+
+def render_interpreted(cfg: dict, name: str, payload: dict) -> str:
+    """Referencia: lo que haría un render sin compilar (YAML + regex por llamada)."""
+    mappings = cfg["mappings"]
+    defaults = cfg.get("defaults") or {}
+
+    def value_of(token, item):
+        if token.startswith("THIS."):
+            steps = _compile_path(token[5:])
+            value = _lookup(item, steps)
+            transforms = ()
+        else:
+            mapping = mappings[token]
+            steps = _compile_path(mapping["source"][5:])
+            value = _lookup(payload, steps)
+            transforms = [compile_transform(t) for t in mapping.get("transforms") or ()]
+        if value is None:
+            value = defaults.get(steps[-1], "")
+        for fn in transforms:
+            value = fn(value)
+        return escape_hl7(str(value))
+
+    def walk(lines, item, out):
+        for line in lines:
+            if isinstance(line, dict):
+                for child in _lookup(payload, _compile_path(line["for_each"])) or ():
+                    walk(line["lines"], child, out)
+            else:
+                out.append(_TOKEN_RE.sub(lambda m: value_of(m.group(1), item), line))
+
+    out = []
+    walk(cfg["templates"][name], None, out)
+    return "\r".join(out) + "\r"
+
+
+def main(template: str, repeat: int):
+    engine = HL7Engine(TEMPLATE)
+    print(f"{'órdenes':>8} {'interpretado':>14} {'compilado':>12} {'speedup':>8}")
+    for n in (1, 5, 10, 25, 50):
+        payload = build_payload(n)
+        assert render_interpreted(engine.cfg, template, payload) == engine.render(template, payload)
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            render_interpreted(engine.cfg, template, payload)
+        t_interp = (time.perf_counter() - t0) / repeat
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            engine.render(template, payload)
+        t_comp = (time.perf_counter() - t0) / repeat
+        print(
+            f"{n:>8} {t_interp * 1e6:>11.1f} µs {t_comp * 1e6:>9.1f} µs {t_interp / t_comp:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--template", default="ORM_O01_ORC_EACH")
+    ap.add_argument("--repeat", type=int, default=2000)
+    args = ap.parse_args()
+    main(args.template, args.repeat)
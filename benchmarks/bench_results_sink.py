@@ -0,0 +1,71 @@
+"""
+Benchmark de la salida de resultados: un .json con indent=2 por resultado
+(AsyncFileWriter.write_json, modo "files") vs NdjsonSink (JSON compacto en segmentos rotados).
+
+Uso:
+    python -m benchmarks.bench_results_sink [--count 20000] [--concurrency 4]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from app.commons.hl7_engine import HL7Engine
+from app.helpers.async_writer import AsyncFileWriter
+from app.helpers.ndjson_sink import NdjsonSink
+from benchmarks.bench_segment_index import build_icon3_message
+
+
+async def _run(write, count: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            await write(i)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return time.perf_counter() - t0
+
+
+def _size(d: Path) -> int:
+    return sum(p.stat().st_size for p in d.rglob("*") if p.is_file())
+
+
+def _report(name: str, count: int, dt: float, files, size: int, extra: str = ""):
+    print(
+        f"{name:<20} {count / dt:>9.0f} res/s  {len(files):>6} archivos  "
+        f"{size / 2**20:>7.1f} MiB  {extra}"
+    )
+
+
+async def main(count: int, concurrency: int):
+    payload = HL7Engine({}).parse_and_map(build_icon3_message(20))
+    with tempfile.TemporaryDirectory() as tmp:
+        files_dir, nd_dir = Path(tmp) / "files", Path(tmp) / "ndjson"
+
+        writer = AsyncFileWriter(workers=2)
+
+        async def write_file(i):
+            await writer.write_json(files_dir / f"{i:08d}.json", payload)
+
+        dt = await _run(write_file, count, concurrency)
+        await writer.aclose()
+        _report("json por resultado", count, dt, list(files_dir.iterdir()), _size(files_dir))
+
+        sink = NdjsonSink(nd_dir)
+        sink.open()
+        dt = await _run(lambda i: sink.write(payload), count, concurrency)
+        await sink.aclose()
+        extra = f"(lote medio {sink.stats()['avg_batch']})"
+        _report("ndjson", count, dt, list(nd_dir.glob("*.ndjson")), _size(nd_dir), extra)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--count", type=int, default=20000)
+    ap.add_argument("--concurrency", type=int, default=4)
+    args = ap.parse_args()
+    asyncio.run(main(args.count, args.concurrency))
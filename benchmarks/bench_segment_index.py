@@ -0,0 +1,91 @@
+"""
+Benchmark: costo por mensaje de validar + detectar + parsear + NTE en un Icon-3 de 20 OBX.
+
+Compara dos caminos sobre el mismo código:
+- "texto": cada etapa recibe el str y vuelve a partir/indexar el mensaje.
+- "indexado": se construye un HL7Message una vez y todas las etapas lo comparten.
+
+Uso:
+    python -m benchmarks.bench_segment_index [--count 20000]
+"""
+
+import argparse
+import base64
+import time
+
+from app.commons.hl7_message import HL7Message
+from app.commons.hl7_normalizer import HL7Normalizer
+from app.helpers.router import FlowRouter
+from app.validation.validators import validate_hl7_message_or_raise
+
+ANALYTES = [
+    ("RBC", "10^6/µL"), ("HGB", "g/L"), ("MCV", "fL"), ("HCT", "%"), ("MCH", "pg"),
+    ("MCHC", "g/L"), ("RDWsd", "fL"), ("RDWcv", "%"), ("PLT", "10^3/µL"), ("MPV", "fL"),
+    ("PCT", "%"), ("PDWsd", "fL"), ("PDWcv", "%"), ("WBC", "10^3/µL"), ("LYM", "10^3/µL"),
+    ("LYMP", "%"), ("MID", "10^3/µL"), ("MIDP", "%"), ("GRA", "10^3/µL"), ("GRAP", "%"),
+]  # fmt: skip
+
+
+def build_icon3_message(n_obx: int = 20) -> str:
+    hist = base64.b64encode(bytes(range(256))).decode("ascii")
+    segs = [
+        "MSH|^~\\&|Icon-3|NI30H24105|LIS Application|LIS|20250821100844||ORU^R01|"
+        "638913677245350000|P|2.5||||||UNICODE UTF-8",
+        "SFT|N|1.3.2596.0|Icon-3|1.3.2596.0|Product Version: 0.9|20240124034738",
+        "PID|678||^^|||||O",
+        "OBR|||^^^563||||20250811064326|25||||3 Part Differential Hematology",
+        "NTE|Comment1||JUAN PEREZ|1^Name",
+        "NTE|Comment2||55|2^Age",
+        "NTE|Profile||Human",
+    ]
+    for i in range(n_obx):
+        code, units = ANALYTES[i % len(ANALYTES)]
+        segs.append(f"OBX|{i + 1}|NM|{i}^{code}||{i + 1}.5|{units}|1.0-9.0||||F")
+    for i, name in enumerate(("RBCHistogram", "PLTHistogram", "WBCHistogram")):
+        segs.append(f"OBX|{n_obx + i + 1}|ED|{name}^{name}||{hist}||||||F")
+    segs.append("NTE|RD||36|RE^RBC Discriminator (fL)")
+    segs.append("NTE|WD1||85|1^WBC Discriminator #1 (fL)")
+    return "\r".join(segs) + "\r"
+
+
+def _run_text(router: FlowRouter, text: str):
+    validate_hl7_message_or_raise(text)
+    router.transform_hl7_result(text)
+    router._parse_icon3_nte(text)
+
+
+def _run_indexed(router: FlowRouter, text: str):
+    msg = HL7Message(text)
+    validate_hl7_message_or_raise(msg)
+    router.transform_hl7_result(msg)
+    router._parse_icon3_nte(msg)
+
+
+class _Engine:
+    """Motor mínimo para el benchmark (evita leer YAML)."""
+
+    def __init__(self):
+        self.normalizer = HL7Normalizer()
+
+    def parse_and_map(self, hl7):
+        return self.normalizer.to_sofia_payload(self.normalizer.normalize(hl7))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--count", type=int, default=20000)
+    args = ap.parse_args()
+
+    router = FlowRouter(_Engine(), {"paths": {}})
+    text = build_icon3_message(20)
+    for label, fn in (("texto", _run_text), ("indexado", _run_indexed)):
+        fn(router, text)  # warm-up
+        t0 = time.process_time()
+        for _ in range(args.count):
+            fn(router, text)
+        dt = time.process_time() - t0
+        print(f"{label:>9}: {dt / args.count * 1e6:8.1f} µs CPU/mensaje ({args.count} mensajes)")
+
+
+if __name__ == "__main__":
+    main()
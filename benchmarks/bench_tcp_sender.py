@@ -0,0 +1,86 @@
+"""
+Benchmark de latencia por orden: una conexión nueva por mensaje (emisor anterior)
+vs TcpSender con pool de conexiones persistentes, contra un TcpServer local que responde ACK.
+
+Uso:
+    python -m benchmarks.bench_tcp_sender [--count 2000] [--concurrency 1]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.commons.hl7_message import HL7Message
+from app.helpers.tcp_transport import (
+    CR,
+    FS,
+    VT,
+    TcpSender,
+    TcpServer,
+    read_mllp_messages,
+)
+
+
+def _order(i: int) -> str:
+    return f"MSH|^~\\&|LIS|HOSP|Icon-3|LAB|20250101||ORM^O01|ORD{i}|P|2.5\rPID|1\rORC|NW|{i}\r"
+
+
+async def _connect_per_order(port: int, text: str) -> None:
+    # Lo que hacía el emisor anterior (más el ACK, para comparar lo mismo)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(VT + text.encode("utf-8") + FS + CR)
+    await writer.drain()
+    async for _ack in read_mllp_messages(reader):
+        break
+    writer.close()
+    await writer.wait_closed()
+
+
+async def _run(send, count: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    lat = []
+
+    async def one(i):
+        async with sem:
+            t0 = time.perf_counter()
+            await send(_order(i))
+            lat.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return time.perf_counter() - t0, lat
+
+
+def _report(name: str, elapsed: float, lat, count: int):
+    lat = sorted(lat)
+    p50 = statistics.median(lat) * 1e6
+    p99 = lat[int(len(lat) * 0.99) - 1] * 1e6
+    print(f"{name:<22} {count / elapsed:>9.0f} ord/s   p50 {p50:>7.0f} µs   p99 {p99:>7.0f} µs")
+
+
+async def main(count: int, concurrency: int):
+    async def ack(msg: HL7Message, peer):
+        return "AA"
+
+    server = TcpServer("127.0.0.1", 0, ack, pipeline_depth=64)
+    srv = await server.listen()
+    port = srv.sockets[0].getsockname()[1]
+
+    elapsed, lat = await _run(lambda t: _connect_per_order(port, t), count, concurrency)
+    _report("conexión por orden", elapsed, lat, count)
+
+    sender = TcpSender("127.0.0.1", port, pool_size=2, max_in_flight=32)
+    elapsed, lat = await _run(sender.send, count, concurrency)
+    _report("pool persistente", elapsed, lat, count)
+    await sender.close()
+    srv.close()
+    await srv.wait_closed()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--count", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=1)
+    args = ap.parse_args()
+    asyncio.run(main(args.count, args.concurrency))
@@ -0,0 +1,52 @@
+"""
+Benchmark: costo por mensaje de la validación de un Icon-3 (20 OBX + 3 histogramas).
+
+- "modelo": construye HL7MessageMeta + HistogramPayload + ResultValidation siempre
+  (el camino anterior, hoy `build_validation_model`).
+- "reglas": `validate_hl7_message_or_raise`, comprobaciones simples y modelo solo ante fallo.
+
+Los mensajes se indexan fuera de la medición; la decodificación de histogramas se mide
+aparte porque ambos caminos la comparten (queda en HL7Message.memo).
+
+Uso:
+    python -m benchmarks.bench_validation [--count 20000]
+"""
+
+import argparse
+import time
+
+from app.commons.histograms import message_histograms
+from app.commons.hl7_message import HL7Message
+from app.validation.validators import (
+    build_validation_model,
+    validate_hl7_message_or_raise,
+)
+from benchmarks.bench_segment_index import build_icon3_message
+
+
+def _per_msg(fn, msgs) -> float:
+    t0 = time.perf_counter()
+    for msg in msgs:
+        fn(msg)
+    return (time.perf_counter() - t0) / len(msgs) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--count", type=int, default=20000)
+    args = ap.parse_args()
+
+    text = build_icon3_message(20)
+    msgs = [HL7Message(text) for _ in range(args.count)]
+    decode = _per_msg(message_histograms, msgs)  # deja los histogramas en memo
+    model = _per_msg(build_validation_model, msgs)
+    rules = _per_msg(validate_hl7_message_or_raise, msgs)
+
+    print(f"mensajes: {args.count}")
+    print(f"  decodificar histogramas (compartido): {decode:6.1f} µs/msg")
+    print(f"  modelo pydantic:                      {model:6.1f} µs/msg")
+    print(f"  reglas (camino rápido):               {rules:6.1f} µs/msg  ({model / rules:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
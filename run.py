@@ -1,47 +1,43 @@
 import asyncio
+import json
+import multiprocessing
 import os
-import socket
 import sys
 from asyncio import Event
-from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
 import typer
 import yaml
 
+from app.bench.corpus import parse_mix
+from app.bench.loadgen import DEFAULT_ACK_TIMEOUT, format_load_report, run_tcp, run_udp
+from app.bench.suite import (
+    CASES,
+    DEFAULT_COUNT,
+    DEFAULT_E2E_COUNT,
+    DEFAULT_REPEAT,
+    DEFAULT_SEED,
+    DEFAULT_THRESHOLD,
+    compare,
+    format_case,
+    format_comparison,
+    run_suite,
+)
 from app.commons.hl7_engine import HL7Engine
-from app.commons.logger import setup_logging
+from app.commons.logger import logger, setup_logging
 from app.helpers.router import FlowRouter
 from app.services.orders_service import OrdersService
-from app.services.results_service import ResultsService
+from app.services.tcp_supervisor import (
+    DEFAULT_STATS_SEC,
+    TcpSupervisor,
+    build_results_service,
+    reuse_port_supported,
+)
 
 app = typer.Typer(add_completion=False, help="Lab Integrator Service")
 
 
-def _ensure_dir(p: str):
-    os.makedirs(p, exist_ok=True)
-
-
-def _guess_payload_format(payload: bytes) -> str:
-    # Heurística rápida: HL7 suele iniciar con 'MSH'
-    if payload.strip().startswith(b"MSH"):
-        return "HL7"
-    return "ASTM"
-
-
-def _write_incoming(paths_cfg: dict, payload: bytes, fmt_hint: str | None = None) -> str:
-    inbox = os.path.join(paths_cfg["inbox_root"], "finecare")
-    _ensure_dir(inbox)
-    ts = datetime.utcnow().strftime("%Y%m%d-%H%M%S-%f")
-    fmt = fmt_hint or _guess_payload_format(payload)
-    ext = "hl7" if fmt == "HL7" else "astm"
-    fpath = os.path.join(inbox, f"{ts}.{ext}")
-    with open(fpath, "wb") as f:
-        f.write(payload)
-    return fpath
-
-
 # =============================
 
 
@@ -68,7 +64,7 @@ def send_order(example: str = typer.Option("minimal", help="elige payload de eje
     cfg = load_cfg()
     logger = setup_logging(cfg["paths"]["logs_root"], os.getenv("LOG_LEVEL", "INFO"))
     logger.log("INFO", "Iniciando envio de ordenes")
-    engine = HL7Engine("template_reader_orm_hl7.yaml")
+    engine = HL7Engine("template_reader_orm_hl7.yaml", parsers_cfg=cfg.get("parsers"))
     router = FlowRouter(engine, cfg)
     svc = OrdersService(router, cfg["transport"], cfg["paths"], cfg["retry"])
 
@@ -95,28 +91,38 @@ def send_order(example: str = typer.Option("minimal", help="elige payload de eje
             }
         ],
     }
-    asyncio.run(svc.send_order(payload))
+
+    async def _send():
+        try:
+            await svc.send_order(payload)
+        finally:
+            await svc.close()
+
+    asyncio.run(_send())
 
 
 @app.command()
-def results():
+def results(
+    workers: Optional[int] = typer.Option(
+        None, help="Procesos TCP con SO_REUSEPORT (default: transport.results.tcp.workers)"
+    ),
+):
     cfg = load_cfg()
     logger = setup_logging(cfg["paths"]["logs_root"], os.getenv("LOG_LEVEL", "INFO"))
     logger.log("INFO", "Iniciando lectura de resultados pendientes por procesar")
-    path_base = Path(cfg["paths"]["executable"])
-    path_config = Path(cfg["paths"]["config"])
-    path_template = Path(cfg["filename"]["template_hl7"])
-    full_path = Path(f"{path_base}/{path_config}/{path_template}")
-    engine = HL7Engine(f"{full_path}")
-    router = FlowRouter(engine, cfg)
-    svc = ResultsService(
-        router, cfg["transport"], cfg["paths"], cfg["validation"]["strict_histogram_256"]
-    )
+    tcp = cfg["transport"]["results"]["tcp"]
+    workers = workers or tcp.get("workers", 1)
+    if cfg["transport"]["results"]["type"] != "file" and workers > 1:
+        if reuse_port_supported():
+            # Supervisor: N procesos escuchando el mismo puerto, cada uno con su pipeline
+            TcpSupervisor(cfg, workers, stats_sec=tcp.get("stats_sec", DEFAULT_STATS_SEC)).run()
+            return
+        logger.warning("SO_REUSEPORT no disponible en esta plataforma; se usa un solo proceso")
+    svc = build_results_service(cfg)
     if cfg["transport"]["results"]["type"] == "file":
         glob_pat = cfg["transport"]["results"]["file"]["filename_glob"]
         asyncio.run(svc.run_file_mode(glob_pat))
     else:
-        tcp = cfg["transport"]["results"]["tcp"]
         asyncio.run(svc.run_tcp_mode(tcp["host"], tcp["port"]))
 
 
@@ -134,13 +140,7 @@ def run_results(is_stop_event: bool = False):
     logger = setup_logging(cfg["paths"]["logs_root"], os.getenv("LOG_LEVEL", "INFO"))
     logger.log("INFO", "Iniciando lectura de resultados pendientes por procesar")
 
-    engine = HL7Engine(
-        f"{cfg['paths']['executable']}{cfg['paths']['config']}/{cfg['filename']['template_hl7']}"
-    )
-    router = FlowRouter(engine, cfg)
-    svc = ResultsService(
-        router, cfg["transport"], cfg["paths"], cfg["validation"]["strict_histogram_256"]
-    )
+    svc = build_results_service(cfg)
 
     async def _amain():
         if cfg["transport"]["results"]["type"] == "file":
@@ -166,48 +166,153 @@ def run_results(is_stop_event: bool = False):
 
 @app.command()
 def finecare(
-    host: str = typer.Option("0.0.0.0", help="IP local para escuchar"),
-    port: int = typer.Option(8001, help="Puerto UDP (Finecare por defecto 8001)"),
-    bufsize: int = typer.Option(65535, help="Tamaño buffer UDP"),
+    host: Optional[str] = typer.Option(None, help="IP local para escuchar (default: config)"),
+    port: Optional[int] = typer.Option(None, help="Puerto UDP (Finecare por defecto 8001)"),
+    spool: Optional[bool] = typer.Option(
+        None, "--spool/--no-spool", help="Copiar cada mensaje recibido a disco (default: config)"
+    ),
 ):
     """
     Receiver de resultados Finecare por UDP.
-    - Guarda cada frame en /inbox_root/finecare/*.hl7|*.astm
-    - Reusa el pipeline ResultsService para procesarlos
+    - Reensambla los datagramas por peer y los entrega en memoria al pipeline ResultsService
+    - Opcional (--spool): guarda cada mensaje en inbox/finecare/*.hl7|*.astm
     """
     cfg = load_cfg()
-
-    # host = cfg["transport"]["results"]["finecare"]["bind_ip"]
-    # port = cfg["transport"]["results"]["finecare"]["port"]
+    fc = cfg["transport"]["results"].setdefault("finecare", {})
+    host = host or fc.get("bind_ip", "0.0.0.0")
+    port = port or fc.get("port", 8001)
+    if spool is not None:
+        fc["spool_incoming"] = spool
 
     logger = setup_logging(cfg["paths"]["logs_root"], os.getenv("LOG_LEVEL", "INFO"))
     logger.log("INFO", f"Finecare UDP receiver escuchando en {host}:{port}")
 
-    # Prepara motor/flujo (usa lo que ya tienes)
-    engine = HL7Engine(
-        f"[{cfg['paths']['executable']}{cfg['paths']['config']}/{cfg['filename']['template_hl7']}]"
-    )
-    router = FlowRouter(engine, cfg)
-    svc = ResultsService(
-        router, cfg["transport"], cfg["paths"], cfg["validation"]["strict_histogram_256"]
-    )
+    svc = build_results_service(cfg)
+    asyncio.run(svc.run_udp_mode(host, port))
 
-    # Socket UDP
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((host, port))
 
-    while True:
-        data, addr = sock.recvfrom(bufsize)
-        logger.log("INFO", f"Datagrama recibido de {addr[0]}:{addr[1]} ({len(data)} bytes)")
-        fpath = _write_incoming(cfg["paths"], data, None)
+@app.command()
+def bench(
+    count: int = typer.Option(DEFAULT_COUNT, help="Mensajes del corpus sintético"),
+    seed: int = typer.Option(
+        DEFAULT_SEED, help="Semilla del corpus (misma semilla = mismo corpus)"
+    ),
+    mix: str = typer.Option("icon3=1,finecare=1", help="Proporción de tipos de mensaje"),
+    only: Optional[str] = typer.Option(None, help=f"Casos separados por coma ({', '.join(CASES)})"),
+    e2e_count: int = typer.Option(DEFAULT_E2E_COUNT, help="Mensajes del round trip TCP"),
+    concurrency: int = typer.Option(1, help="Mensajes en vuelo en el round trip TCP"),
+    repeat: int = typer.Option(DEFAULT_REPEAT, help="Corridas por caso (se toma la mejor)"),
+    output: Optional[Path] = typer.Option(None, help="Guardar el reporte JSON aquí"),
+    baseline: Optional[Path] = typer.Option(None, help="Reporte JSON base para comparar"),
+    threshold: float = typer.Option(DEFAULT_THRESHOLD, help="Regresión tolerada (0.10 = 10%)"),
+):
+    """
+    Benchmarks reproducibles: framer MLLP, validación, normalize, payload y round trip TCP.
+    Termina con código 1 si hay regresiones contra --baseline.
+    """
+    # Solo advertencias: el log por mensaje del pipeline distorsiona la medición
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    report = run_suite(
+        count=count,
+        seed=seed,
+        mix=parse_mix(mix),
+        only=[c.strip() for c in only.split(",") if c.strip()] if only else None,
+        e2e_count=e2e_count,
+        concurrency=concurrency,
+        repeat=repeat,
+        on_case=lambda name, result: typer.echo(format_case(name, result)),
+    )
+    if output is not None:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        typer.echo(f"Reporte guardado en {output}")
+    if baseline is not None:
+        rows = compare(report, json.loads(baseline.read_text(encoding="utf-8")), threshold)
+        typer.echo(format_comparison(rows))
+        if any(r["regression"] for r in rows):
+            raise typer.Exit(code=1)
 
-        try:
-            # Delega a tu servicio actual de resultados
-            svc.process_file(fpath)
-            logger.log("INFO", f"Procesado OK: {fpath}")
-        except Exception as e:
-            logger.log("ERROR", f"Error procesando {fpath}: {e}")
+
+@app.command()
+def loadgen(
+    mode: str = typer.Option("tcp", help="tcp (MLLP con ACK) | udp (ráfaga Finecare)"),
+    host: Optional[str] = typer.Option(None, help="Listener a probar (default: config)"),
+    port: Optional[int] = typer.Option(None, help="Puerto (default: config según el modo)"),
+    connections: int = typer.Option(10, help="Analizadores simultáneos (conexiones/sockets)"),
+    mix: str = typer.Option("icon3=1,finecare=1", help="Proporción de mensajes (solo tcp)"),
+    rate: float = typer.Option(0.0, help="msgs/s totales (lazo abierto); 0 = lazo cerrado"),
+    duration: float = typer.Option(10.0, help="Segundos de carga (si no se da --count)"),
+    count: int = typer.Option(0, help="Mensajes totales; 0 = por --duration"),
+    pipeline: int = typer.Option(1, help="Mensajes sin ACK por conexión (lazo cerrado)"),
+    ack_timeout: float = typer.Option(DEFAULT_ACK_TIMEOUT, help="Espera máxima por cada ACK"),
+    udp_mllp: bool = typer.Option(False, help="Enmarcar los datagramas UDP con MLLP"),
+    seed: int = typer.Option(DEFAULT_SEED, help="Semilla del corpus"),
+    stats_url: Optional[str] = typer.Option(
+        None, help="Endpoint(s) /stats del listener, separados por coma (pérdida del lado servidor)"
+    ),
+    progress: float = typer.Option(1.0, help="Segundos entre líneas de avance (0 = sin avance)"),
+    output: Optional[Path] = typer.Option(None, help="Guardar el reporte JSON aquí"),
+):
+    """
+    Simula muchos analizadores contra el listener de resultados y mide latencia de ACK
+    (p50/p90/p99/p99.9) y pérdida. Reemplaza a test-icon.py: un solo Icon-3 es
+    `loadgen --connections 1 --count 1 --mix icon3=1`.
+    """
+    cfg = load_cfg()
+    res = cfg["transport"]["results"]
+    if mode == "tcp":
+        default_host, default_port = res["tcp"]["host"], res["tcp"]["port"]
+    elif mode == "udp":
+        fc = res.get("finecare") or {}
+        default_host, default_port = fc.get("bind_ip", "127.0.0.1"), fc.get("port", 8001)
+    else:
+        raise typer.BadParameter(f"modo inválido: {mode!r} (use tcp o udp)")
+    host = host or default_host
+    host = "127.0.0.1" if host in ("0.0.0.0", "") else host
+    port = port or default_port
+    urls = [u.strip() for u in (stats_url or "").split(",") if u.strip()]
+    typer.echo(f"loadgen {mode} -> {host}:{port}, {connections} analizador(es)")
+    if mode == "tcp":
+        report = asyncio.run(
+            run_tcp(
+                host,
+                port,
+                connections=connections,
+                mix=parse_mix(mix),
+                rate=rate,
+                duration=duration,
+                count=count,
+                pipeline=pipeline,
+                ack_timeout=ack_timeout,
+                seed=seed,
+                stats_urls=urls,
+                progress_sec=progress,
+                on_progress=typer.echo,
+            )
+        )
+    else:
+        report = asyncio.run(
+            run_udp(
+                host,
+                port,
+                analyzers=connections,
+                rate=rate,
+                duration=duration,
+                count=count,
+                mllp=udp_mllp,
+                seed=seed,
+                stats_urls=urls,
+            )
+        )
+    typer.echo(format_load_report(report))
+    if output is not None:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        typer.echo(f"Reporte guardado en {output}")
 
 
 if __name__ == "__main__":
+    # Necesario para el pool de procesos (spawn) en el ejecutable de PyInstaller
+    multiprocessing.freeze_support()
     app()
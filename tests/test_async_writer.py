@@ -0,0 +1,34 @@
+import asyncio
+import json
+
+from app.helpers.async_writer import AsyncFileWriter
+
+
+def test_writes_keep_order_per_destination(tmp_path):
+    async def main():
+        w = AsyncFileWriter(workers=3, max_pending=4)
+        target = tmp_path / "out" / "same.txt"
+        for i in range(20):
+            await w.write_text(target, str(i), wait=False)
+        await w.write_json(tmp_path / "out" / "data.json", {"a": 1})
+        await w.aclose()
+        return w.stats()
+
+    stats = asyncio.run(main())
+    assert (tmp_path / "out" / "same.txt").read_text() == "19"
+    assert json.loads((tmp_path / "out" / "data.json").read_text()) == {"a": 1}
+    assert stats["completed"] == stats["submitted"] and stats["queue_depth"] == 0
+    assert stats["max_queue_depth"] <= 4
+
+
+def test_errors_are_reported_to_caller(tmp_path):
+    async def main():
+        w = AsyncFileWriter()
+        try:
+            await w.move(tmp_path / "missing.hl7", tmp_path / "dst.hl7")
+        except FileNotFoundError:
+            return w.stats()
+        finally:
+            await w.aclose()
+
+    assert asyncio.run(main())["failed"] == 1
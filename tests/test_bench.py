@@ -0,0 +1,52 @@
+from app.bench.corpus import build_corpus, parse_mix
+from app.bench.suite import compare, percentile, run_suite
+from app.commons.hl7_normalizer import HL7Normalizer
+from app.validation.validators import validate_hl7_message_or_raise
+
+
+def test_corpus_is_deterministic_and_valid():
+    corpus = build_corpus(40, seed=7)
+    assert corpus == build_corpus(40, seed=7)
+    assert corpus != build_corpus(40, seed=8)
+    assert {kind for kind, _ in corpus} == {"icon3", "finecare"}
+    assert len({len(text) for _, text in corpus}) > 5  # tamaños variados
+
+    normalizer = HL7Normalizer()
+    for kind, text in corpus:
+        validate_hl7_message_or_raise(text)
+        res = normalizer.normalize(text)
+        assert res.patient.name
+        if kind == "icon3":
+            assert len(res.extras["raw_histograms"]) == 3
+            assert res.patient.age is not None
+
+    only_icon = build_corpus(10, mix=parse_mix("icon3=1"))
+    assert {kind for kind, _ in only_icon} == {"icon3"}
+
+
+def test_suite_report_and_baseline_comparison():
+    report = run_suite(count=120, e2e_count=80, repeat=1)
+    assert list(report["cases"]) == [
+        "frame",
+        "validate",
+        "normalize",
+        "to_sofia_payload",
+        "tcp_roundtrip",
+    ]
+    for result in report["cases"].values():
+        assert result["msgs_per_sec"] > 0 and result["p99_us"] >= result["p50_us"]
+    e2e = report["cases"]["tcp_roundtrip"]
+    assert e2e["failed"] == 0 and e2e["json_written"] == 80
+
+    slower = {"cases": {"validate": dict(report["cases"]["validate"])}}
+    slower["cases"]["validate"]["msgs_per_sec"] *= 2  # la base era el doble de rápida
+    rows = compare(report, slower, threshold=0.1)
+    assert any(r["regression"] and r["metric"] == "msgs_per_sec" for r in rows)
+    assert not any(r["regression"] for r in compare(report, report))
+
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 0.5) == 50.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.5) == 0.0
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from app.helpers.file_transport import FileWatcher
+from app.helpers.inotify_source import inotify_available
+
+SOURCES = [
+    "watchdog",
+    pytest.param(
+        "inotify", marks=pytest.mark.skipif(not inotify_available(), reason="inotify solo en Linux")
+    ),
+]
+
+
+@pytest.mark.parametrize("source", SOURCES)
+def test_slow_writer_is_delivered_once_and_complete(tmp_path, source):
+    delivered = []
+
+    async def on_message(text, path):
+        delivered.append((path, text))
+
+    async def main():
+        watcher = FileWatcher(
+            str(tmp_path),
+            "*.hl7",
+            on_message,
+            asyncio.get_running_loop(),
+            stable_sec=0.3,
+            poll_sec=0.05,
+            source=source,
+        )
+        watcher.start()
+        await asyncio.sleep(0.1)
+        # Escritor lento: varios modified, con pausas menores que stable_sec
+        with open(tmp_path / "slow.hl7", "w", encoding="utf-8") as f:
+            for i in range(4):
+                f.write(f"OBX|{i}\n")
+                f.flush()
+                await asyncio.sleep(0.1)
+        (tmp_path / "tmp.part").write_text("MSH|fast\n", encoding="utf-8")
+        (tmp_path / "tmp.part").rename(tmp_path / "fast.hl7")
+        (tmp_path / "ignored.txt").write_text("x", encoding="utf-8")
+        await asyncio.sleep(0.8)
+        # Eventos tardíos del mismo archivo no lo vuelven a entregar
+        watcher._touch(str(tmp_path / "fast.hl7"), True)
+        watcher._touch(str(tmp_path / "slow.hl7"))
+        await asyncio.sleep(0.6)
+        watcher.stop()
+        return watcher.stats()
+
+    stats = asyncio.run(main())
+    assert sorted(delivered) == [
+        (str(tmp_path / "fast.hl7"), "MSH|fast\n"),
+        (str(tmp_path / "slow.hl7"), "OBX|0\nOBX|1\nOBX|2\nOBX|3\n"),
+    ]
+    assert stats["delivered"] == 2 and stats["events"] >= 3
@@ -0,0 +1,77 @@
+import asyncio
+import base64
+import json
+
+import numpy as np
+
+from app.commons.histograms import analyze_batch, message_histograms
+from app.commons.hl7_engine import HL7Engine
+from app.commons.hl7_message import HL7Message
+from app.helpers.router import FlowRouter
+from app.services.results_service import ResultsService
+from app.validation.validators import validate_hl7_message_or_raise
+
+
+def _icon3(wbc: bytes, rbc: bytes, wd=(10, 20), rd=100) -> str:
+    b64 = base64.b64encode
+    wd_lines = [f"NTE|WD{i}||{v}|{i}^WBC Discriminator #{i} (fL)" for i, v in enumerate(wd)]
+    return "\r".join(
+        [
+            "MSH|^~\\&|Icon-3|NI30H24105|LIS Application|LIS|20250821100844||ORU^R01|1|P|2.5",
+            "OBX|1|NM|0^RBC||4.03|10^6/µL|3.85-5.78||||F",
+            f"OBX|2|ED|RBCHistogram^RBCHistogram||{b64(rbc).decode()}||||||F",
+            f"OBX|3|ED|WBCHistogram^WBCHistogram||{b64(wbc).decode()}||||||F",
+            f"NTE|RD||{rd}|RE^RBC Discriminator (fL)",
+        ]
+        + wd_lines
+    )
+
+
+def test_decoded_once_and_batch_metrics():
+    wbc = np.zeros(256, dtype=np.uint8)
+    wbc[5], wbc[15], wbc[30] = 10, 20, 70  # LYM | MID | GRA con WD0=10, WD1=20
+    rbc = bytes(range(256))
+    msgs = [HL7Message(_icon3(wbc.tobytes(), rbc)), HL7Message(_icon3(bytes(256), rbc, wd=(40,)))]
+
+    validate_hl7_message_or_raise(msgs[0])
+    first = message_histograms(msgs[0])
+    assert message_histograms(msgs[0]) is first  # el validador ya dejó los arreglos
+    assert first["WBCHistogram"].data.dtype == np.uint8
+
+    m0, m1 = analyze_batch(msgs)
+    assert m0["WBCHistogram"]["peak_bin"] == 30 and m0["WBCHistogram"]["area"] == 100
+    assert m0["WBCHistogram"]["fractions"] == [0.1, 0.2, 0.7]
+    assert [d["bin"] for d in m0["WBCHistogram"]["discriminators"]] == [10, 20]
+    assert m0["RBCHistogram"]["fractions"] == [
+        round(sum(range(100)) / sum(range(256)), 4),
+        round(sum(range(100, 256)) / sum(range(256)), 4),
+    ]
+    assert m1["WBCHistogram"]["area"] == 0 and m1["WBCHistogram"]["fractions"] == [None, None]
+
+
+def test_sidecar_replaces_base64_in_output(tmp_path):
+    paths = {k: str(tmp_path / k) for k in ("inbox", "archive", "error", "logs_root")}
+    router = FlowRouter(HL7Engine({}), {"paths": paths, "engine": {}})
+    svc = ResultsService(
+        router, {"results": {}}, paths, histogram_cfg={"output": "sidecar", "metrics": True}
+    )
+    wbc, rbc = bytes([7] * 256), bytes(range(256))
+
+    async def main():
+        await svc.startup()
+        for _ in range(2):
+            await svc._process_text(_icon3(wbc, rbc), "")
+        await svc.shutdown()
+
+    asyncio.run(main())
+    payloads = [json.loads(p.read_text()) for p in sorted((tmp_path / "archive").glob("*.json"))]
+    (sidecar,) = (tmp_path / "archive" / "histograms").iterdir()
+    blob = sidecar.read_bytes()
+    assert len(blob) == 4 * 256
+    refs = [p["extras"]["raw_histograms"]["WBCHistogram"] for p in payloads]
+    assert sorted(r["index"] for r in refs) == [1, 3]
+    for ref in refs:
+        assert blob[ref["index"] * 256 : (ref["index"] + 1) * 256] == wbc
+    histo = [r for r in payloads[0]["results"] if r["test_code"] == "RBCHistogram"]
+    assert histo[0]["value"]["sidecar"] == sidecar.name
+    assert payloads[0]["extras"]["histogram_metrics"]["WBCHistogram"]["peak"] == 7
@@ -0,0 +1,63 @@
+from app.commons.hl7_engine import HL7Engine
+from app.helpers.router import FlowRouter
+
+TEMPLATE = "app/configs/template_reader_orm_hl7.yaml"
+
+ORU = (
+    "MSH|^~\\&|LAB|SITE|LIS|HOSP|20250811095739||ORU^R01|CTRL9|P|2.5\r"
+    "PID|1||123^^^CC||PEREZ ^ juan||19900131|M\r"
+    "PV1|1|O|URG^^^A\r"
+    "OBX|0|NM|X^HUERFANO||1\r"
+    "OBR|1|O1||GLU^GLUCOSA|||20250811064326\r"
+    "OBX|1|NM|G1^Glucosa||95|^mg/dL|70-110|N|||F|||20250811070000\r"
+    "OBR|2|O2||HEM^HEMOGRAMA|||20250811bad\r"
+    "OBX|1|NM|0^RBC||4.03|^10^6/uL|3.85-5.78||||F\r"
+    "NTE|1||comentario\r"
+    "OBX|2|NM|1^HGB||13.5|^g/dL|12-16||||F\r"
+)
+
+
+def test_header_and_grouped_profiles_build_nested_output():
+    engine = HL7Engine(TEMPLATE)
+    header = engine.extract("HEADER_PATIENT", ORU)
+    assert header["meta"] == {
+        "fecha_mensaje": "2025-08-11 09:57:39",
+        "message_type": "ORU^R01",
+        "msg_ctrl_id": "CTRL9",
+        "processing_id": "P",
+    }
+    assert header["paciente"] == {
+        "num_doc": "123",
+        "apellidos": "PEREZ",
+        "nombres": "JUAN",
+        "fecha_nac": "1990-01-31",
+        "sexo": "M",
+    }
+    assert header["atencion"] == {"servicio": "URG"}
+
+    data = engine.extract_grouped("OBR_OBX_GROUPED", ORU, base_out=header)
+    assert data["meta"]["msg_ctrl_id"] == "CTRL9"
+    o1, o2 = data["ordenes"]
+    assert o1["obr"] == {
+        "orden_id": "O1",
+        "codigo": "GLU",
+        "descripcion": "GLUCOSA",
+        "fecha_muestra": "2025-08-11 06:43:26",
+    }
+    assert [e["codigo"] for e in o1["examenes"]] == ["G1"]
+    assert o1["examenes"][0]["obs_datetime"] == "2025-08-11 07:00:00"
+    assert o1["examenes"][0]["unidades"] == "mg/dL"
+    # Fecha que no calza con el formato: queda el texto original
+    assert o2["obr"]["fecha_muestra"] == "20250811bad"
+    assert [e["descripcion"] for e in o2["examenes"]] == ["RBC", "HGB"]
+
+
+def test_router_extract_results_uses_compiled_profiles():
+    engine = HL7Engine(TEMPLATE)
+    cfg = {
+        "paths": {},
+        "engine": {"extractor_profile": "OBR_OBX_GROUPED", "header_profile": "HEADER_PATIENT"},
+    }
+    data = FlowRouter(engine, cfg).extract_results(ORU)
+    assert len(data["ordenes"]) == 2 and "icon3" in data
+    assert data["ordenes"][1]["examenes"][1]["valor_norm"]["numeric"] == 13.5
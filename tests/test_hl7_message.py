@@ -0,0 +1,36 @@
+from app.commons.hl7_message import HL7Message
+from app.parsers.base import detect_profile
+from app.validation.validators import parse_msh9_from_text
+
+MSG = (
+    "MSH#$~\\&#Icon-3#LAB#LIS#HOSP#20250821100844##ORU$R01#CTRL42#P#2.5\r\n"
+    "PID#1##DOC123$$#\r\n"
+    "\r\n"
+    "OBX#1#NM#0$RBC##4.03#fL\r\n"
+    "OBX#2#NM#1$HGB##186#g/L\r\n"
+)
+
+
+def test_index_and_custom_separators():
+    msg = HL7Message(MSG)
+    assert msg.seps["f"] == "#" and msg.seps["c"] == "$"
+    assert msg.segment_types == ["MSH", "PID", "OBX", "OBX"]
+    assert msg.positions("OBX") == [2, 3]
+    assert msg.control_id == "CTRL42"
+    assert msg.get("OBX-3-2") == "RBC"
+    assert msg.get("PID-3-1") == "DOC123"
+    assert msg.get("MSH-9") == "ORU$R01"
+
+
+def test_spans_point_into_original_text():
+    msg = HL7Message(MSG)
+    for i in range(len(msg)):
+        start, end = msg.span(i)
+        assert MSG[start:end] == msg.segment(i)
+
+
+def test_stages_accept_shared_message():
+    msg = HL7Message(MSG)
+    assert detect_profile(msg) == "ICON3"
+    assert parse_msh9_from_text(msg) == "ORU$R01"
+    assert HL7Message.coerce(msg) is msg
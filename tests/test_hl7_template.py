@@ -0,0 +1,62 @@
+import pytest
+
+from app.commons.hl7_engine import HL7Engine
+from app.commons.hl7_message import HL7Message
+from app.commons.hl7_template import TemplateError
+
+TEMPLATE = "app/configs/template_reader_orm_hl7.yaml"
+
+
+def _payload(n_orders=2):
+    return {
+        "paciente": {
+            "tipo_doc": "cc",
+            "num_doc": "123",
+            "apellidos": " perez|gómez ",
+            "nombres": "juan",
+            "fecha_nac": "1990-01-31",
+            "sexo": None,
+        },
+        "atencion": {"servicio": "URGENCIAS"},
+        "meta": {"fecha_mensaje": "2025-08-15 12:00:00", "msg_ctrl_id": "ABC123"},
+        "ordenes": [
+            {
+                "orden_id": f"O{i}",
+                "placer_id": f"P{i}",
+                "codigo": "GLU",
+                "descripcion": "GLUCOSA^BASAL",
+                "fecha_orden": "2025-08-15 12:00:00",
+                "fecha_muestra": "2025-08-15 12:05:00",
+            }
+            for i in range(n_orders)
+        ],
+    }
+
+
+def test_render_orm_each_applies_mappings_transforms_and_escaping():
+    msg = HL7Message(HL7Engine(TEMPLATE).render("ORM_O01_ORC_EACH", _payload()))
+    assert msg.segment_types == ["MSH", "PID", "PV1", "ORC", "OBR", "ORC", "OBR"]
+    assert msg.get("MSH-7") == "20250815120000" and msg.control_id == "ABC123"
+    # upper + trim, separadores escapados, default de sexo y datefmt
+    assert msg.first_fields("PID")[1:9] == [
+        "CC", "123", "1", "FIJO", "PEREZ\\F\\GÓMEZ^JUAN", "", "19900131", "U"
+    ]  # fmt: skip
+    assert msg.fields(6)[2] == "O1" and msg.fields(6)[4] == "GLU^GLUCOSA\\S\\BASAL"
+
+
+def test_missing_placeholder_policies():
+    cfg = {
+        "templates": {
+            "T": ["MSH|^~\\&|@A|@THIS_MISSING", {"for_each": "xs", "lines": ["X|@THIS.v"]}]
+        },
+        "mappings": {"A": {"source": "DATA:a"}},
+        "options": {"missing_placeholder": "empty"},
+    }
+    assert HL7Engine(dict(cfg)).render("T", {"xs": [{"v": 1}, {}]}) == "MSH|^~\\&||\rX|1\rX|\r"
+
+    cfg["options"] = {"missing_placeholder": "error"}
+    with pytest.raises(TemplateError):
+        HL7Engine(cfg)  # @THIS_MISSING no tiene mapping
+    cfg["templates"]["T"][0] = "MSH|^~\\&|@A"
+    with pytest.raises(TemplateError, match="@A"):
+        HL7Engine(cfg).render("T", {"xs": []})
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+from app.helpers.ingest_queue import IngestQueue
+
+
+def test_full_queue_blocks_producers_and_drain_processes_everything():
+    async def main():
+        gate = asyncio.Event()
+        done = []
+
+        async def handler(n):
+            await gate.wait()
+            done.append(n)
+            return n * 10
+
+        q = IngestQueue(handler, maxsize=2, workers=1)
+        first = await q.submit(0)
+        await asyncio.sleep(0)  # el worker toma el primero y queda esperando
+        await q.submit(1)
+        await q.submit(2)
+        blocked = asyncio.create_task(q.submit(3))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()  # cola llena: el productor espera
+
+        gate.set()
+        await blocked
+        await q.drain()
+        return await first, done, q.stats()
+
+    first, done, stats = asyncio.run(main())
+    assert first == 0 and done == [0, 1, 2, 3]
+    assert stats["processed"] == 4 and stats["queue_depth"] == 0
+
+
+def test_submit_threadsafe_from_foreign_thread():
+    async def main():
+        seen = []
+
+        async def handler(text, src):
+            seen.append((text, src))
+
+        q = IngestQueue(handler, maxsize=1, workers=2)
+        await q.start()
+        t = threading.Thread(target=lambda: [q.submit_threadsafe(f"m{i}", "f") for i in range(5)])
+        t.start()
+        await asyncio.to_thread(t.join)
+        await q.drain()
+        return sorted(seen)
+
+    assert asyncio.run(main()) == [(f"m{i}", "f") for i in range(5)]
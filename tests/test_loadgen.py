@@ -0,0 +1,95 @@
+import asyncio
+
+from app.bench.loadgen import make_control_id, run_tcp, run_udp, with_control_id
+from app.commons.hl7_message import HL7Message
+from app.commons.metrics import Metrics, MetricsServer
+from app.helpers.tcp_transport import TcpServer
+from app.helpers.udp_transport import UdpServer
+from tests.test_parsers import FINECARE
+
+
+def test_with_control_id_only_touches_msh10():
+    text = FINECARE.replace("\n", "\r")
+    out = with_control_id(text, "LG0001")
+    msg = HL7Message(out)
+    assert msg.control_id == "LG0001"
+    assert out.split("\r")[1:] == text.split("\r")[1:]
+
+
+def test_control_ids_stay_unique_past_the_padding_width():
+    assert make_control_id("123456", 1001, 0) != make_control_id("123456", 100, 10_000_000)
+    assert make_control_id("123456", 7, 42) == "123456-007-0000042"
+
+
+def _tcp(handler, **kwargs):
+    async def main():
+        server = TcpServer("127.0.0.1", 0, handler, pipeline_depth=16)
+        srv = await server.listen()
+        port = srv.sockets[0].getsockname()[1]
+        try:
+            return await run_tcp("127.0.0.1", port, pool=20, progress_sec=0, **kwargs), server
+        finally:
+            srv.close()
+            await srv.wait_closed()
+
+    return asyncio.run(main())
+
+
+def test_tcp_closed_and_open_loop():
+    seen = set()
+
+    async def ack(msg, peer):
+        seen.add(msg.control_id)
+        return "AA"
+
+    report, server = _tcp(ack, connections=4, count=42, pipeline=2)
+    assert report["sent"] == report["acked"] == 42 and report["lost"] == 0
+    assert report["ack_codes"] == {"AA": 42} and report["loop"] == "closed"
+    assert len(seen) == 42  # MSH-10 único por mensaje
+    assert server.stats()["accepted"] == 4
+    assert report["latency"]["p99_ms"] >= report["latency"]["p50_ms"] > 0
+
+    report, _ = _tcp(ack, connections=3, rate=200, duration=0.3)
+    assert report["loop"] == "open" and report["lost"] == 0
+    assert 30 <= report["sent"] <= 70
+
+
+def test_tcp_missing_acks_count_as_lost():
+    async def slow(msg, peer):
+        if msg.control_id.endswith("0000003"):
+            await asyncio.sleep(1)  # el ACK de este mensaje no llega a tiempo
+        return "AR" if msg.control_id.endswith("0000001") else "AA"
+
+    report, _ = _tcp(slow, connections=1, count=5, pipeline=8, ack_timeout=0.3)
+    assert report["sent"] == 5
+    assert report["ack_codes"] == {"AA": 2, "AR": 1}  # los ACK van en orden: el 4º también espera
+    assert report["lost"] == 2
+
+
+def test_udp_flood_measures_loss_via_stats_endpoint():
+    async def main():
+        received = []
+
+        async def on_message(text, peer):
+            received.append(text)
+
+        udp = UdpServer("127.0.0.1", 0, on_message, idle_flush=0.05)
+        transport = await udp.listen()
+        port = transport.get_extra_info("sockname")[1]
+        stats = MetricsServer(
+            Metrics(), port=0, stats_fn=lambda: {"ingest": {"submitted": len(received)}}
+        )
+        srv = await stats.start()
+        url = f"http://127.0.0.1:{srv.sockets[0].getsockname()[1]}/stats"
+        try:
+            return await run_udp(
+                "127.0.0.1", port, analyzers=3, count=30, mllp=True, pool=10,
+                stats_urls=[url], settle_sec=0.3,
+            )  # fmt: skip
+        finally:
+            udp.close()
+            await stats.aclose()
+
+    report = asyncio.run(main())
+    assert report["sent"] == 30 and report["server_received"] == 30
+    assert report["lost"] == 0 and report["loss_pct"] == 0.0
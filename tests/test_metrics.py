@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from app.commons.metrics import Metrics, MetricsServer, write_snapshot
+
+
+def test_render_prometheus_text():
+    m = Metrics(prefix="t", buckets=(0.001, 0.01))
+    m.inc("results_total", analyzer="ICON3", code="AA")
+    m.inc("results_total", analyzer="ICON3", code="AA")
+    m.inc("errors_total", stage="frame", kind='raro"x')
+    m.inc("results_total", analyzer="ICON\\3\nx", code="AA")  # MSH-3 con basura
+    m.observe("stage_seconds", 0.0005, stage="parse")
+    m.observe("stage_seconds", 0.005, stage="parse")
+    m.observe("stage_seconds", 1.0, stage="parse")
+    m.gauge("queue_depth", lambda: 7, queue="ingest")
+    m.gauge("queue_depth", lambda: 1 / 0, queue="roto")  # un gauge que falla no rompe el resto
+
+    text = m.render()
+    assert "# TYPE t_results_total counter" in text
+    assert 't_results_total{analyzer="ICON3",code="AA"} 2' in text
+    assert 't_errors_total{kind="raro\\"x",stage="frame"} 1' in text
+    assert 't_results_total{analyzer="ICON\\\\3\\nx",code="AA"} 1' in text
+    assert 't_queue_depth{queue="ingest"} 7' in text
+    assert "roto" not in text
+    assert 't_stage_seconds_bucket{stage="parse",le="0.001"} 1' in text
+    assert 't_stage_seconds_bucket{stage="parse",le="0.01"} 2' in text
+    assert 't_stage_seconds_bucket{stage="parse",le="+Inf"} 3' in text
+    assert 't_stage_seconds_count{stage="parse"} 3' in text
+
+    snap = m.snapshot()
+    parse = snap["histograms"]["stage_seconds"]["stage=parse"]
+    assert parse["count"] == 3 and parse["p50_ms"] == 10.0 and parse["p99_ms"] is None
+    assert snap["gauges"]["queue_depth"] == {"queue=ingest": 7.0}
+
+
+def test_disabled_metrics_record_nothing():
+    m = Metrics(enabled=False)
+    m.inc("results_total", code="AA")
+    m.lap("parse", 0.0)
+    assert m.snapshot() == {"histograms": {}, "counters": {}, "gauges": {}}
+
+
+def test_http_endpoint_and_snapshot(tmp_path):
+    m = Metrics()
+    m.inc("results_total", analyzer="FINECARE", code="AA")
+
+    async def get(port, path):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+        raw = await reader.read()
+        writer.close()
+        head, _, body = raw.partition(b"\r\n\r\n")
+        return head.split(b"\r\n")[0].decode(), body.decode()
+
+    async def main():
+        server = MetricsServer(m, port=0, stats_fn=lambda: {"ingest": {"queue_depth": 0}})
+        srv = await server.start()
+        port = srv.sockets[0].getsockname()[1]
+        try:
+            out = [await get(port, p) for p in ("/metrics", "/stats", "/nada")]
+            # Cabeceras por encima del límite del StreamReader: 400, sin excepción suelta
+            out.append(await get(port, "/metrics\r\nX-Big: " + "a" * 70000))
+            return out
+        finally:
+            await server.aclose()
+
+    (status, body), (st_status, st_body), (nf_status, _), (big_status, _) = asyncio.run(main())
+    assert status.endswith("200 OK")
+    assert 'lab_integrator_results_total{analyzer="FINECARE",code="AA"} 1' in body
+    assert st_status.endswith("200 OK")
+    assert json.loads(st_body)["stats"] == {"ingest": {"queue_depth": 0}}
+    assert nf_status.endswith("404 Not Found")
+    assert big_status.endswith("400 Bad Request")
+
+    write_snapshot(tmp_path / "m" / "snap.json", {"metrics": m.snapshot()})
+    assert json.loads((tmp_path / "m" / "snap.json").read_text())["metrics"]["counters"]
+    assert not (tmp_path / "m" / "snap.json.tmp").exists()
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import time
+import zlib
+
+from app.helpers.ndjson_sink import MANIFEST_NAME, NdjsonSink
+from tests.test_raw_spool import _TornFile
+
+
+def _manifest(d):
+    return [json.loads(line) for line in (d / MANIFEST_NAME).read_text().splitlines()]
+
+
+def test_rotates_by_size_and_publishes_complete_segments(tmp_path):
+    async def main():
+        sink = NdjsonSink(tmp_path, max_bytes=1024, max_age_sec=0)
+        sink.open()
+        names = await asyncio.gather(*(sink.write({"i": i, "v": "x" * 40}) for i in range(100)))
+        assert all(n.endswith(".ndjson") for n in names)
+        await sink.aclose()
+        return sink.stats()
+
+    stats = asyncio.run(main())
+    entries = _manifest(tmp_path)
+    assert len(entries) == stats["finalized"] > 1
+    assert not list(tmp_path.glob("*.part"))
+    rows = []
+    for e in entries:
+        lines = (tmp_path / e["file"]).read_text(encoding="utf-8").splitlines()
+        assert len(lines) == e["records"]
+        rows += [json.loads(line) for line in lines]
+    assert [r["i"] for r in rows] == list(range(100))
+    assert stats["avg_batch"] > 1  # group flush: varias líneas por write
+
+
+def test_recovers_partial_segment_and_rotates_idle_by_age(tmp_path):
+    # Caída a mitad de una línea: se recorta y se publica al abrir
+    (tmp_path / "results-00000007.ndjson.part").write_text('{"a":1}\n{"a":', encoding="utf-8")
+
+    async def main():
+        sink = NdjsonSink(tmp_path, max_age_sec=0.2)
+        assert sink.open() == 1
+        await sink.write({"a": 2})
+        deadline = time.monotonic() + 5
+        while sink.stats()["finalized"] < 2 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await sink.aclose()
+
+    asyncio.run(main())
+    entries = _manifest(tmp_path)
+    assert [(e["file"], e["records"]) for e in entries] == [
+        ("results-00000007.ndjson", 1),
+        ("results-00000008.ndjson", 1),
+    ]
+    assert (tmp_path / "results-00000007.ndjson").read_text() == '{"a":1}\n'
+
+
+def test_failed_write_leaves_no_half_line_and_manifest_matches_file(tmp_path):
+    async def main():
+        sink = NdjsonSink(tmp_path, max_age_sec=0)
+        sink.open()
+        await sink.write({"i": 1})
+        sink._file = _TornFile(sink._file)
+        try:
+            await sink.write({"i": 2, "v": "x" * 100})
+        except OSError:
+            pass
+        else:
+            raise AssertionError("el write debió fallar")
+        await sink.write({"i": 3})
+        await sink.aclose()
+
+    asyncio.run(main())
+    (entry,) = _manifest(tmp_path)
+    data = (tmp_path / entry["file"]).read_bytes()
+    assert [json.loads(line)["i"] for line in data.splitlines()] == [1, 3]
+    assert entry["records"] == 2 and entry["bytes"] == len(data)
+    assert entry["crc32"] == f"{zlib.crc32(data):08x}"
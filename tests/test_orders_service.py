@@ -0,0 +1,58 @@
+import asyncio
+
+from app.helpers.tcp_transport import TcpServer
+from app.services.orders_service import OrdersService
+
+
+class _Router:
+    """Router mínimo: la plantilla ORM no es parte de esta prueba."""
+
+    def render_order(self, payload):
+        return f"MSH|^~\\&|LIS|HOSP|Icon-3|LAB|20250101||ORM^O01|{payload['id']}|P|2.5\rPID|1\r"
+
+    def archive_raw(self, direction, hl7_text, tag):
+        pass
+
+
+RETRY = {"attempts": 3, "backoff_sec": 0.01, "max_backoff_sec": 0.05}
+
+
+def test_send_orders_to_files_reports_each_order(tmp_path):
+    transport = {"orders": {"type": "file", "file": {"filename_pattern": "ORD_{uuid}.hl7"}}}
+    svc = OrdersService(_Router(), transport, {"outbox": str(tmp_path)}, RETRY)
+
+    async def payloads():
+        for i in range(20):
+            yield {"id": f"F{i}"}
+
+    outcomes = asyncio.run(svc.send_orders(payloads(), concurrency=4))
+    assert [o.control_id for o in outcomes] == [f"F{i}" for i in range(20)]
+    assert all(o.ok and o.attempts == 1 for o in outcomes)
+    assert len(list(tmp_path.glob("ORD_*.hl7"))) == 20
+
+
+def test_send_orders_over_tcp_retries_without_blocking_others():
+    seen = {}
+
+    async def on_message(msg, peer):
+        cid = msg.control_id
+        seen[cid] = seen.get(cid, 0) + 1
+        if cid == "T0" and seen[cid] == 1:
+            return "AE"  # falla transitoria: se reintenta
+        return "AR" if cid == "T1" else "AA"
+
+    async def main():
+        server = TcpServer("127.0.0.1", 0, on_message)
+        srv = await server.listen()
+        port = srv.sockets[0].getsockname()[1]
+        transport = {"orders": {"type": "tcp", "tcp": {"host": "127.0.0.1", "port": port}}}
+        svc = OrdersService(_Router(), transport, {}, RETRY)
+        outcomes = await svc.send_orders([{"id": f"T{i}"} for i in range(6)], concurrency=2)
+        await svc.close()
+        srv.close()
+        await srv.wait_closed()
+        return outcomes
+
+    outcomes = asyncio.run(main())
+    assert [(o.status, o.attempts) for o in outcomes[:2]] == [("sent", 2), ("rejected", 1)]
+    assert all(o.ok and o.ack == "AA" for o in outcomes[2:])
@@ -0,0 +1,23 @@
+import asyncio
+
+import pytest
+
+from app.commons.parse_pool import InvalidResultError, ParsePool
+from tests.test_parsers import FINECARE
+
+
+def test_pool_maps_valid_and_rejects_invalid_messages():
+    async def main():
+        pool = ParsePool({}, workers=1)
+        await asyncio.to_thread(pool.start)
+        try:
+            ok = await asyncio.gather(*(pool.validate_and_map(FINECARE) for _ in range(10)))
+            with pytest.raises(InvalidResultError):
+                await pool.validate_and_map("PID|1")
+            return ok
+        finally:
+            pool.shutdown()
+
+    payloads = asyncio.run(main())
+    assert len(payloads) == 10
+    assert payloads[0]["patient"]["sex"] == "M"
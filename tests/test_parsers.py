@@ -1,6 +1,9 @@
 # flake8: noqa
 
+from app.commons.hl7_message import HL7Message
 from app.commons.hl7_normalizer import HL7Normalizer
+from app.parsers.models import NormalizedResult, Observation, OrderInfo, Patient
+from app.parsers.registry import ParserRegistry
 
 ICON3 = """MSH|^~\&|Icon-3|NI30H24105 |LIS Application|LIS|20250811095739||ORU^R01|638905030599480000|P|2.5||||||UNICODE UTF-8
 SFT|N|1.3.2596.0|Icon-3|1.3.2596.0|Product Version: 0.9 Software complete version: 1.3.2596.0(FE - 00 - 45)|20240124034738
@@ -39,3 +42,67 @@ def test_sofia_payload_shape():
     payload = n.to_sofia_payload(n.normalize(FINECARE))
     assert "patient" in payload and "results" in payload
     assert isinstance(payload["results"], list)
+
+
+def _parse_acme(msg):
+    return NormalizedResult("ACME", "2.3", Patient(), OrderInfo(), [], {})
+
+
+def _detect_acme(msg):
+    return msg.get("MSH-3") == "ACME"
+
+
+def test_registry_config_plugin_and_detection_cache():
+    reg = ParserRegistry.from_config(
+        {
+            "entry_points": False,
+            "registry": {
+                "ACME": {
+                    "parser": "tests.test_parsers:_parse_acme",
+                    "detect": "tests.test_parsers:_detect_acme",
+                }
+            },
+        }
+    )
+    n = HL7Normalizer(registry=reg)
+    acme = "MSH|^~\\&|ACME|LAB|||20250101||ORU^R01|1|P|2.3\r"
+    assert n.normalize(acme, origin="tcp_a").analyzer == "ACME"
+    assert n.normalize(ICON3, origin="tcp_b").patient.age == 55
+    # Misma clave (MSH-3, MSH-4, MSH-12, MSH-18, SFT, origen): no vuelve a correr los detectores
+    for _ in range(3):
+        assert n.detect(acme, origin="tcp_a") == "ACME"
+        assert n.detect(ICON3, origin="tcp_b") == "ICON3"
+    assert reg.stats() == {"hits": 6, "misses": 2, "cached": 2}
+    assert n.detect(acme, origin="tcp_c") == "ACME"
+    assert reg.stats()["misses"] == 3
+
+
+def test_compact_observations_share_strings_and_point_into_text():
+    n = HL7Normalizer(registry=ParserRegistry.from_config({"entry_points": False}))
+    a, b = n.normalize(ICON3), n.normalize("".join(list(ICON3)))
+    obs_a, obs_b = a.observations[0], b.observations[0]
+    assert not hasattr(obs_a, "__dict__")
+    assert obs_a.units is obs_b.units and obs_a.text is obs_b.text
+    assert obs_a.segment == "OBX|||0^RBC||4.03|^10⁶/μL|3.85-5.78||||F"
+    assert obs_a.raw == {"segment": obs_a.segment}
+    start, end = obs_a.span
+    assert obs_a.source is not obs_b.source and obs_a.source[start:end] == obs_a.segment
+
+
+def test_observation_still_accepts_raw_keyword():
+    obs = Observation("RBC", "RBC", "4.03", "fL", raw={"segment": "OBX|1"})
+    assert obs.raw == {"segment": "OBX|1"}
+    assert Observation("RBC", "RBC", "4.03", "fL").raw == {"segment": None}
+
+
+def test_detection_cache_key_covers_fields_the_builtin_detector_reads():
+    reg = ParserRegistry.from_config({"entry_points": False})
+    msh = "MSH|^~\\&|LAB|X|||20250101||ORU^R01|1|P|2.5||||||"
+    plain = msh + "\r"
+    with_sft = msh + "\rSFT|N|1|Icon-3\r"
+    utf8 = msh + "UNICODE UTF-8\r"
+    assert reg.detect(HL7Message(plain), "tcp_a") == "FINECARE"
+    assert reg.detect(HL7Message(with_sft), "tcp_a") == "ICON3"
+    assert reg.detect(HL7Message(utf8), "tcp_a") == "ICON3"
+    assert reg.detect(HL7Message(plain), "tcp_a") == "FINECARE"
+    assert reg.stats()["misses"] == 3
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import os
+
+from app.commons.hl7_engine import HL7Engine
+from app.helpers.backlog import LEGACY_MANIFEST_NAME, MANIFEST_NAME
+from app.helpers.inbox_claim import HEARTBEAT_NAME
+from app.helpers.raw_spool import RawSpool
+from app.helpers.router import FlowRouter
+from app.services.results_service import ResultsService
+from tests.test_parsers import FINECARE
+
+
+def _service(
+    tmp_path,
+    backlog_cfg=None,
+    spool_cfg=None,
+    output_cfg=None,
+    dedupe_cfg=None,
+    claim_cfg=None,
+    metrics_cfg=None,
+):
+    paths = {k: str(tmp_path / k) for k in ("inbox", "archive", "error", "logs_root")}
+    router = FlowRouter(HL7Engine({}), {"paths": paths, "engine": {}})
+    file_cfg = {"backlog": backlog_cfg or {"concurrency": 3}, "claim": claim_cfg or {}}
+    transport = {"results": {"file": file_cfg}}
+    svc = ResultsService(
+        router,
+        transport,
+        paths,
+        spool_cfg=spool_cfg,
+        output_cfg=output_cfg,
+        dedupe_cfg=dedupe_cfg,
+        metrics_cfg=metrics_cfg,
+    )
+    return svc, paths
+
+
+def _drain(svc):
+    async def main():
+        await svc.startup()
+        await svc._process_backlog("*.hl7")
+        await svc.shutdown()
+
+    asyncio.run(main())
+
+
+def test_backlog_drain_is_parallel_and_resumable(tmp_path):
+    svc, paths = _service(tmp_path)
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    for i in range(8):
+        (inbox / f"r{i}.hl7").write_text(FINECARE, encoding="utf-8")
+    (inbox / "bad.hl7").write_text("PID|1", encoding="utf-8")
+    (inbox / "ignored.txt").write_text("x", encoding="utf-8")
+
+    _drain(svc)
+    assert sorted(p.name for p in (tmp_path / "archive" / "hl7").iterdir()) == [
+        f"r{i}.hl7" for i in range(8)
+    ]
+    # El fallido sigue en el inbox pero queda registrado en el manifiesto
+    assert (inbox / "bad.hl7").exists() and (tmp_path / "error" / "bad.hl7").exists()
+    assert (tmp_path / "logs_root" / MANIFEST_NAME).read_text().split() == ["bad.hl7"]
+
+    # Reinicio: no se vuelve a procesar lo registrado
+    (tmp_path / "error" / "bad.hl7").unlink()
+    svc2, _ = _service(tmp_path)
+    _drain(svc2)
+    assert not (tmp_path / "error" / "bad.hl7").exists()
+    assert svc2.ingest.stats()["submitted"] == 0
+
+
+def test_backlog_manifest_keeps_only_final_outcomes_outside_the_inbox(tmp_path):
+    svc, paths = _service(tmp_path)
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    (inbox / "ok.hl7").write_text(FINECARE, encoding="utf-8")
+    (inbox / "flaky.hl7").write_text(FINECARE.replace("QIAnalyzer", "Flaky"), encoding="utf-8")
+    (inbox / LEGACY_MANIFEST_NAME).write_text("old.hl7\n", encoding="utf-8")
+    (inbox / "old.hl7").write_text("PID|1", encoding="utf-8")
+
+    transform = svc.router.transform_hl7_result
+
+    def failing(msg, *args, **kwargs):
+        if "Flaky" in msg.text:
+            raise RuntimeError("disco lleno")  # AE: transitorio
+        return transform(msg, *args, **kwargs)
+
+    svc.router.transform_hl7_result = failing
+
+    async def main():
+        await svc.startup()
+        await svc._process_backlog("*")
+        await svc.shutdown()
+
+    asyncio.run(main())
+    # El manifiesto viejo se migró fuera del inbox y no se procesó como HL7
+    assert not (inbox / LEGACY_MANIFEST_NAME).exists()
+    assert not (tmp_path / "error" / LEGACY_MANIFEST_NAME).exists()
+    assert svc.ingest.stats()["submitted"] == 2
+    # El AE queda fuera del manifiesto: se reintenta en el próximo arranque
+    assert (tmp_path / "logs_root" / MANIFEST_NAME).read_text().split() == ["old.hl7"]
+    assert (inbox / "flaky.hl7").exists()
+
+
+def test_watcher_deliveries_record_final_outcomes_in_manifest(tmp_path):
+    svc, _ = _service(tmp_path)
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    bad = inbox / "bad.hl7"
+    bad.write_text("PID|1", encoding="utf-8")
+
+    async def main():
+        await svc.startup()
+        fut = await svc._submit_file(bad.read_text(encoding="utf-8"), str(bad))
+        assert await fut == "AR"
+        await svc.shutdown()
+
+    asyncio.run(main())
+    # El rechazado sigue en el inbox: el próximo arranque no lo reprocesa
+    assert bad.exists()
+    assert (tmp_path / "logs_root" / MANIFEST_NAME).read_text().split() == ["bad.hl7"]
+
+
+def test_spool_records_left_unprocessed_are_replayed_on_startup(tmp_path):
+    spool_dir = tmp_path / "spool"
+
+    async def crashed_before_processing():
+        spool = RawSpool(spool_dir)
+        spool.open()
+        await spool.append(FINECARE, src="tcp_a")
+        await spool.append(FINECARE, src="tcp_b")
+        await spool.aclose()
+
+    asyncio.run(crashed_before_processing())
+
+    svc, _ = _service(tmp_path, spool_cfg={"enabled": True, "dir": str(spool_dir)})
+
+    async def main():
+        await svc.startup()
+        await svc.shutdown()
+
+    asyncio.run(main())
+    assert len(list((tmp_path / "archive").glob("*.json"))) == 2
+    assert RawSpool(spool_dir).open() == 0
+
+
+def test_ndjson_output_writes_lines_instead_of_files(tmp_path):
+    svc, _ = _service(tmp_path, output_cfg={"format": "ndjson"})
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    for i in range(5):
+        (inbox / f"r{i}.hl7").write_text(FINECARE, encoding="utf-8")
+
+    _drain(svc)
+    assert not list((tmp_path / "archive").glob("*.json"))
+    (segment,) = (tmp_path / "archive" / "ndjson").glob("*.ndjson")
+    lines = segment.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 5 and all("\n" not in line for line in lines)
+    assert json.loads(lines[0])["patient"]["sex"] == "M"
+
+
+def test_duplicates_are_acked_without_reprocessing(tmp_path):
+    async def run(svc, texts):
+        await svc.startup()
+        codes = await asyncio.gather(*(svc._process_text(t, "tcp_a") for t in texts))
+        await svc.shutdown()
+        return codes, svc.stats()["dedupe"]
+
+    other = FINECARE.replace("QIAnalyzer", "QIAnalyzer2")
+    svc, _ = _service(tmp_path, dedupe_cfg={"enabled": True})
+    codes, stats = asyncio.run(run(svc, [FINECARE, FINECARE, other, "PID|1", "PID|1"]))
+    assert codes == ["AA", "AA", "AA", "AR", "AR"]
+    # Un duplicado que llega con el original en vuelo espera su ACK
+    assert stats["inflight_hits"] >= 1 and stats["hits"] + stats["inflight_hits"] == 2
+    assert stats["misses"] == 3
+    assert len(list((tmp_path / "archive").glob("*.json"))) == 2
+
+    # Tras reiniciar, el store persistente sigue reconociendo el reenvío
+    svc2, _ = _service(tmp_path, dedupe_cfg={"enabled": True})
+    codes, stats = asyncio.run(run(svc2, [FINECARE]))
+    assert codes == ["AA"] and stats["hits"] == 1
+    assert len(list((tmp_path / "archive").glob("*.json"))) == 2
+
+
+def test_duplicate_files_leave_the_inbox_like_their_original(tmp_path):
+    svc, _ = _service(tmp_path, dedupe_cfg={"enabled": True})
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    for name in ("ok1.hl7", "ok2.hl7"):
+        (inbox / name).write_text(FINECARE, encoding="utf-8")
+    for name in ("bad1.hl7", "bad2.hl7"):
+        (inbox / name).write_text("PID|1", encoding="utf-8")
+
+    _drain(svc)
+    assert sorted(p.name for p in (tmp_path / "archive" / "hl7").iterdir()) == [
+        "ok1.hl7",
+        "ok2.hl7",
+    ]
+    # El rechazado original queda en el inbox (manifiesto); su duplicado sale a error/
+    assert sorted(p.name for p in (tmp_path / "error").iterdir()) == ["bad1.hl7", "bad2.hl7"]
+    assert len(list(inbox.glob("*.hl7"))) == 1
+    assert svc.stats()["dedupe"]["hits"] + svc.stats()["dedupe"]["inflight_hits"] == 2
+
+
+def test_workers_share_inbox_by_claiming_and_recover_orphans(tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    for i in range(20):
+        (inbox / f"r{i}.hl7").write_text(FINECARE.replace("|688|", f"|{i}|"), encoding="utf-8")
+    (inbox / "bad.hl7").write_text("PID|1", encoding="utf-8")
+    # Worker caído de otro host: latido viejo y un archivo a medio procesar
+    dead = tmp_path / "processing" / "otrohost-4242"
+    dead.mkdir(parents=True)
+    (dead / HEARTBEAT_NAME).write_text("0\n")
+    os.utime(dead / HEARTBEAT_NAME, (0, 0))
+    (dead / "orphan.hl7").write_text(FINECARE, encoding="utf-8")
+
+    workers = [
+        _service(tmp_path, claim_cfg={"enabled": True, "worker_id": f"w{n}"})[0] for n in range(2)
+    ]
+
+    async def main():
+        for svc in workers:
+            await svc.startup()  # el primero devuelve el huérfano al inbox
+        await asyncio.gather(*(svc._process_backlog("*.hl7") for svc in workers))
+        for svc in workers:
+            await svc.shutdown()
+
+    asyncio.run(main())
+    claimed = [svc.stats()["claims"] for svc in workers]
+    assert sum(c["claimed"] for c in claimed) == 22 and sum(c["recovered"] for c in claimed) == 1
+    assert len(list((tmp_path / "archive").glob("*.json"))) == 21
+    assert len(list((tmp_path / "archive" / "hl7").iterdir())) == 21
+    assert [p.name for p in (tmp_path / "error").iterdir()] == ["bad.hl7"]
+    assert not list(inbox.glob("*.hl7"))
+    assert not list((tmp_path / "processing").iterdir())
+
+
+def test_metrics_record_stages_results_and_snapshot(tmp_path):
+    snapshot = tmp_path / "logs_root" / "metrics.json"
+    svc, _ = _service(
+        tmp_path, metrics_cfg={"enabled": True, "snapshot_path": str(snapshot), "snapshot_sec": 60}
+    )
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    for i in range(3):
+        (inbox / f"r{i}.hl7").write_text(FINECARE, encoding="utf-8")
+    (inbox / "bad.hl7").write_text("PID|1", encoding="utf-8")
+
+    _drain(svc)
+    text = svc.metrics.render()
+    for stage in ("frame", "archive", "validate", "detect", "parse", "serialize", "write"):
+        assert f'lab_integrator_stage_seconds_count{{stage="{stage}"}}' in text
+    assert 'lab_integrator_stage_seconds_count{stage="total"} 4' in text
+    assert 'lab_integrator_results_total{analyzer="QIAnalyzer",code="AA"} 3' in text
+    assert 'lab_integrator_results_total{analyzer="unknown",code="AR"} 1' in text
+    assert 'lab_integrator_errors_total{kind="ValidationError",stage="validate"} 1' in text
+    assert 'lab_integrator_queue_depth{queue="ingest"} 0' in text
+
+    # Al apagar se escribe el último snapshot con los totales
+    data = json.loads(snapshot.read_text(encoding="utf-8"))
+    assert data["stats"]["ingest"]["processed"] == 4
+    assert data["metrics"]["counters"]["results_total"]["analyzer=QIAnalyzer,code=AA"] == 3
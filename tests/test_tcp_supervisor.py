@@ -0,0 +1,76 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from app.helpers.tcp_transport import CR, FS, VT, TcpServer
+from app.services.tcp_supervisor import (
+    TcpSupervisor,
+    reuse_port_supported,
+    worker_settings,
+)
+
+needs_reuse_port = pytest.mark.skipif(not reuse_port_supported(), reason="sin SO_REUSEPORT")
+
+
+def _crashing_worker(cfg, index, stats_q, stats_sec):
+    # Reporta y cae enseguida: el supervisor debe reiniciarlo con el mismo índice
+    stats_q.put((index, os.getpid(), {"tcp": {"messages": index + 1}, "name": "x"}))
+    time.sleep(0.05)
+    sys.exit(3)
+
+
+def test_worker_settings_give_each_worker_its_own_writers(tmp_path):
+    cfg = {
+        "paths": {"logs_root": str(tmp_path / "logs"), "archive": str(tmp_path / "archive")},
+        "spool": {"enabled": True, "dir": str(tmp_path / "spool")},
+        "output": None,
+        "dedupe": {"store": str(tmp_path / "d.jsonl")},
+    }
+    w1 = worker_settings(cfg, 1)
+    assert w1["spool"]["dir"] == str(tmp_path / "spool" / "w1")
+    assert w1["output"]["ndjson"]["prefix"] == "results-w1"
+    assert w1["histograms"]["sidecar_dir"] == str(tmp_path / "archive" / "histograms" / "w1")
+    assert w1["dedupe"]["store"] == str(tmp_path / "d-w1.jsonl")
+    assert cfg["spool"]["dir"] == str(tmp_path / "spool")  # el original no cambia
+
+
+@needs_reuse_port
+def test_servers_share_port_with_reuse_port():
+    async def on_message(msg, peer):
+        return "AA"
+
+    async def main():
+        first = TcpServer("127.0.0.1", 0, on_message, reuse_port=True)
+        port = (await first.listen()).sockets[0].getsockname()[1]
+        second = TcpServer("127.0.0.1", port, on_message, reuse_port=True)
+        await second.listen()
+        for _ in range(8):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(VT + b"MSH|^~\\&|A|B|C|D|1||ORU^R01|1|P|2.5\r" + FS + CR)
+            await writer.drain()
+            assert b"MSA|AA|1" in await reader.readuntil(FS + CR)
+            writer.close()
+            await writer.wait_closed()
+        await asyncio.sleep(0.05)
+        return first.stats()["messages"] + second.stats()["messages"]
+
+    assert asyncio.run(main()) == 8
+
+
+def test_supervisor_restarts_crashed_workers_and_aggregates_stats():
+    sup = TcpSupervisor({}, workers=2, stats_sec=0.1, target=_crashing_worker)
+    sup.start()
+    try:
+        deadline = time.monotonic() + 20
+        while sup.restarts < 2 and time.monotonic() < deadline:
+            sup.poll()
+            time.sleep(0.05)
+    finally:
+        sup.stop()
+    stats = sup.stats()
+    assert stats["restarts"] >= 2
+    assert stats["total"] == {"tcp": {"messages": 3}}
+    assert sorted(stats["per_worker"]) == [0, 1]
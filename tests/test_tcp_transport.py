@@ -0,0 +1,169 @@
+import asyncio
+import socket
+import struct
+
+from app.commons.hl7_ack import build_ack
+from app.commons.hl7_message import HL7Message
+from app.helpers.tcp_transport import (
+    CR,
+    FS,
+    VT,
+    MllpAckError,
+    MllpFramer,
+    TcpSender,
+    TcpServer,
+    read_mllp_messages,
+)
+
+
+def _msg(ctrl: str) -> str:
+    return f"MSH|^~\\&|Icon-3|LAB|LIS|HOSP|20250101||ORU^R01|{ctrl}|P|2.5\rPID|1\r"
+
+
+def test_build_ack_swaps_apps_and_echoes_control_id():
+    ack = HL7Message(build_ack(_msg("C1"), "AE", "bad|value"))
+    assert ack.get("MSH-3") == "LIS" and ack.get("MSH-5") == "Icon-3"
+    assert ack.get("MSH-9") == "ACK^R01^ACK"
+    assert ack.first_fields("MSA") == ["MSA", "AE", "C1", "bad\\F\\value"]
+
+
+def test_acks_are_sent_in_order_while_processing_overlaps():
+    async def on_message(msg, peer):
+        # El primero tarda más: su ACK igual debe salir primero
+        await asyncio.sleep(0.05 if msg.control_id == "C0" else 0)
+        return "AR" if msg.control_id == "C2" else "AA"
+
+    async def main():
+        server = TcpServer("127.0.0.1", 0, on_message, pipeline_depth=4)
+        srv = await server.listen()
+        port = srv.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"".join(VT + _msg(f"C{i}").encode() + FS + CR for i in range(3)))
+        await writer.drain()
+        acks = []
+        async for frame in read_mllp_messages(reader):
+            acks.append(HL7Message(frame).first_fields("MSA")[1:3])
+            if len(acks) == 3:
+                break
+        writer.close()
+        srv.close()
+        await srv.wait_closed()
+        return acks
+
+    assert asyncio.run(main()) == [["AA", "C0"], ["AA", "C1"], ["AR", "C2"]]
+
+
+def test_late_ack_of_expired_send_is_not_applied_to_the_next_one():
+    async def handle(reader, writer):
+        async for text in read_mllp_messages(reader):
+            msg = HL7Message(text)
+            if msg.control_id == "A":
+                await asyncio.sleep(0.3)  # el emisor ya dio A por vencido
+                ack = build_ack(msg, "AE")
+            else:
+                ack = build_ack(msg, "AA")
+            writer.write(VT + ack.encode("utf-8") + FS + CR)
+            await writer.drain()
+
+    async def main():
+        srv = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = srv.sockets[0].getsockname()[1]
+        sender = TcpSender("127.0.0.1", port, pool_size=1, ack_timeout=0.1)
+        try:
+            await sender.send(_msg("A"))
+            first = "sin timeout"
+        except asyncio.TimeoutError:
+            first = "timeout"
+        sender.ack_timeout = 5  # B espera detrás del AE tardío de A
+        second = await sender.send(_msg("B"))
+        stats = sender.stats()
+        await sender.close()
+        srv.close()
+        await srv.wait_closed()
+        return first, second, stats
+
+    first, second, stats = asyncio.run(main())
+    assert first == "timeout" and second == "AA" and stats["unmatched_acks"] == 1
+    assert str(MllpAckError("AE", None, "B")) == "ACK AE para B"
+
+
+def test_framer_handles_fragments_junk_and_oversize():
+    errors = []
+    framer = MllpFramer(max_frame=64, on_error=errors.append)
+    stream = b"\r\n" + VT + b"MSH|A" + FS + CR + b"junk!" + VT + b"X" * 100 + FS + CR
+    stream += VT + b"MSH|" + "Ñ".encode() + FS + CR + VT + b"MSH|partial"
+    out = []
+    for i in range(0, len(stream), 3):
+        out.extend(framer.feed(stream[i : i + 3]))
+    framer.close()
+    assert out == ["MSH|A", "MSH|Ñ"]
+    assert [e.kind for e in errors] == ["junk", "oversize", "truncated"]
+
+
+def test_framer_resyncs_on_vt_inside_frame():
+    errors = []
+    framer = MllpFramer(on_error=errors.append)
+    out = framer.feed(VT + b"MSH|lost" + VT + b"MSH|ok" + FS + CR)
+    assert out == ["MSH|ok"] and errors[0].kind == "truncated"
+
+
+def test_connection_reset_by_analyzer_is_handled():
+    async def on_message(msg, peer):
+        await asyncio.sleep(0.05)  # el RST llega con el mensaje aún en proceso
+        return "AA"
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        errors = []
+        loop.set_exception_handler(lambda _loop, ctx: errors.append(ctx))
+        server = TcpServer("127.0.0.1", 0, on_message)
+        srv = await server.listen()
+        port = srv.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(VT + _msg("R1").encode() + FS + CR)
+        await writer.drain()
+        await asyncio.sleep(0.01)
+        # SO_LINGER 0: close() envía RST en vez de FIN
+        sock = writer.get_extra_info("socket")
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        writer.transport.abort()
+        await asyncio.sleep(0.2)
+        srv.close()
+        await srv.wait_closed()
+        return errors, server.stats()
+
+    errors, stats = asyncio.run(main())
+    assert errors == [] and stats["messages"] == 1 and stats["active"] == 0
+
+
+def test_pooled_sender_matches_acks_and_reconnects():
+    async def on_message(msg, peer):
+        await asyncio.sleep(0.02 if msg.control_id == "O0" else 0)
+        return "AE" if msg.control_id == "BAD" else "AA"
+
+    async def main():
+        server = TcpServer("127.0.0.1", 0, on_message, pipeline_depth=8)
+        srv = await server.listen()
+        port = srv.sockets[0].getsockname()[1]
+        sender = TcpSender("127.0.0.1", port, pool_size=2, max_in_flight=4)
+        codes = await asyncio.gather(*(sender.send(_msg(f"O{i}")) for i in range(10)))
+        connects = sender.connects
+        try:
+            await sender.send(_msg("BAD"))
+            nack = None
+        except MllpAckError as ex:
+            nack = ex.code
+        # El receptor corta las conexiones: el siguiente envío reconecta solo
+        for conn in sender._conns:
+            conn.writer.transport.abort()
+        await asyncio.sleep(0.05)
+        after = await sender.send(_msg("O10"))
+        stats = sender.stats()
+        await sender.close()
+        srv.close()
+        await srv.wait_closed()
+        return codes, connects, nack, after, stats
+
+    codes, connects, nack, after, stats = asyncio.run(main())
+    assert codes == ["AA"] * 10 and connects == 2
+    assert nack == "AE" and after == "AA" and stats["connects"] == 3
@@ -0,0 +1,54 @@
+import asyncio
+import socket
+
+from app.helpers.tcp_transport import CR, FS, VT
+from app.helpers.udp_transport import UdpServer
+from tests.test_parsers import FINECARE
+
+
+async def _collect(datagrams, expected, extra_peer=(), **kwargs):
+    got = []
+    done = asyncio.Event()
+
+    async def on_message(text, peer):
+        got.append(text)
+        if len(got) == expected:
+            done.set()
+
+    server = UdpServer("127.0.0.1", 0, on_message, idle_flush=0.05, **kwargs)
+    transport = await server.listen()
+    addr = transport.get_extra_info("sockname")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for d in datagrams:
+        sock.sendto(d, addr)
+    other = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for d in extra_peer:
+        other.sendto(d, addr)
+    await asyncio.wait_for(done.wait(), 2)
+    await asyncio.sleep(0.1)  # flush por inactividad del otro peer
+    sock.close()
+    other.close()
+    server.close()
+    return got, server
+
+
+def test_udp_reassembles_unframed_messages_split_across_datagrams():
+    data = FINECARE.encode()
+    half = len(data) // 2
+    got, server = asyncio.run(_collect([data[:half], data[half:], data], 2))
+    assert got == [FINECARE, FINECARE]
+    assert server.stats()["reassembled"] == 1
+
+
+def test_udp_mllp_frames_and_astm_goes_only_to_spool():
+    framed = VT + FINECARE.encode() + FS + CR
+    raw = []
+
+    async def on_raw(text, peer, fmt):
+        raw.append(fmt)
+
+    got, server = asyncio.run(
+        _collect([framed[:10], framed[10:]], 1, [b"H|\\^&|||ASTM"], on_raw_async=on_raw)
+    )
+    assert got == [FINECARE]
+    assert server.stats()["unsupported"] == 1 and sorted(raw) == ["ASTM", "HL7"]
@@ -0,0 +1,65 @@
+import base64
+
+import pytest
+from pydantic import ValidationError
+
+from app.commons.hl7_engine import HL7Engine
+from app.commons.hl7_message import HL7Message
+from app.validation.validators import (
+    RuleValidator,
+    ValidationRules,
+    build_validation_model,
+    validate_hl7_message_or_raise,
+)
+
+HIST = base64.b64encode(bytes(256)).decode()
+SHORT = base64.b64encode(bytes(10)).decode()
+
+
+def _msg(msh9="ORU^R01", hist=HIST, pid=True) -> str:
+    lines = [f"MSH|^~\\&|Icon-3|NI30H24105|LIS Application|LIS|20250821100844||{msh9}|1|P|2.5"]
+    if pid:
+        lines.append("PID|1||DOC123")
+    lines.append(f"OBX|1|ED|RBCHistogram^RBCHistogram||{hist}||||||F")
+    return "\r".join(lines)
+
+
+def test_fast_path_matches_model_errors():
+    validate_hl7_message_or_raise(_msg())
+    build_validation_model(_msg())
+
+    for bad, expected in ((_msg(msh9=""), "MSH-9 es obligatorio"), (_msg(hist=SHORT), "256")):
+        with pytest.raises(ValidationError) as fast:
+            validate_hl7_message_or_raise(bad)
+        with pytest.raises(ValidationError) as full:
+            build_validation_model(bad)
+        assert expected in str(fast.value)
+        assert str(fast.value) == str(full.value)
+
+    # Regla deshabilitada: el mensaje pasa por ambos caminos
+    relaxed = ValidationRules(histogram_256=False)
+    validate_hl7_message_or_raise(_msg(hist=SHORT), relaxed)
+    build_validation_model(_msg(hist=SHORT), relaxed)
+
+
+def test_rules_per_analyzer_from_config():
+    validator = RuleValidator.from_config(
+        {
+            "strict_histogram_256": False,
+            "analyzers": {"icon3": {"message_types": ["ORU^R01"], "required_segments": ["PID"]}},
+        }
+    )
+    assert validator.per_analyzer
+    validator.check(_msg(hist=SHORT))  # reglas generales: histograma no estricto
+    validator.check(_msg(msh9="ORU^R01^ORU_R01"), "ICON3")
+
+    with pytest.raises(ValidationError, match="no permitido"):
+        validator.check(_msg(msh9="ORM^O01"), "ICON3")
+    with pytest.raises(ValidationError, match="Faltan segmentos obligatorios: PID"):
+        validator.check(_msg(pid=False), "ICON3")
+
+    # El motor detecta el perfil (Icon-3) antes de aplicar las reglas por analizador
+    engine = HL7Engine({}, validation_cfg={"analyzers": {"ICON3": {"required_segments": ["PID"]}}})
+    engine.validate(HL7Message(_msg()))
+    with pytest.raises(ValidationError):
+        engine.validate(HL7Message(_msg(pid=False)))